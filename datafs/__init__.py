@@ -3,18 +3,41 @@
 '''
 
 from __future__ import absolute_import
-from datafs.core.data_api import DataAPI
-from datafs.config.helpers import get_api, to_config_file
+
+import sys
+import importlib
 
 __author__ = """Climate Impact Lab"""
 __email__ = 'jsimcock@rhg.com'
 __version__ = '0.7.1'
 
 
-_module_imports = (
-    DataAPI,
-    get_api,
-    to_config_file
-)
+# Public names and the modules which define them. On python 3.7+ these are
+# imported on first access, so that the command line interface can start
+# without importing pyfilesystem, yaml or the managers.
+_module_imports = {
+    'DataAPI': 'datafs.core.data_api',
+    'get_api': 'datafs.config.helpers',
+    'to_config_file': 'datafs.config.helpers'}
+
+__all__ = ['DataAPI', 'get_api', 'to_config_file']
+
+
+if sys.version_info >= (3, 7):
+
+    def __getattr__(name):
+        if name not in _module_imports:
+            raise AttributeError(
+                "module 'datafs' has no attribute '{}'".format(name))
+
+        value = getattr(importlib.import_module(_module_imports[name]), name)
+        globals()[name] = value
+
+        return value
+
+    def __dir__():
+        return sorted(set(globals().keys()) | set(__all__))
 
-__all__ = list(map(lambda x: x.__name__, _module_imports))
+else:
+    from datafs.core.data_api import DataAPI
+    from datafs.config.helpers import get_api, to_config_file
@@ -6,11 +6,16 @@ try:
     string_types = (unicode, str)
     from StringIO import StringIO
 
+    # python 2 memory maps only support the old buffer interface
+    read_only_buffer = buffer
+
 except NameError:
     u = str
     string_types = (str,)
     from io import StringIO
 
+    read_only_buffer = memoryview
+
 
 @contextmanager
 def open_filelike(filelike, mode='r'):
@@ -25,4 +30,4 @@ def open_filelike(filelike, mode='r'):
 
 __all__ = (
     list(map(lambda x: x.__name__, [StringIO, open_filelike])) +
-    ['u', 'string_types'])
+    ['u', 'string_types', 'read_only_buffer'])
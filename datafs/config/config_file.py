@@ -1,7 +1,6 @@
 
 from __future__ import absolute_import
 from datafs._compat import open_filelike
-import yaml
 import os
 import click
 
@@ -47,6 +46,8 @@ class ConfigFile(object):
 
     def read_config(self):
 
+        import yaml
+
         with open_filelike(self.config_file, 'r') as f:
             config = yaml.load(f)
 
@@ -61,6 +62,8 @@ class ConfigFile(object):
         if fp is None:
             fp = os.path.join(click.get_app_dir('datafs'), 'config.yml')
 
+        import yaml
+
         with open_filelike(fp, 'w+') as f:
             f.write(yaml.dump(self.config))
 
@@ -97,6 +100,30 @@ class ConfigFile(object):
             profile_config['api']['user_config'][kw] = profile_config[
                 'api']['user_config'].get(kw, api.user_config[kw])
 
+        if api.hash_algorithm != api.DefaultHashAlgorithm:
+            profile_config['api']['hash_algorithm'] = profile_config[
+                'api'].get('hash_algorithm', api.hash_algorithm)
+
+        if api.hash_chunk_size is not None:
+            profile_config['api']['hash_chunk_size'] = profile_config[
+                'api'].get('hash_chunk_size', api.hash_chunk_size)
+
+        if api.compression is not None:
+            profile_config['api']['compression'] = profile_config[
+                'api'].get('compression', api.compression)
+
+        if api.content_addressed:
+            profile_config['api']['content_addressed'] = profile_config[
+                'api'].get('content_addressed', True)
+
+        if api.chunked_storage:
+            profile_config['api']['chunked_storage'] = profile_config[
+                'api'].get('chunked_storage', True)
+
+        if api.write_behind:
+            profile_config['api']['write_behind'] = profile_config[
+                'api'].get('write_behind', api.write_behind_options or True)
+
         manager_cfg = {
             'class': api.manager.__class__.__name__,
             'args': [],
@@ -112,7 +139,8 @@ class ConfigFile(object):
         for service_name, service in api._authorities.items():
 
             authorities_cfg[service_name] = {
-                'service': service.fs.__class__.__name__,
+                'service': getattr(
+                    service.fs, 'wrapped_class', type(service.fs)).__name__,
                 'args': [],
                 'kwargs': {}
             }
@@ -121,18 +149,27 @@ class ConfigFile(object):
                 authorities_cfg[service_name]['args'] = [
                     service.fs.getsyspath('/')]
 
+            if service.transfer_options:
+                authorities_cfg[service_name]['transfer'] = (
+                    service.transfer_options)
+
         for service_name in authorities_cfg.keys():
             if service_name not in profile_config['authorities']:
                 profile_config['authorities'][service_name] = {}
 
-            for kw in ['service', 'args', 'kwargs']:
+            for kw in ['service', 'args', 'kwargs', 'transfer']:
+                if kw not in authorities_cfg[service_name]:
+                    continue
+
                 profile_config['authorities'][service_name][kw] = \
                     profile_config['authorities'][service_name].get(
                         kw, authorities_cfg[service_name][kw])
 
         if api.cache:
             cache_cfg = {
-                'service': api.cache.fs.__class__.__name__,
+                'service': getattr(
+                    api.cache.fs, 'wrapped_class',
+                    type(api.cache.fs)).__name__,
                 'args': [],
                 'kwargs': {}
             }
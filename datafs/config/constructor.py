@@ -1,8 +1,24 @@
 
-from datafs import DataAPI
 import importlib
-import fs
-import pkgutil
+
+from datafs.services.lazy import LazyFS
+
+
+# pyFilesystem services and the modules defining them. Known services are
+# looked up here rather than by scanning the fs package, and their modules are
+# only imported when a service is created.
+_SERVICES = {
+    'FTPFS': 'fs.ftpfs',
+    'HTTPFS': 'fs.httpfs',
+    'MemoryFS': 'fs.memoryfs',
+    'MountFS': 'fs.mountfs',
+    'MultiFS': 'fs.multifs',
+    'OSFS': 'fs.osfs',
+    'RPCFS': 'fs.rpcfs',
+    'S3FS': 'fs.s3fs',
+    'SFTPFS': 'fs.sftpfs',
+    'TempFS': 'fs.tempfs',
+    'ZipFS': 'fs.zipfs'}
 
 
 class APIConstructor(object):
@@ -10,12 +26,29 @@ class APIConstructor(object):
     @staticmethod
     def generate_api_from_config(config):
 
+        from datafs.core.data_api import DataAPI
+
         for kw in ['user_config']:
             if kw not in config['api']:
                 config['api'][kw] = {}
 
         api = DataAPI(**config['api']['user_config'])
 
+        if config['api'].get('hash_algorithm') is not None:
+            api.hash_algorithm = config['api']['hash_algorithm']
+
+        if config['api'].get('hash_chunk_size') is not None:
+            api.hash_chunk_size = int(config['api']['hash_chunk_size'])
+
+        if config['api'].get('compression') is not None:
+            api.compression = config['api']['compression']
+
+        if config['api'].get('content_addressed'):
+            api.content_addressed = True
+
+        if config['api'].get('chunked_storage'):
+            api.chunked_storage = True
+
         return api
 
     @classmethod
@@ -32,16 +65,30 @@ class APIConstructor(object):
         for service_name, service_config in config.get(
                 'authorities', {}).items():
 
-            service = cls._generate_service(service_config)
-            api.attach_authority(service_name, service)
+            service = cls._generate_service(service_config, lazy=True)
+            api.attach_authority(
+                service_name, service, **service_config.get('transfer', {}))
 
     @classmethod
     def attach_cache_from_config(cls, api, config):
 
         if len(config.get('cache', {})) > 0:
 
-            service = cls._generate_service(config['cache'])
-            api.attach_cache(service)
+            service = cls._generate_service(config['cache'], lazy=True)
+            api.attach_cache(service, **config['cache'].get('transfer', {}))
+
+    @classmethod
+    def enable_write_behind_from_config(cls, api, config):
+
+        write_behind = config.get('api', {}).get('write_behind')
+
+        if not write_behind:
+            return
+
+        if not hasattr(write_behind, 'items'):
+            write_behind = {}
+
+        api.enable_write_behind(**write_behind)
 
     @staticmethod
     def _generate_manager(manager_config):
@@ -121,8 +168,8 @@ class APIConstructor(object):
 
         return manager
 
-    @staticmethod
-    def _generate_service(service_config):
+    @classmethod
+    def _generate_service(cls, service_config, lazy=False):
         '''
         Generate a service from a service_config dictionary
 
@@ -134,6 +181,11 @@ class APIConstructor(object):
             kwargs used to generate a new fs service
             object
 
+        lazy : bool
+            Return a :py:class:`~datafs.services.lazy.LazyFS` proxy which
+            creates the service on first use (default False). The service's
+            name is still checked immediately.
+
         Returns
         -------
 
@@ -202,23 +254,47 @@ class APIConstructor(object):
 
         '''
 
+        service_name = service_config['service']
+        svc_module_name = _SERVICES.get(service_name)
+
+        if svc_module_name is None:
+            svc_module_name = cls._find_service(service_name)
+
+        def get_class():
+            svc_module = importlib.import_module(svc_module_name)
+            return svc_module.__dict__[service_name]
+
+        if lazy:
+            return LazyFS(
+                get_class,
+                service_config.get('args', []),
+                service_config.get('kwargs', {}))
+
+        service = get_class()(*service_config.get('args', []),
+                              **service_config.get('kwargs', {}))
+
+        return service
+
+    @staticmethod
+    def _find_service(service_name):
+        '''
+        Find the module of a service missing from the registry of services
+        '''
+
+        import fs
+        import pkgutil
+
         filesystems = []
 
         for _, modname, _ in pkgutil.iter_modules(fs.__path__):
             if modname.endswith('fs'):
                 filesystems.append(modname)
 
-        service_mod_name = service_config['service'].lower()
+        service_mod_name = service_name.lower()
 
         assert_msg = 'Filesystem "{}" not found in pyFilesystem {}'.format(
             service_mod_name, fs.__version__)
 
         assert service_mod_name in filesystems, assert_msg
 
-        svc_module = importlib.import_module('fs.{}'.format(service_mod_name))
-        svc_class = svc_module.__dict__[service_config['service']]
-
-        service = svc_class(*service_config.get('args', []),
-                            **service_config.get('kwargs', {}))
-
-        return service
+        return 'fs.{}'.format(service_mod_name)
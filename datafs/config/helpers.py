@@ -14,7 +14,7 @@ def _parse_requirement(requirement_line):
     # doesn't split, the entire thing gets passed to api.create
     # or get_archive as the archive_name.
 
-    version_stmt = map(lambda s: s.strip(), requirement_line.split('=='))
+    version_stmt = [s.strip() for s in requirement_line.split('==')]
 
     if len(version_stmt) == 1:
         return version_stmt[0], None
@@ -22,6 +22,43 @@ def _parse_requirement(requirement_line):
         return version_stmt[0], version_stmt[1]
 
 
+def _get_default_versions(config, requirements=None):
+    '''
+    Read the default versions from a requirements file or string
+
+    If ``requirements`` is not given, the config file's requirements are
+    used, or ``requirements_data.txt`` in the working directory if it exists.
+    '''
+
+    default_versions = {}
+
+    if requirements is None:
+        requirements = config.config.get('requirements', None)
+
+    if requirements is not None and not os.path.isfile(requirements):
+        for reqline in re.split(r'[\r\n;]+', requirements):
+            if re.search(r'^\s*$', reqline):
+                continue
+
+            archive, version = _parse_requirement(reqline)
+            default_versions[archive] = version
+
+    else:
+        if requirements is None:
+            requirements = 'requirements_data.txt'
+
+        if os.path.isfile(requirements):
+            with open_filelike(requirements, 'r') as reqfile:
+                for reqline in reqfile.readlines():
+                    if re.search(r'^\s*$', reqline):
+                        continue
+
+                    archive, version = _parse_requirement(reqline)
+                    default_versions[archive] = version
+
+    return default_versions
+
+
 def get_api(
         profile=None,
         config_file=None,
@@ -119,31 +156,7 @@ def get_api(
 
     profile_config = config.get_profile_config(profile)
 
-    default_versions = {}
-
-    if requirements is None:
-        requirements = config.config.get('requirements', None)
-
-    if requirements is not None and not os.path.isfile(requirements):
-        for reqline in re.split(r'[\r\n;]+', requirements):
-            if re.search(r'^\s*$', reqline):
-                continue
-
-            archive, version = _parse_requirement(reqline)
-            default_versions[archive] = version
-
-    else:
-        if requirements is None:
-            requirements = 'requirements_data.txt'
-
-        if os.path.isfile(requirements):
-            with open_filelike(requirements, 'r') as reqfile:
-                for reqline in reqfile.readlines():
-                    if re.search(r'^\s*$', reqline):
-                        continue
-
-                    archive, version = _parse_requirement(reqline)
-                    default_versions[archive] = version
+    default_versions = _get_default_versions(config, requirements)
 
     api = APIConstructor.generate_api_from_config(profile_config)
     api.default_versions = default_versions
@@ -151,6 +164,7 @@ def get_api(
     APIConstructor.attach_manager_from_config(api, profile_config)
     APIConstructor.attach_services_from_config(api, profile_config)
     APIConstructor.attach_cache_from_config(api, profile_config)
+    APIConstructor.enable_write_behind_from_config(api, profile_config)
 
     return api
 
@@ -0,0 +1,181 @@
+'''
+Content-defined chunking for delta storage of archive versions
+
+Files are split at positions chosen by a rolling hash of their contents, so
+an edit only changes the chunks around it: data before and after the edit is
+cut at the same boundaries as before. When chunks are stored
+content-addressed, a new version only needs to store the chunks that changed.
+
+Cut points are found with the compiled FastCDC implementation of the optional
+`fastcdc <https://pypi.python.org/pypi/fastcdc>`_ package, which reads files
+through a memory map. Without it (or without its compiled extension),
+:py:func:`available` returns ``False`` and new versions are stored as whole
+files. Chunked versions can be read without ``fastcdc``.
+'''
+
+from __future__ import absolute_import
+
+import io
+import os
+
+try:
+    # the package's pure python fallback is too slow for large files
+    from fastcdc.fastcdc_cy import fastcdc_cy as _fastcdc
+except ImportError:
+    _fastcdc = None
+
+
+MIN_SIZE = 256 * 1024
+AVG_SIZE = 1024 * 1024
+MAX_SIZE = 4 * 1024 * 1024
+
+
+def available():
+    '''
+    Whether content-defined chunking is available in this environment
+    '''
+
+    return _fastcdc is not None
+
+
+def iter_chunks(
+        data,
+        min_size=MIN_SIZE,
+        avg_size=AVG_SIZE,
+        max_size=MAX_SIZE):
+    '''
+    Split a file or bytes into content-defined chunks
+
+    Parameters
+    ----------
+
+    data: str or bytes or file-like
+        Path of the file to split, the data itself, or a binary file object
+        backed by a file descriptor. Files are memory-mapped rather than
+        read into memory.
+
+    min_size: int
+        Minimum chunk size in bytes (except for the final chunk)
+
+    avg_size: int
+        Expected chunk size in bytes
+
+    max_size: int
+        Maximum chunk size in bytes
+
+    Yields
+    ------
+    chunk: bytes
+
+    Examples
+    --------
+
+    .. code-block:: python
+
+        >>> import random
+        >>> rand = random.Random(0)
+        >>> data = bytes(bytearray(rand.getrandbits(8) for _ in range(20000)))
+        >>>
+        >>> def split(data):
+        ...     return list(iter_chunks(
+        ...         data, min_size=64, avg_size=512, max_size=4096))
+        ...
+        >>> chunks = split(data)  # doctest: +SKIP
+        >>> b''.join(chunks) == data  # doctest: +SKIP
+        True
+        >>>
+        >>> # an edit only changes the chunks around it
+        >>> edited = split(data[:9999] + b'!' + data[9999:])  # doctest: +SKIP
+        >>> len(set(edited) - set(chunks)) <= 2  # doctest: +SKIP
+        True
+
+    '''
+
+    if not 0 < min_size < avg_size < max_size:
+        raise ValueError(
+            'Chunk sizes must satisfy 0 < min_size < avg_size < max_size')
+
+    if _fastcdc is None:
+        raise ValueError(
+            'Content-defined chunking requires the fastcdc package')
+
+    if isinstance(data, (bytes, bytearray)):
+        size = len(data)
+
+    elif hasattr(data, 'fileno'):
+        size = os.fstat(data.fileno()).st_size
+
+    else:
+        size = os.path.getsize(data)
+
+    # empty files can't be memory-mapped
+    if size == 0:
+        return
+
+    for chunk in _fastcdc(
+            data,
+            min_size=min_size,
+            avg_size=avg_size,
+            max_size=max_size,
+            fat=True):
+
+        yield chunk.data
+
+
+class ChunkedReader(io.RawIOBase):
+    '''
+    Read-only raw stream concatenating a sequence of chunk streams
+
+    Parameters
+    ----------
+
+    openers : iterable
+        Callables returning a readable binary file object for each chunk, in
+        order. Each chunk is opened only when the previous one is exhausted
+        and is closed once it has been read.
+
+    Examples
+    --------
+
+    .. code-block:: python
+
+        >>> parts = [b'abc', b'', b'defg']
+        >>> reader = ChunkedReader(
+        ...     [(lambda p=p: io.BytesIO(p)) for p in parts])
+        >>> print(io.BufferedReader(reader).read().decode('ascii'))
+        abcdefg
+
+    '''
+
+    def __init__(self, openers):
+        self._openers = iter(openers)
+        self._current = None
+
+    def readable(self):
+        return True
+
+    def readinto(self, b):
+        while True:
+            if self._current is None:
+                try:
+                    self._current = next(self._openers)()
+
+                except StopIteration:
+                    return 0
+
+            data = self._current.read(len(b))
+
+            if data:
+                n = len(data)
+                b[:n] = data
+                return n
+
+            self._current.close()
+            self._current = None
+
+    def close(self):
+        if not self.closed and self._current is not None:
+            self._current.close()
+            self._current = None
+
+        super(ChunkedReader, self).close()
@@ -0,0 +1,291 @@
+'''
+Garbage collection of unreferenced objects on authorities and caches
+
+:py:func:`collect_garbage` finds files which are not referenced by any version
+record in the manager, such as the leftovers of interrupted writes and failed
+uploads or cached copies of deleted archives, and removes them.
+
+Neither side is held in memory. Archive listings are streamed from the manager
+in batches and the services are walked one directory at a time, and both
+streams of paths are spilled to temporary files partitioned by a hash of the
+path. Each partition is then joined on its own, so memory use is bounded by
+the size of one partition.
+'''
+
+from __future__ import absolute_import
+
+import os
+import time
+import zlib
+import shutil
+import calendar
+import tempfile
+import fs.path
+from multiprocessing.pool import ThreadPool
+
+from datafs.core import verify
+
+
+BATCH_SIZE = 100
+THREADS = 8
+PARTITIONS = 16
+
+MIN_AGE = 24 * 60 * 60
+
+_BLOB_DIR = '.blobs'
+
+
+def _get_partition(path, partitions):
+    return (zlib.crc32(path.encode('utf-8')) & 0xffffffff) % partitions
+
+
+class _PartitionedPaths(object):
+    '''
+    Paths spilled to ``partitions`` temporary files by hash
+    '''
+
+    def __init__(self, directory, name, partitions):
+        self._paths = [
+            os.path.join(directory, '{}.{}'.format(name, i))
+            for i in range(partitions)]
+
+        self._files = [open(path, 'wb') for path in self._paths]
+
+    def add(self, path):
+        f = self._files[_get_partition(path, len(self._files))]
+        f.write(path.encode('utf-8') + b'\n')
+
+    def close(self):
+        for f in self._files:
+            f.close()
+
+    def read(self, partition):
+        with open(self._paths[partition], 'rb') as f:
+            for line in f:
+                yield line[:-1].decode('utf-8')
+
+
+def _get_mtime(filesystem, path):
+    '''
+    Return a file's modification time in seconds since the epoch
+    '''
+
+    if filesystem.hassyspath(path):
+        return os.path.getmtime(filesystem.getsyspath(path))
+
+    modified = filesystem.getinfo(path).get('modified_time')
+
+    if modified is None:
+        return None
+
+    # remote services report naive UTC times
+    return calendar.timegm(modified.utctimetuple())
+
+
+def _walk_service(filesystem, prefix, include_blobs):
+    '''
+    Yield the files on a service which may hold archive data
+
+    Hidden top-level directories other than the content-addressed blob store
+    (e.g. the write-behind journal and ranged block cache) are skipped.
+    '''
+
+    for dirpath, filenames in filesystem.walk('/'):
+        dirpath = fs.path.relpath(fs.path.normpath(dirpath))
+        head = dirpath.split('/')[0]
+
+        if head.startswith('.') and not (
+                include_blobs and head == _BLOB_DIR):
+            continue
+
+        for filename in filenames:
+            path = fs.path.join(dirpath, filename) if dirpath else filename
+
+            if prefix is not None and not path.startswith(prefix):
+                if not (include_blobs and head == _BLOB_DIR):
+                    continue
+
+            yield path
+
+
+def _stream_referenced(api, services, referenced, batch_size):
+    '''
+    Spill the paths referenced by every version to ``referenced``
+    '''
+
+    def add_batch(batch):
+        archives, histories = api._batch_get_archive(
+            batch, include_history=True)
+
+        for archive_name, archive in archives.items():
+            for obj in verify.get_objects(
+                    archive, histories.get(archive_name, [])):
+
+                for service_name in [archive.authority_name, 'cache']:
+                    if service_name in services:
+                        referenced[service_name].add(obj['path'])
+
+    batch = []
+
+    for archive_name in api.manager.search([]):
+        batch.append(archive_name)
+
+        if len(batch) >= batch_size:
+            add_batch(batch)
+            batch = []
+
+    if len(batch) > 0:
+        add_batch(batch)
+
+
+def collect_garbage(
+        api,
+        authority_name=None,
+        cache=False,
+        prefix=None,
+        dry_run=False,
+        min_age=MIN_AGE,
+        threads=THREADS,
+        batch_size=BATCH_SIZE,
+        partitions=PARTITIONS):
+    '''
+    Remove files which are not referenced by any version
+
+    Parameters
+    ----------
+
+    api : :py:class:`~datafs.DataAPI`
+
+    authority_name : str
+        Only collect garbage on this authority (default all authorities)
+
+    cache : bool
+        Also collect garbage in the cache
+
+    prefix : str
+        Only remove files whose paths start with ``prefix``. Content-addressed
+        blobs are shared between archives, so they are only collected without
+        a prefix. Every archive in the manager is still read, since files under
+        ``prefix`` may belong to archives with other names.
+
+    dry_run : bool
+        Report unreferenced files without removing them
+
+    min_age : float
+        Only remove files last modified at least this many seconds ago, so
+        that versions which are being written are not removed before they
+        are registered (default ``MIN_AGE``, one day)
+
+    threads : int
+        Number of concurrent removals (default ``THREADS``)
+
+    batch_size : int
+        Number of archives listed per manager query (default
+        ``BATCH_SIZE``)
+
+    partitions : int
+        Number of partitions the paths are split into. Memory use is
+        proportional to the number of files divided by ``partitions``
+        (default ``PARTITIONS``).
+
+    Returns
+    -------
+
+    report : dict
+        Dictionary with the number of files ``scanned``, the list of
+        ``orphaned`` files (each with its ``service`` and ``path``), the
+        number of files ``removed`` and whether this was a ``dry_run``
+
+    '''
+
+    if cache and not api.cache:
+        raise ValueError('No cache attached')
+
+    if authority_name is None:
+        services = dict(api._authorities)
+
+    else:
+        api._validate_authority_name(authority_name)
+
+        if authority_name not in api._authorities:
+            raise ValueError(
+                'Authority "{}" not found'.format(authority_name))
+
+        services = {authority_name: api._authorities[authority_name]}
+
+    if cache:
+        services['cache'] = api.cache
+
+    report = {
+        'scanned': 0,
+        'orphaned': [],
+        'removed': 0,
+        'dry_run': dry_run}
+
+    # versions staged by write-behind writes are not registered yet
+    pending = set()
+
+    if api.journal is not None:
+        pending.update(
+            entry['record']['path'] for entry in api.journal.entries())
+
+    now = time.time()
+    tmp = tempfile.mkdtemp()
+
+    try:
+        referenced = {}
+        listed = {}
+
+        for i, service_name in enumerate(sorted(services)):
+            referenced[service_name] = _PartitionedPaths(
+                tmp, 'referenced{}'.format(i), partitions)
+
+            listed[service_name] = _PartitionedPaths(
+                tmp, 'listed{}'.format(i), partitions)
+
+        _stream_referenced(api, services, referenced, batch_size)
+
+        for service_name, service in services.items():
+            for path in _walk_service(service.fs, prefix, prefix is None):
+                listed[service_name].add(path)
+                report['scanned'] += 1
+
+        for paths in list(referenced.values()) + list(listed.values()):
+            paths.close()
+
+        pool = ThreadPool(threads)
+
+        try:
+            for service_name, service in sorted(services.items()):
+                for partition in range(partitions):
+                    known = set(referenced[service_name].read(partition))
+
+                    orphans = []
+
+                    for path in listed[service_name].read(partition):
+                        if path in known or path in pending:
+                            continue
+
+                        mtime = _get_mtime(service.fs, path)
+
+                        if mtime is not None and now - mtime < min_age:
+                            continue
+
+                        orphans.append(path)
+
+                    report['orphaned'].extend([
+                        {'service': service_name, 'path': path}
+                        for path in orphans])
+
+                    if not dry_run:
+                        pool.map(service.fs.remove, orphans)
+                        report['removed'] += len(orphans)
+
+        finally:
+            pool.close()
+            pool.join()
+
+    finally:
+        shutil.rmtree(tmp)
+
+    return report
@@ -0,0 +1,272 @@
+'''
+Stream compression codecs for stored archive versions
+
+Codecs from the standard library (``gzip``, ``zlib``, ``bz2`` and, on python
+3, ``lzma``) are always available. ``zstd`` is registered if the optional
+`zstandard <https://pypi.python.org/pypi/zstandard>`_ package is installed.
+
+Data is compressed and decompressed incrementally, so files of any size can be
+streamed between filesystems without being loaded into memory.
+'''
+
+from __future__ import absolute_import
+
+import io
+import bz2
+import zlib
+
+try:
+    import lzma
+except ImportError:
+    lzma = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+
+CHUNK_SIZE = 1024 * 1024
+
+_CODECS = {
+    'gzip': (
+        lambda: zlib.compressobj(6, zlib.DEFLATED, 16 + zlib.MAX_WBITS),
+        lambda: zlib.decompressobj(16 + zlib.MAX_WBITS)),
+    'zlib': (
+        lambda: zlib.compressobj(6),
+        lambda: zlib.decompressobj()),
+    'bz2': (
+        lambda: bz2.BZ2Compressor(9),
+        lambda: bz2.BZ2Decompressor())}
+
+if lzma is not None:
+    _CODECS['lzma'] = (
+        lambda: lzma.LZMACompressor(),
+        lambda: lzma.LZMADecompressor())
+
+if zstandard is not None:
+    _CODECS['zstd'] = (
+        lambda: zstandard.ZstdCompressor().compressobj(),
+        lambda: zstandard.ZstdDecompressor().decompressobj())
+
+
+def available_codecs():
+    '''
+    List the names of the compression codecs available in this environment
+
+    Examples
+    --------
+
+    .. code-block:: python
+
+        >>> 'gzip' in available_codecs()
+        True
+
+    '''
+
+    return sorted(_CODECS.keys())
+
+
+def validate_codec(codec):
+    '''
+    Raise a ValueError if ``codec`` is not ``None`` or an available codec
+    '''
+
+    if codec is not None and codec not in _CODECS:
+        raise ValueError(
+            'Compression codec "{}" not available. Choose from {}'.format(
+                codec, ', '.join(available_codecs())))
+
+
+def get_compressor(codec):
+    validate_codec(codec)
+    return _CODECS[codec][0]()
+
+
+def get_decompressor(codec):
+    validate_codec(codec)
+    return _CODECS[codec][1]()
+
+
+class DecompressingReader(io.RawIOBase):
+    '''
+    Read-only raw stream decompressing data from a compressed file object
+
+    Parameters
+    ----------
+
+    raw : file-like
+        Binary file object containing compressed data. The reader takes
+        ownership of ``raw`` and closes it on close.
+
+    codec : str
+        Name of the codec used to compress the data
+    '''
+
+    def __init__(self, raw, codec, chunk_size=CHUNK_SIZE):
+        self._raw = raw
+        self._decompressor = get_decompressor(codec)
+        self._chunk_size = chunk_size
+        self._buffer = b''
+        self._offset = 0
+        self._eof = False
+
+    def readable(self):
+        return True
+
+    def _decompress(self, data):
+        '''
+        Decompress at most ``chunk_size`` bytes, keeping any leftover input
+
+        zlib keeps leftover input in ``unconsumed_tail``, and bz2 and lzma
+        (on python 3.5+) buffer it internally. Other decompressors return
+        all of the output at once.
+        '''
+
+        decompressor = self._decompressor
+
+        if hasattr(decompressor, 'unconsumed_tail'):
+            return decompressor.decompress(
+                decompressor.unconsumed_tail + data, self._chunk_size)
+
+        if hasattr(decompressor, 'needs_input'):
+            return decompressor.decompress(data, self._chunk_size)
+
+        return decompressor.decompress(data)
+
+    def _has_input(self):
+        '''
+        Whether the decompressor holds input it has not decompressed yet
+        '''
+
+        decompressor = self._decompressor
+
+        if hasattr(decompressor, 'unconsumed_tail'):
+            return len(decompressor.unconsumed_tail) > 0
+
+        if hasattr(decompressor, 'needs_input'):
+            return not (decompressor.needs_input or decompressor.eof)
+
+        return False
+
+    def _fill(self):
+        while self._offset >= len(self._buffer) and not self._eof:
+            self._offset = 0
+
+            # drain leftover input before reading more, so a highly
+            # compressible block doesn't expand into one huge buffer
+            if self._has_input():
+                self._buffer = self._decompress(b'')
+                continue
+
+            data = self._raw.read(self._chunk_size)
+
+            if not data:
+                self._eof = True
+                flush = getattr(self._decompressor, 'flush', None)
+                self._buffer = flush() if flush is not None else b''
+
+            else:
+                self._buffer = self._decompress(data)
+
+    def readinto(self, b):
+        self._fill()
+
+        available = len(self._buffer) - self._offset
+        n = min(len(b), available)
+
+        b[:n] = self._buffer[self._offset:self._offset + n]
+        self._offset += n
+
+        return n
+
+    def close(self):
+        if not self.closed:
+            self._raw.close()
+
+        super(DecompressingReader, self).close()
+
+
+def open_decompressed(f, codec, mode='rb', **kwargs):
+    '''
+    Wrap a compressed binary file object in a readable file object
+
+    Parameters
+    ----------
+
+    f : file-like
+        Binary file object containing data compressed with ``codec``
+
+    codec : str
+        Name of the compression codec
+
+    mode : str
+        Read mode. If ``'b'`` is not in mode, the decompressed stream is
+        wrapped in a :py:class:`io.TextIOWrapper`, and ``kwargs`` (e.g.
+        ``encoding``) are passed to the wrapper.
+
+    Examples
+    --------
+
+    .. code-block:: python
+
+        >>> buf = io.BytesIO()
+        >>> compress_stream(io.BytesIO(b'hello!'), buf, 'gzip')
+        >>> buf.seek(0)
+        0
+        >>> with open_decompressed(buf, 'gzip') as f:
+        ...     print(f.read().decode('ascii'))
+        ...
+        hello!
+
+    '''
+
+    reader = io.BufferedReader(DecompressingReader(f, codec))
+
+    if 'b' in mode:
+        return reader
+
+    return io.TextIOWrapper(reader, **kwargs)
+
+
+def compress_stream(src, dst, codec, chunk_size=CHUNK_SIZE):
+    '''
+    Compress the contents of binary file object ``src`` into ``dst``
+    '''
+
+    compressor = get_compressor(codec)
+
+    for chunk in iter(lambda: src.read(chunk_size), b''):
+        dst.write(compressor.compress(chunk))
+
+    dst.write(compressor.flush())
+
+
+def decompress_stream(src, dst, codec, chunk_size=CHUNK_SIZE):
+    '''
+    Decompress the contents of binary file object ``src`` into ``dst``
+
+    Examples
+    --------
+
+    .. code-block:: python
+
+        >>> for codec in available_codecs():
+        ...     compressed, restored = io.BytesIO(), io.BytesIO()
+        ...     compress_stream(io.BytesIO(b'abc' * 1000), compressed, codec)
+        ...     _ = compressed.seek(0)
+        ...     decompress_stream(compressed, restored, codec)
+        ...     assert restored.getvalue() == b'abc' * 1000, codec
+
+    '''
+
+    reader = DecompressingReader(src, codec, chunk_size=chunk_size)
+    buf = bytearray(chunk_size)
+
+    while True:
+        n = reader.readinto(buf)
+
+        if n == 0:
+            break
+
+        dst.write(bytes(buf[:n]))
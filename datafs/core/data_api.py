@@ -2,13 +2,25 @@ from __future__ import absolute_import
 
 from datafs.services.service import DataService
 from datafs.core.data_archive import DataArchive
-from datafs._compat import open_filelike
+from datafs.core import hashing
+from datafs.core import compression as codecs
+from datafs.core import data_file
+from datafs.core import verify as integrity
+from datafs.core import replication
+from datafs.core import cleanup
+from datafs.core.journal import Journal
+from datafs.core.versions import BumpableVersion, VersionIndex
+from datafs.services import transfer
 
-import hashlib
 import fnmatch
+import json
 import re
+import os
+import functools
+import threading
 import fs.path
 from fs.osfs import OSFS
+from multiprocessing.pool import ThreadPool
 
 try:
     PermissionError
@@ -23,6 +35,10 @@ class DataAPI(object):
 
     DefaultAuthorityName = None
 
+    DefaultHashAlgorithm = 'md5'
+
+    CheckoutManifest = '.datafs-manifest.json'
+
     _ArchiveConstructor = DataArchive
 
     def __init__(self, default_versions=None, **kwargs):
@@ -37,269 +53,1406 @@ class DataAPI(object):
         self._authorities = {}
 
         self.default_versions = default_versions
+        self.hash_algorithm = self.DefaultHashAlgorithm
+        self.hash_chunk_size = None
+        self.compression = None
+
+        # store new versions under their checksum (see DataArchive.update)
+        self.content_addressed = False
+
+        # store new versions as content-defined chunks (see core.chunking)
+        self.chunked_storage = False
+
+        # write-behind journal (see enable_write_behind), created on first
+        # use so lazily connected caches are not touched at startup
+        self._journal = None
+        self._journal_lock = threading.Lock()
+        self.write_behind_options = None
+
+        self._authorities_locked = False
+        self._manager_locked = False
+
+    def attach_authority(self, service_name, service, **transfer_options):
+        '''
+        Attach a filesystem as an authority
+
+        Parameters
+        ----------
+        service_name : str
+            Name of the authority
+
+        service : object
+            pyfilesystem object
+
+        transfer_options :
+            ``part_size``, ``threads`` and ``retries`` used for parallel
+            transfers (see :py:func:`datafs.services.transfer.set_options`)
+        '''
+
+        if self._authorities_locked:
+            raise PermissionError('Authorities locked')
+
+        self._validate_authority_name(service_name)
+
+        self._authorities[service_name] = DataService(
+            service, **transfer_options)
+
+    def lock_authorities(self):
+        self._authorities_locked = True
+
+    def lock_manager(self):
+        self._manager_locked = True
+
+    def attach_cache(self, service, **transfer_options):
+
+        if service in self._authorities.values():
+            raise ValueError('Cannot attach an authority as a cache')
+        else:
+            self._cache = DataService(service, **transfer_options)
+
+    @property
+    def journal(self):
+        '''
+        Write-behind :py:class:`~datafs.core.journal.Journal`, or ``None``
+        '''
+
+        return self._get_journal()
+
+    @property
+    def write_behind(self):
+        return self.write_behind_options is not None
+
+    def enable_write_behind(
+            self,
+            journal_dir=None,
+            threads=None,
+            retries=None):
+        '''
+        Write new versions to the cache and upload them in the background
+
+        With write-behind enabled, :py:meth:`DataArchive.update
+        <datafs.core.data_archive.DataArchive.update>` and writes through
+        ``open`` and ``get_local_path`` store new versions in the cache and
+        record them in a durable journal, then return. Background workers
+        upload each version to its authority and register it with the
+        manager, retrying failures. Pending versions are visible to archives
+        retrieved from this API, and become visible to other users once they
+        are registered. Use :py:meth:`flush` to wait for pending writes.
+
+        Versions of unversioned archives (unless
+        :py:attr:`content_addressed` is set) and chunked versions are written
+        synchronously.
+
+        Parameters
+        ----------
+
+        journal_dir : str
+            Local directory for the journal (default ``.journal`` in the
+            cache)
+
+        threads : int
+            Number of concurrent uploads (default 4)
+
+        retries : int
+            Number of times a failed upload is retried (default 3)
+
+        Raises
+        ------
+
+        ValueError
+            A ValueError is raised if no cache is attached, or if the cache
+            is not on the local filesystem and no ``journal_dir`` is given.
+            The journal of a cache which has not connected yet (see
+            :py:class:`~datafs.services.lazy.LazyFS`) is only opened, and
+            its path checked, when it is first used.
+
+        '''
+
+        if not self.cache:
+            raise ValueError('Write-behind requires a cache')
+
+        options = {
+            k: v for k, v in [
+                ('journal_dir', journal_dir),
+                ('threads', threads),
+                ('retries', retries)] if v is not None}
+
+        self._journal = None
+        self.write_behind_options = options
+
+        if journal_dir is not None or getattr(
+                self.cache.fs, 'connected', True):
+            self._get_journal()
+
+    def _get_journal(self):
+        '''
+        Open the write-behind journal if it is not open, and return it
+        '''
+
+        if self._journal is not None or self.write_behind_options is None:
+            return self._journal
+
+        with self._journal_lock:
+            if self._journal is not None:
+                return self._journal
+
+            options = self.write_behind_options
+            journal_dir = options.get('journal_dir')
+
+            if journal_dir is None:
+                if not self.cache.fs.hassyspath('.journal'):
+                    self.write_behind_options = None
+
+                    raise ValueError(
+                        'Cache has no local path. Provide a journal_dir.')
+
+                journal_dir = self.cache.fs.getsyspath('.journal')
+
+            kwargs = {
+                k: v for k, v in options.items()
+                if k in ('threads', 'retries')}
+
+            self._journal = Journal(
+                journal_dir, self._write_journal_entry, **kwargs)
+
+        return self._journal
+
+    def _journal_version(
+            self,
+            archive_name,
+            path,
+            archive_metadata,
+            version_metadata):
+        '''
+        Record a version staged in the cache at ``path`` in the journal
+        '''
+
+        version_metadata = dict(version_metadata)
+
+        # unversioned archives have no version
+        version = version_metadata.get('version')
+
+        if version is not None:
+            version_metadata['version'] = str(version)
+        version_metadata['updated'] = self.manager.create_timestamp()
+
+        self._get_journal().append(archive_name, {
+            'archive_name': archive_name,
+            'path': path,
+            'archive_metadata': archive_metadata,
+            'version_metadata': version_metadata})
+
+    def _get_pending_versions(self, archive_name):
+        journal = self._get_journal()
+
+        if journal is None:
+            return []
+
+        return [
+            entry['record']['version_metadata']
+            for entry in journal.entries(archive_name)]
+
+    def _is_pending(self, path):
+        journal = self._get_journal()
+
+        if journal is None:
+            return False
+
+        return any(
+            entry['record']['path'] == path
+            for entry in journal.entries())
+
+    def _write_journal_entry(self, entry):
+        '''
+        Upload a staged version to its authority and register it
+
+        Both steps are skipped if they have already been done, so entries
+        interrupted by a crash can be applied again.
+        '''
+
+        record = entry['record']
+        path = record['path']
+
+        archive = self.get_archive(record['archive_name'])
+
+        # content-addressed blobs already on the authority are identical
+        content_addressed = 'path' in record['version_metadata']
+
+        if not (content_addressed and archive.authority.fs.isfile(path)):
+
+            if not self.cache.fs.isfile(path):
+                raise IOError(
+                    'Staged file "{}" missing from cache'.format(path))
+
+            data_file._makedirs(archive.authority.fs, fs.path.dirname(path))
+            transfer.copyfile(self.cache.fs, path, archive.authority.fs, path)
+
+        if not archive._is_registered(record['version_metadata']):
+            self.manager.update(
+                record['archive_name'], dict(record['version_metadata']))
+
+        if record['archive_metadata']:
+            self.manager.update_metadata(
+                record['archive_name'], record['archive_metadata'])
+
+    def flush(self):
+        '''
+        Block until all write-behind versions are uploaded and registered
+
+        Versions which failed after all retries are attempted once more.
+
+        Raises
+        ------
+
+        IOError
+            An IOError is raised if any versions could not be written. They
+            remain in the journal and can be retried with another ``flush``.
+
+        '''
+
+        journal = self._get_journal()
+
+        if journal is None:
+            return
+
+        journal.retry()
+        journal.wait()
+
+        failed = journal.failed()
+
+        if len(failed) > 0:
+            raise IOError(
+                '{} pending versions could not be written:\n{}'.format(
+                    len(failed), '\n'.join([
+                        '{} {}: {}'.format(
+                            entry['key'],
+                            entry['record']['version_metadata']['version'],
+                            entry['error'])
+                        for entry in failed])))
+
+    @property
+    def manager(self):
+        return self._manager
+    # set cache attr
+
+    @property
+    def cache(self):
+        return self._cache
+    # get the default athority setting
+
+    @property
+    def default_authority_name(self):
+
+        if self.DefaultAuthorityName is not None:
+            return self.DefaultAuthorityName
+
+        if len(self._authorities) == 0:
+            raise ValueError(
+                'No authorities found. See attach_authority.')
+
+        if len(self._authorities) > 1:
+            raise ValueError(
+                'Authority ambiguous. Set authority or DefaultAuthorityName.')
+        # get the zeroth key
+        return list(self._authorities.keys())[0]
+
+    # Do we want to provide a method for setting authorities
+    @property
+    def default_authority(self):
+        return self._authorities[self.default_authority_name]
+
+    @property
+    def default_versions(self):
+        return self._default_versions
+
+    @default_versions.setter
+    def default_versions(self, default_versions):
+        '''
+        Set archive default read versions
+
+        Parameters
+        ----------
+        default_versions: dict
+            Dictionary of archive_name, version pairs. On read/download,
+            archives in this dictionary will download the specified version
+            by default. Before assignment, archive_names are checked and
+            normalized.
+        '''
+
+        default_versions = {
+            self._normalize_archive_name(arch)[1]: v
+            for arch, v in default_versions.items()}
+
+        self._default_versions = default_versions
+
+    @property
+    def hash_algorithm(self):
+        return self._hash_algorithm
+
+    @hash_algorithm.setter
+    def hash_algorithm(self, algorithm):
+        '''
+        Set the algorithm used to checksum new archive versions
+
+        Parameters
+        ----------
+        algorithm: str
+            Name of a hash algorithm available in
+            :py:func:`datafs.core.hashing.available_algorithms`, optionally
+            with a ``-tree`` suffix to use parallel chunked hashing (see
+            :py:attr:`hash_chunk_size`). Existing
+            versions are always verified with the algorithm recorded in their
+            version history, so changing this setting does not invalidate
+            archives written with another algorithm.
+        '''
+
+        # raises a ValueError for unavailable algorithms
+        hashing.validate_algorithm(algorithm)
+
+        self._hash_algorithm = algorithm
+
+    @property
+    def compression(self):
+        return self._compression
+
+    @compression.setter
+    def compression(self, codec):
+        '''
+        Set the default compression codec for new archive versions
+
+        Parameters
+        ----------
+        codec: str
+            Name of a codec in
+            :py:func:`datafs.core.compression.available_codecs`, or ``None``
+            to store data uncompressed. Archives created with a
+            ``compression`` argument use their own codec instead. The codec
+            used to write each version is stored in its version record.
+        '''
+
+        codecs.validate_codec(codec)
+
+        self._compression = codec
+
+    def attach_manager(self, manager):
+
+        if self._manager_locked:
+            raise PermissionError('Manager locked')
+
+        self._manager = manager
+
+    def create(
+            self,
+            archive_name,
+            authority_name=None,
+            versioned=True,
+            raise_on_err=True,
+            metadata=None,
+            tags=None,
+            helper=False,
+            compression=None):
+        '''
+        Create a DataFS archive
+
+        Parameters
+        ----------
+
+        archive_name: str
+            Name of the archive
+
+        authority_name: str
+            Name of the data service to use as the archive's data authority
+
+        versioned: bool
+            If true, store all versions with explicit version numbers (defualt)
+
+        raise_on_err: bool
+            Raise an error if the archive already exists (default True)
+
+        metadata: dict
+            Dictionary of additional archive metadata
+
+        helper: bool
+            If true, interactively prompt for required metadata (default False)
+
+        compression: str
+            Compression codec used to store this archive's versions. If
+            ``None`` (default), the API's :py:attr:`compression` setting is
+            used.
+
+        '''
+
+        authority_name, archive_name = self._normalize_archive_name(
+            archive_name, authority_name=authority_name)
+
+        if authority_name is None:
+            authority_name = self.default_authority_name
+
+        self._validate_archive_name(archive_name)
+
+        if metadata is None:
+            metadata = {}
+
+        codecs.validate_codec(compression)
+
+        res = self.manager.create_archive(
+            archive_name,
+            authority_name,
+            archive_path=archive_name,
+            versioned=versioned,
+            raise_on_err=raise_on_err,
+            metadata=metadata,
+            user_config=self.user_config,
+            tags=tags,
+            helper=helper,
+            compression=compression)
+
+        return self._ArchiveConstructor(
+            api=self,
+            **res)
+
+    def get_archive(self, archive_name, default_version=None):
+        '''
+        Retrieve a data archive
+
+        Parameters
+        ----------
+
+        archive_name: str
+            Name of the archive to retrieve
+
+        default_version: version
+            str or :py:class:`~distutils.StrictVersion` giving the default
+            version number to be used on read operations
+
+        Returns
+        -------
+        archive: object
+            New :py:class:`~datafs.core.data_archive.DataArchive` object
+
+        Raises
+        ------
+
+        KeyError:
+            A KeyError is raised when the ``archive_name`` is not found
+
+        '''
+
+        auth, archive_name = self._normalize_archive_name(archive_name)
+
+        res = self.manager.get_archive(archive_name)
+
+        if default_version is None:
+            default_version = self._default_versions.get(archive_name, None)
+
+        if (auth is not None) and (auth != res['authority_name']):
+            raise ValueError(
+                'Archive "{}" not found on {}.'.format(archive_name, auth) +
+                ' Did you mean "{}://{}"?'.format(
+                    res['authority_name'], archive_name))
+
+        return self._ArchiveConstructor(
+            api=self,
+            default_version=default_version,
+            **res)
+
+    def batch_get_archive(self, archive_names, default_versions=None):
+        '''
+        Batch version of :py:meth:`~DataAPI.get_archive`
+
+        Parameters
+        ----------
+
+        archive_names: list
+
+            Iterable of archive names to retrieve
+
+        default_versions: str, object, or dict
+
+            Default versions to assign to each returned archive. May be a dict
+            with archive names as keys and versions as values, or may be a
+            version, in which case the same version is used for all archives.
+            Versions must be a strict version number string, a
+            :py:class:`~distutils.version.StrictVersion`, or a
+            :py:class:`~datafs.core.versions.BumpableVersion` object.
+
+        Returns
+        -------
+
+        archives: list
+
+            List of :py:class:`~datafs.core.data_archive.DataArchive` objects.
+            If an archive is not found, it is omitted (``batch_get_archive``
+            does not raise a ``KeyError`` on invalid archive names).
+
+        '''
+
+        return self._batch_get_archive(archive_names, default_versions)[0]
+
+    def _batch_get_archive(
+            self,
+            archive_names,
+            default_versions=None,
+            include_history=False):
+        '''
+        Return archives and their version histories from one manager query
+
+        Returns a dict of archives (see :py:meth:`batch_get_archive`) and a
+        dict of version histories, both keyed by archive name. The histories
+        are only returned if ``include_history`` is True.
+        '''
+
+        # toss prefixes and normalize names
+        archive_names = map(
+            lambda arch: self._normalize_archive_name(arch)[1],
+            archive_names)
+
+        responses = self.manager.batch_get_archive(
+            archive_names, include_history=include_history)
+
+        archives = {}
+        histories = {}
+
+        if default_versions is None:
+            default_versions = {}
+
+        for res in responses:
+            res['archive_name'] = self._normalize_archive_name(
+                res['archive_name'])[1]
+
+            archive_name = res['archive_name']
+
+            if include_history:
+                histories[archive_name] = res.pop('version_history')
+
+            if hasattr(default_versions, 'get'):
+
+                # Get version number from default_versions or
+                # self._default_versions if key not present.
+                default_version = default_versions.get(
+                    archive_name,
+                    self._default_versions.get(archive_name, None))
+
+            else:
+                default_version = default_versions
+
+            archive = self._ArchiveConstructor(
+                api=self,
+                default_version=default_version,
+                **res)
+
+            archives[archive_name] = archive
+
+        return archives, histories
+
+    def _resolve_archive_specs(self, archive_specs):
+        '''
+        Resolve archive specs to ``(archive, version, version_record)``
+
+        Versions are resolved from the histories fetched in one batched
+        manager query. Returns a dict of resolved archives and a dict of
+        errors, both keyed by archive name.
+        '''
+
+        if hasattr(archive_specs, 'items'):
+            default_versions = dict(archive_specs)
+            archive_names = list(default_versions.keys())
+
+        else:
+            default_versions = None
+            archive_names = list(archive_specs)
+
+        archive_names = [
+            self._normalize_archive_name(arch)[1] for arch in archive_names]
+
+        if default_versions is not None:
+            # unspecified versions fall back to self._default_versions
+            default_versions = {
+                self._normalize_archive_name(arch)[1]: v
+                for arch, v in default_versions.items() if v is not None}
+
+        # fetch all histories with one query rather than one per archive
+        archives, histories = self._batch_get_archive(
+            archive_names,
+            default_versions=default_versions,
+            include_history=True)
+
+        resolved = {}
+        errors = {}
+
+        for archive_name in archive_names:
+            if archive_name not in archives:
+                errors[archive_name] = KeyError(
+                    'Archive "{}" not found'.format(archive_name))
+                continue
+
+            archive = archives[archive_name]
+
+            try:
+                index = archive._get_version_index(
+                    archive._add_pending_versions(
+                        histories.get(archive_name, [])))
+
+                version = archive._get_default_version(index)
+                record = archive._get_version_record(version, index)
+
+                if record is None:
+                    raise ValueError(
+                        'Archive "{}" has no versions'.format(archive_name))
+
+            except (KeyError, ValueError) as e:
+                errors[archive_name] = e
+                continue
+
+            resolved[archive_name] = (archive, version, record)
+
+        return resolved, errors
+
+    @staticmethod
+    def _run_batch(tasks, errors, threads, callback):
+        '''
+        Run ``(archive_name, func)`` tasks on a thread pool
+
+        Failures are recorded in ``errors`` rather than raised. ``callback``
+        is called with ``(archive_name, error, completed, total)`` as each
+        task finishes, in the order they finish.
+        '''
+
+        total = len(tasks) + len(errors)
+        completed = 0
+
+        if callback is not None:
+            for archive_name, error in list(errors.items()):
+                completed += 1
+                callback(archive_name, error, completed, total)
+
+        if len(tasks) == 0:
+            return errors
+
+        def run(task):
+            archive_name, func = task
+
+            try:
+                func()
+
+            except Exception as e:
+                return archive_name, e
+
+            return archive_name, None
+
+        pool = ThreadPool(min(threads, len(tasks)))
+
+        try:
+            for archive_name, error in pool.imap_unordered(run, tasks):
+                if error is not None:
+                    errors[archive_name] = error
+
+                completed += 1
+
+                if callback is not None:
+                    callback(archive_name, error, completed, total)
+
+        finally:
+            pool.close()
+            pool.join()
+
+        return errors
+
+    def batch_download(
+            self,
+            archive_specs,
+            dest_dir,
+            threads=8,
+            callback=None):
+        '''
+        Download a set of archives concurrently
+
+        Parameters
+        ----------
+
+        archive_specs: list or dict
+
+            Archive names, or a dict of archive names and versions. Versions
+            not given default to the API's :py:attr:`default_versions`
+            (e.g. from a requirements file), then to the latest version.
+
+        dest_dir: str
+
+            Directory in which to save the files. Each archive is saved at
+            its archive name relative to ``dest_dir``. Files which are
+            already up to date are not downloaded again.
+
+        threads: int
+
+            Number of concurrent transfers (default 8)
+
+        callback: function
+
+            Called with ``(archive_name, error, completed, total)`` as each
+            archive finishes. ``error`` is ``None`` on success.
+
+        Returns
+        -------
+
+        errors: dict
+
+            Exceptions raised for archives which could not be downloaded,
+            keyed by archive name. Failures do not stop the other transfers.
+
+        '''
+
+        resolved, errors = self._resolve_archive_specs(archive_specs)
+
+        tasks = []
+
+        for archive_name, (archive, version, record) in resolved.items():
+            filepath = os.path.join(dest_dir, *archive_name.split('/'))
+
+            if not os.path.isdir(os.path.dirname(filepath)):
+                os.makedirs(os.path.dirname(filepath))
+
+            tasks.append((
+                archive_name,
+                functools.partial(
+                    archive._download, filepath, version, record)))
+
+        return self._run_batch(tasks, errors, threads, callback)
+
+    def checkout(
+            self,
+            archive_specs,
+            dest_dir,
+            threads=8,
+            callback=None,
+            link=True):
+        '''
+        Materialize a set of pinned archives in a local directory
+
+        All archives are resolved with one batched manager query. Files are
+        hardlinked from the cache where a valid cached copy exists and
+        downloaded concurrently otherwise. A manifest of the checked out
+        versions and checksums is written to :py:attr:`CheckoutManifest` in
+        ``dest_dir``, and files whose version, size and modification time
+        match the manifest are skipped without being read, so checking out
+        an unchanged set again does no transfers.
+
+        Parameters
+        ----------
+
+        archive_specs: list or dict
+
+            Archive names, or a dict of archive names and versions such as
+            the pins in a requirements file (see :py:meth:`batch_download`)
+
+        dest_dir: str
+
+            Directory in which to save the files. Each archive is saved at
+            its archive name relative to ``dest_dir``.
+
+        threads: int
+
+            Number of concurrent transfers (default 8)
+
+        callback: function
+
+            Called with ``(archive_name, error, completed, total)`` as each
+            archive finishes. ``error`` is ``None`` on success.
+
+        link: bool
+
+            Hardlink files from the cache where possible (default True).
+            Linked files share their data with the cache and are made
+            read-only; replace them rather than modifying them in place.
+
+        Returns
+        -------
+
+        errors: dict
+
+            Exceptions raised for archives which could not be checked out,
+            keyed by archive name. Failed archives are left out of the
+            manifest.
+
+        '''
+
+        resolved, errors = self._resolve_archive_specs(archive_specs)
+
+        if not os.path.isdir(dest_dir):
+            os.makedirs(dest_dir)
+
+        manifest_path = os.path.join(dest_dir, self.CheckoutManifest)
+        previous = {}
+
+        if os.path.isfile(manifest_path):
+            with open(manifest_path, 'r') as f:
+                previous = json.load(f)
+
+        manifest = {}
+        tasks = []
+
+        for archive_name, (archive, version, record) in resolved.items():
+            tasks.append((
+                archive_name,
+                functools.partial(
+                    self._checkout_archive,
+                    archive,
+                    version,
+                    record,
+                    dest_dir,
+                    previous.get(archive_name),
+                    manifest,
+                    link)))
+
+        errors = self._run_batch(tasks, errors, threads, callback)
+
+        tmp = manifest_path + '.tmp'
+
+        with open(tmp, 'w') as f:
+            json.dump(manifest, f, indent=2, sort_keys=True)
+
+        if os.path.exists(manifest_path):
+            os.remove(manifest_path)
+
+        os.rename(tmp, manifest_path)
+
+        return errors
+
+    @staticmethod
+    def _checkout_archive(
+            archive,
+            version,
+            version_record,
+            dest_dir,
+            previous,
+            manifest,
+            link):
+
+        filepath = os.path.join(dest_dir, *archive.archive_name.split('/'))
+
+        entry = {
+            'version': None if version is None else str(version),
+            'checksum': version_record['checksum'],
+            'algorithm': version_record.get('algorithm', 'md5')}
+
+        if previous is not None and os.path.isfile(filepath):
+            st = os.stat(filepath)
+
+            if all([
+                    previous.get('version') == entry['version'],
+                    previous.get('checksum') == entry['checksum'],
+                    previous.get('size') == st.st_size,
+                    previous.get('mtime') == st.st_mtime]):
+
+                manifest[archive.archive_name] = previous
+                return
+
+        if not os.path.isdir(os.path.dirname(filepath)):
+            os.makedirs(os.path.dirname(filepath))
+
+        entry['linked'] = link and archive._link_from_cache(
+            filepath, version, version_record)
+
+        if not entry['linked']:
+            archive._download(filepath, version, version_record)
+
+        st = os.stat(filepath)
+        entry['size'] = st.st_size
+        entry['mtime'] = st.st_mtime
+
+        manifest[archive.archive_name] = entry
+
+    def prefetch(self, archive_specs, threads=8, callback=None):
+        '''
+        Warm the cache with a set of archives concurrently
+
+        Each archive is cached (see
+        :py:meth:`~datafs.core.data_archive.DataArchive.cache`) and its
+        cached copy is filled from the authority unless it is already valid.
+
+        Parameters
+        ----------
+
+        archive_specs: list or dict
+
+            Archive names, or a dict of archive names and versions (see
+            :py:meth:`batch_download`)
+
+        threads: int
+
+            Number of concurrent transfers (default 8)
+
+        callback: function
+
+            Called with ``(archive_name, error, completed, total)`` as each
+            archive finishes
+
+        Returns
+        -------
+
+        errors: dict
+
+            Exceptions raised for archives which could not be prefetched,
+            keyed by archive name
+
+        Raises
+        ------
+
+        ValueError
+
+            A ValueError is raised if no cache is attached
+
+        '''
+
+        if not self.cache:
+            raise ValueError('No cache attached')
+
+        resolved, errors = self._resolve_archive_specs(archive_specs)
+
+        tasks = [
+            (archive_name, functools.partial(
+                archive._prefetch, version, record))
+            for archive_name, (archive, version, record) in resolved.items()]
+
+        return self._run_batch(tasks, errors, threads, callback)
+
+    def verify(
+            self,
+            prefix=None,
+            authority_name=None,
+            cache=False,
+            quick=False,
+            orphans=True,
+            threads=8,
+            rate_limit=None,
+            checkpoint=None,
+            batch_size=100,
+            callback=None):
+        '''
+        Check stored data against the checksums recorded in the manager
+
+        Archive listings are read from the manager in batches, and every
+        object storing a version is checked for existence, for its recorded
+        size and then for its checksum on a thread pool. Afterwards the
+        services are searched for orphaned objects which no version
+        references. See :py:func:`datafs.core.verify.verify`.
+
+        Parameters
+        ----------
+
+        prefix: str
+
+            Only check archives whose names start with ``prefix``
+
+        authority_name: str
+
+            Only check archives on this authority (default all)
+
+        cache: bool
+
+            Also check the copies in the cache
+
+        quick: bool
+
+            Only check existence and sizes, without reading any data
+
+        orphans: bool
+
+            Search for unreferenced objects (default True)
+
+        threads: int
+
+            Number of objects checked concurrently (default 8)
+
+        rate_limit: float
+
+            Maximum combined read rate in bytes per second
+
+        checkpoint: str
+
+            Local file in which progress is saved, so that an interrupted
+            run can be resumed by running again with the same options
+
+        batch_size: int
+
+            Number of archives listed per manager query (default 100)
+
+        callback: function
+
+            Called with ``(checked, total)`` archive counts after each batch
+
+        Returns
+        -------
+
+        report: dict
+
+            Number of objects ``checked`` and lists of ``missing``,
+            ``corrupt``, ``orphaned`` and unreadable (``errors``) objects
+
+        '''
+
+        return integrity.verify(
+            self,
+            prefix=prefix,
+            authority_name=authority_name,
+            cache=cache,
+            quick=quick,
+            orphans=orphans,
+            threads=threads,
+            rate_limit=rate_limit,
+            checkpoint=checkpoint,
+            batch_size=batch_size,
+            callback=callback)
+
+    def replicate(
+            self,
+            src_authority,
+            dst_authority,
+            prefix=None,
+            switch=False,
+            quick=False,
+            threads=8,
+            callback=None):
+        '''
+        Copy archive data from one authority to another
+
+        Every version of the archives on ``src_authority`` is copied to the
+        same path on ``dst_authority``. Objects already stored on the
+        destination with the recorded checksum are skipped, and copied objects
+        are checked against their checksums. See
+        :py:func:`datafs.core.replication.replicate`.
+
+        Parameters
+        ----------
+
+        src_authority: str
+
+            Name of the authority to copy from
+
+        dst_authority: str
+
+            Name of the authority to copy to
+
+        prefix: str
+
+            Only replicate archives whose names start with ``prefix``
+
+        switch: bool
+
+            Move each archive to ``dst_authority`` once all of its versions
+            are stored and verified there (default False)
+
+        quick: bool
+
+            Skip objects on the destination with the recorded size without
+            reading them
+
+        threads: int
+
+            Number of concurrent transfers (default 8)
+
+        callback: function
+
+            Called with ``(archive_name, error, completed, total)`` as each
+            archive finishes
+
+        Returns
+        -------
+
+        report: dict
+
+            Numbers of objects ``copied`` and ``skipped``, the ``bytes``
+            copied, elapsed ``seconds`` and ``throughput`` in bytes per
+            second, the archives ``switched`` and ``errors`` keyed by archive
+            name
+
+        '''
+
+        return replication.replicate(
+            self,
+            src_authority,
+            dst_authority,
+            prefix=prefix,
+            switch=switch,
+            quick=quick,
+            threads=threads,
+            callback=callback)
+
+    def collect_garbage(
+            self,
+            authority_name=None,
+            cache=False,
+            prefix=None,
+            dry_run=False,
+            min_age=cleanup.MIN_AGE,
+            threads=8):
+        '''
+        Remove stored files which are not referenced by any version
+
+        Files left behind by interrupted writes and failed uploads, and
+        cached copies of deleted archives, are found by joining a walk of
+        each service against the manager's version records. See
+        :py:func:`datafs.core.cleanup.collect_garbage`.
+
+        Parameters
+        ----------
+
+        authority_name: str
+
+            Only collect garbage on this authority (default all authorities)
+
+        cache: bool
+
+            Also collect garbage in the cache
+
+        prefix: str
+
+            Only remove files whose paths start with ``prefix``.
+            Content-addressed blobs are only collected without a prefix.
+
+        dry_run: bool
+
+            Report unreferenced files without removing them
+
+        min_age: float
+
+            Only remove files last modified at least this many seconds ago
+            (default one day)
 
-        self._authorities_locked = False
-        self._manager_locked = False
+        threads: int
 
-    def attach_authority(self, service_name, service):
+            Number of concurrent removals (default 8)
 
-        if self._authorities_locked:
-            raise PermissionError('Authorities locked')
+        Returns
+        -------
 
-        self._validate_authority_name(service_name)
+        report: dict
 
-        self._authorities[service_name] = DataService(service)
+            Number of files ``scanned``, the ``orphaned`` files with their
+            ``service`` and ``path``, the number of files ``removed`` and
+            whether this was a ``dry_run``
 
-    def lock_authorities(self):
-        self._authorities_locked = True
+        '''
 
-    def lock_manager(self):
-        self._manager_locked = True
+        return cleanup.collect_garbage(
+            self,
+            authority_name=authority_name,
+            cache=cache,
+            prefix=prefix,
+            dry_run=dry_run,
+            min_age=min_age,
+            threads=threads)
 
-    def attach_cache(self, service):
+    @staticmethod
+    def _get_history_record(archive_name, history, version):
+        '''
+        Find the record of ``version`` (default latest) in a version history
 
-        if service in self._authorities.values():
-            raise ValueError('Cannot attach an authority as a cache')
-        else:
-            self._cache = DataService(service)
+        Returns
+        -------
 
-    @property
-    def manager(self):
-        return self._manager
-    # set cache attr
+        version, record : tuple
+            Version string (``None`` for unversioned or empty archives) and
+            version record (``None`` for empty archives)
+        '''
 
-    @property
-    def cache(self):
-        return self._cache
-    # get the default athority setting
+        if len(history) == 0:
+            return None, None
 
-    @property
-    def default_authority_name(self):
+        if str(history[-1]['version']) == 'None':
+            return None, history[-1]
 
-        if self.DefaultAuthorityName is not None:
-            return self.DefaultAuthorityName
+        index = VersionIndex(history)
 
-        if len(self._authorities) == 0:
-            raise ValueError(
-                'No authorities found. See attach_authority.')
+        if version is None:
+            version = index.latest
 
-        if len(self._authorities) > 1:
-            raise ValueError(
-                'Authority ambiguous. Set authority or DefaultAuthorityName.')
-        # get the zeroth key
-        return list(self._authorities.keys())[0]
+        record = index.get_record(str(version))
 
-    # Do we want to provide a method for setting authorities
-    @property
-    def default_authority(self):
-        return self._authorities[self.default_authority_name]
+        if record is not None:
+            return index.get_name(version), record
 
-    @property
-    def default_versions(self):
-        return self._default_versions
+        raise ValueError('Archive "{}" version {} not found'.format(
+            archive_name, version))
 
-    @default_versions.setter
-    def default_versions(self, default_versions):
+    def resolve_dependencies(self, archive_name, version=None, depth=None):
         '''
-        Set archive default read versions
+        Resolve the pinned dependency closure of an archive version
+
+        Dependencies are expanded breadth-first, with one batched manager
+        query per level of the dependency graph. Each (archive, version) pair
+        is expanded once, so shared dependencies and cycles are only visited
+        once. Unpinned dependencies resolve to the latest version.
 
         Parameters
         ----------
-        default_versions: dict
-            Dictionary of archive_name, version pairs. On read/download,
-            archives in this dictionary will download the specified version
-            by default. Before assignment, archive_names are checked and
-            normalized.
-        '''
 
-        default_versions = {
-            self._normalize_archive_name(arch)[1]: v
-            for arch, v in default_versions.items()}
+        archive_name: str
 
-        self._default_versions = default_versions
+            Archive whose dependencies are resolved
 
-    def attach_manager(self, manager):
+        version: str
 
-        if self._manager_locked:
-            raise PermissionError('Manager locked')
+            Version of the archive (default: :py:attr:`default_versions`,
+            then latest)
 
-        self._manager = manager
+        depth: int
 
-    def create(
-            self,
-            archive_name,
-            authority_name=None,
-            versioned=True,
-            raise_on_err=True,
-            metadata=None,
-            tags=None,
-            helper=False):
-        '''
-        Create a DataFS archive
+            Number of levels of dependencies to resolve (default all). Use
+            ``depth=1`` for direct dependencies only.
 
-        Parameters
-        ----------
+        Returns
+        -------
 
-        archive_name: str
-            Name of the archive
+        pins: dict
 
-        authority_name: str
-            Name of the data service to use as the archive's data authority
+            Versions of every archive in the closure, keyed by archive name
+            (``None`` for unversioned archives). The archive itself is not
+            included. Write each pin as ``archive==version`` to produce a
+            ``requirements_data.txt`` lock file.
 
-        versioned: bool
-            If true, store all versions with explicit version numbers (defualt)
+        Raises
+        ------
 
-        raise_on_err: bool
-            Raise an error if the archive already exists (default True)
+        KeyError
 
-        metadata: dict
-            Dictionary of additional archive metadata
+            If an archive in the closure does not exist
 
-        helper: bool
-            If true, interactively prompt for required metadata (default False)
+        ValueError
 
+            If a version in the closure does not exist, or if the closure
+            requires more than one version of an archive
 
         '''
 
-        authority_name, archive_name = self._normalize_archive_name(
-            archive_name, authority_name=authority_name)
+        archive_name = self._normalize_archive_name(archive_name)[1]
 
-        if authority_name is None:
-            authority_name = self.default_authority_name
+        if version is None:
+            version = self.default_versions.get(archive_name)
 
-        self._validate_archive_name(archive_name)
+        histories = {}
+        visited = set()
+        pins = {}
 
-        if metadata is None:
-            metadata = {}
+        frontier = [(archive_name, version)]
+        level = 0
 
-        res = self.manager.create_archive(
-            archive_name,
-            authority_name,
-            archive_path=archive_name,
-            versioned=versioned,
-            raise_on_err=raise_on_err,
-            metadata=metadata,
-            user_config=self.user_config,
-            tags=tags,
-            helper=helper)
+        while len(frontier) > 0:
 
-        return self._ArchiveConstructor(
-            api=self,
-            **res)
+            missing = set(
+                name for name, _ in frontier if name not in histories)
 
-    def get_archive(self, archive_name, default_version=None):
-        '''
-        Retrieve a data archive
+            if len(missing) > 0:
+                histories.update(
+                    self.manager.batch_get_version_history(missing))
 
-        Parameters
-        ----------
+            next_frontier = []
 
-        archive_name: str
-            Name of the archive to retrieve
+            for name, ver in frontier:
+                if name not in histories:
+                    raise KeyError('Archive "{}" not found'.format(name))
 
-        default_version: version
-            str or :py:class:`~distutils.StrictVersion` giving the default
-            version number to be used on read operations
+                ver, record = self._get_history_record(
+                    name, histories[name], ver)
 
-        Returns
-        -------
-        archive: object
-            New :py:class:`~datafs.core.data_archive.DataArchive` object
+                if (name, ver) in visited:
+                    continue
 
-        Raises
-        ------
+                visited.add((name, ver))
 
-        KeyError:
-            A KeyError is raised when the ``archive_name`` is not found
+                if level > 0:
+                    pins.setdefault(name, set()).add(ver)
 
-        '''
+                if record is None or (depth is not None and level >= depth):
+                    continue
 
-        auth, archive_name = self._normalize_archive_name(archive_name)
+                for dep, dep_version in (
+                        record.get('dependencies') or {}).items():
 
-        res = self.manager.get_archive(archive_name)
+                    next_frontier.append(
+                        (self._normalize_archive_name(dep)[1], dep_version))
 
-        if default_version is None:
-            default_version = self._default_versions.get(archive_name, None)
+            frontier = next_frontier
+            level += 1
 
-        if (auth is not None) and (auth != res['authority_name']):
+        conflicts = sorted(
+            (name, sorted(map(str, versions)))
+            for name, versions in pins.items() if len(versions) > 1)
+
+        if len(conflicts) > 0:
             raise ValueError(
-                'Archive "{}" not found on {}.'.format(archive_name, auth) +
-                ' Did you mean "{}://{}"?'.format(
-                    res['authority_name'], archive_name))
+                'Dependencies of "{}" require conflicting versions: {}'.format(
+                    archive_name, '; '.join([
+                        '{} ({})'.format(name, ', '.join(versions))
+                        for name, versions in conflicts])))
 
-        return self._ArchiveConstructor(
-            api=self,
-            default_version=default_version,
-            **res)
+        return {name: versions.pop() for name, versions in pins.items()}
 
-    def batch_get_archive(self, archive_names, default_versions=None):
+    @staticmethod
+    def _is_pinned(pin, version):
+        if pin is None:
+            return False
+
+        try:
+            return BumpableVersion(pin) == BumpableVersion(str(version))
+
+        except ValueError:
+            return pin == str(version)
+
+    def get_dependents(self, archive_name, version=None):
         '''
-        Batch version of :py:meth:`~DataAPI.get_archive`
+        Find the archive versions which depend on an archive
+
+        Dependents are found with an indexed query on the manager rather than
+        a scan of every archive's version history, so this can be used for
+        impact analysis after a bad version of an input is found.
 
         Parameters
         ----------
 
-        archive_names: list
+        archive_name: str
 
-            Iterable of archive names to retrieve
+            Archive whose dependents are returned
 
-        default_versions: str, object, or dict
+        version: str
 
-            Default versions to assign to each returned archive. May be a dict
-            with archive names as keys and versions as values, or may be a
-            version, in which case the same version is used for all archives.
-            Versions must be a strict version number string, a
-            :py:class:`~distutils.version.StrictVersion`, or a
-            :py:class:`~datafs.core.versions.BumpableVersion` object.
+            Return only dependents which pin this version of the archive
+            (default all dependents, including those which do not pin a
+            version)
 
         Returns
         -------
 
-        archives: list
+        dependents: dict
 
-            List of :py:class:`~datafs.core.data_archive.DataArchive` objects.
-            If an archive is not found, it is omitted (``batch_get_archive``
-            does not raise a ``KeyError`` on invalid archive names).
+            Sorted lists of dependent versions keyed by archive name. The
+            version is ``None`` for unversioned archives.
 
         '''
 
-        # toss prefixes and normalize names
-        archive_names = map(
-            lambda arch: self._normalize_archive_name(arch)[1],
-            archive_names)
+        archive_name = self._normalize_archive_name(archive_name)[1]
 
-        responses = self.manager.batch_get_archive(archive_names)
+        dependents = {}
 
-        archives = {}
-
-        if default_versions is None:
-            default_versions = {}
+        for dependent, pins in self.manager.get_dependents(
+                archive_name).items():
 
-        for res in responses:
-            res['archive_name'] = self._normalize_archive_name(
-                res['archive_name'])
+            versions = []
 
-            archive_name = res['archive_name']
+            for dependent_version, pin in pins.items():
+                if version is not None and not self._is_pinned(pin, version):
+                    continue
 
-            if hasattr(default_versions, 'get'):
+                versions.append(dependent_version)
 
-                # Get version number from default_versions or
-                # self._default_versions if key not present.
-                default_version = default_versions.get(
-                    archive_name,
-                    self._default_versions.get(archive_name, None))
+            if len(versions) == 0:
+                continue
 
+            if versions == [None]:
+                dependents[dependent] = versions
             else:
-                default_version = default_versions
-
-            archive = self._ArchiveConstructor(
-                api=self,
-                default_version=default_version,
-                **res)
-
-            archives[archive_name] = archive
+                dependents[dependent] = sorted(versions, key=BumpableVersion)
 
-        return archives
+        return dependents
 
     def listdir(self, location, authority_name=None):
         '''
@@ -488,8 +1641,160 @@ class DataAPI(object):
 
         archive.delete()
 
+    def batch_delete(
+            self,
+            archive_names=None,
+            query=None,
+            prefix=None,
+            threads=8,
+            batch_size=1000):
+        '''
+        Delete a set of archives
+
+        Archives are selected by name, or by tags and a prefix as in
+        :py:meth:`~DataAPI.search`. Their records are deleted from the manager
+        in batches, then their versions are removed from the authorities and
+        the cache with batched deletes (multi-object delete requests on S3)
+        on a thread pool.
+
+        .. warning::
+
+            Deleting archives will erase all of their data and metadata
+            permanently.
+
+        Content-addressed blobs may be shared with other archives and are not
+        removed. See :py:meth:`~DataAPI.collect_garbage`.
+
+        Parameters
+        ----------
+
+        archive_names: list
+
+            Names of the archives to delete. Names which are not found are
+            ignored.
+
+        query: list
+
+            Delete the archives with all of these tags
+
+        prefix: str
+
+            Delete the archives whose names start with ``prefix``
+
+        threads: int
+
+            Number of concurrent delete requests (default 8)
+
+        batch_size: int
+
+            Number of archives deleted from the manager at a time (default
+            1000)
+
+        Returns
+        -------
+
+        report: dict
+
+            The names of the archives ``deleted``, the number of stored
+            objects ``removed`` from each service (including objects which
+            were not stored there, such as uncached versions) and a list of
+            objects which could not be removed (``errors``), each with its
+            ``service``, ``path`` and a ``reason``
+
+        '''
+
+        if archive_names is None:
+            if query is None and prefix is None:
+                raise ValueError(
+                    'Archive names, a query or a prefix are required')
+
+            archive_names = self.search(*(query or []), prefix=prefix)
+
+        elif query is not None or prefix is not None:
+            raise ValueError(
+                'Archive names cannot be combined with a query or prefix')
+
+        archive_names = [
+            self._normalize_archive_name(archive_name)[1]
+            for archive_name in archive_names]
+
+        report = {'deleted': [], 'removed': 0, 'errors': []}
+
+        tasks = []
+        pool = ThreadPool(threads)
+
+        try:
+            for start in range(0, len(archive_names), batch_size):
+                batch = archive_names[start:start + batch_size]
+
+                archives, histories = self._batch_get_archive(
+                    batch, include_history=True)
+
+                paths = {}
+
+                for archive_name, archive in archives.items():
+                    for obj in integrity.get_objects(
+                            archive, histories[archive_name], blobs=False):
+
+                        paths.setdefault(
+                            archive.authority_name, set()).add(obj['path'])
+
+                self.manager.batch_delete_archive_records(
+                    list(archives.keys()))
+
+                report['deleted'].extend(sorted(archives.keys()))
+
+                services = [
+                    (authority_name, self._authorities.get(authority_name),
+                        sorted(authority_paths))
+                    for authority_name, authority_paths in paths.items()]
+
+                if self.cache:
+                    services.append(('cache', self.cache, sorted(
+                        set().union(*paths.values()))))
+
+                for service_name, service, service_paths in services:
+                    if service is None:
+                        report['errors'].extend([{
+                            'service': service_name,
+                            'path': path,
+                            'reason': 'Authority "{}" not found'.format(
+                                service_name)}
+                            for path in service_paths])
+
+                        continue
+
+                    for i in range(
+                            0, len(service_paths), transfer.MAX_DELETE_KEYS):
+
+                        chunk = service_paths[i:i + transfer.MAX_DELETE_KEYS]
+
+                        tasks.append((service_name, chunk, pool.apply_async(
+                            transfer.remove_files, (service.fs, chunk))))
+
+            for service_name, chunk, task in tasks:
+                try:
+                    failed = task.get()
+
+                except Exception as e:
+                    failed = dict(
+                        (path, '{}: {}'.format(type(e).__name__, e))
+                        for path in chunk)
+
+                report['removed'] += len(chunk) - len(failed)
+
+                report['errors'].extend([
+                    {'service': service_name, 'path': path, 'reason': reason}
+                    for path, reason in sorted(failed.items())])
+
+        finally:
+            pool.close()
+            pool.join()
+
+        return report
+
     @staticmethod
-    def hash_file(f):
+    def hash_file(f, algorithm='md5', chunk_size=None):
         '''
         Utility function for hashing file contents
 
@@ -501,23 +1806,32 @@ class DataAPI(object):
         f: file-like
             File-like object or file path from which to compute checksum value
 
+        algorithm: str
+            Name of the hash algorithm to use (default 'md5'). See
+            :py:func:`datafs.core.hashing.available_algorithms`.
+
+        chunk_size: int
+            Chunk size used by ``-tree`` algorithms (default
+            :py:data:`datafs.core.hashing.TREE_CHUNK_SIZE`)
+
 
         Returns
         -------
         checksum: dict
-            dictionary with {'algorithm': 'md5', 'checksum': hexdigest}
+            dictionary with {'algorithm': algorithm, 'checksum': hexdigest,
+            'size': size}. Tree algorithms also return ``chunk_size`` and
+            ``chunks``. All keys except ``chunks`` are stored in the version
+            record. The chunk digests are stored on the authority.
 
         '''
 
-        md5 = hashlib.md5()
-
-        with open_filelike(f, 'rb') as f_obj:
-            for chunk in iter(lambda: f_obj.read(128 * md5.block_size), b''):
-                md5.update(chunk)
-
-        return {'algorithm': 'md5', 'checksum': md5.hexdigest()}
+        return hashing.hash_filelike(
+            f, algorithm=algorithm, chunk_size=chunk_size)
 
     def close(self):
+        if self._journal is not None:
+            self._journal.close()
+
         for service in self._authorities:
             self._authorities[service].fs.close()
 
@@ -575,7 +1889,13 @@ class DataAPI(object):
                 raise ValueError('Authority "{}" not found'.format(
                     str_authority_name))
 
-            self._authorities[str_authority_name].fs.validatepath(relpath)
+            authority_fs = self._authorities[str_authority_name].fs
+
+            # don't connect lazily created services (see
+            # datafs.services.lazy) just to look up or create an archive.
+            # Paths are checked on the authority when data is written.
+            if getattr(authority_fs, 'connected', True):
+                authority_fs.validatepath(relpath)
 
         # additional check - not all fs.validatepath functions do anything:
         OSFS('').isvalidpath(relpath)
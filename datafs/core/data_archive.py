@@ -1,16 +1,24 @@
 from __future__ import absolute_import
 
 from datafs.core import data_file
-from datafs.core.versions import BumpableVersion
-from datafs._compat import string_types
+from datafs.core import hashing
+from datafs.core import chunking
+from datafs.core import ranged
+from datafs.core.versions import BumpableVersion, VersionIndex
+from datafs.services import transfer
+from datafs._compat import string_types, read_only_buffer
 from contextlib import contextmanager
 from fs.osfs import OSFS
-import fs.utils
 import fs.path
 import click
+import io
+import json
 import os
+import mmap
+import stat
 import textwrap
 import time
+import warnings
 
 
 def _process_version(self, version):
@@ -33,6 +41,66 @@ def _process_version(self, version):
         return BumpableVersion(version)
 
 
+def _in_history(history, version_record):
+    '''
+    Check whether a version record has already been registered in history
+
+    Examples
+    --------
+
+    .. code-block:: python
+
+        >>> history = [
+        ...     {'version': '0.0.1', 'checksum': 'a'},
+        ...     {'version': '0.0.2', 'checksum': 'b'}]
+        >>> _in_history(history, {'version': '0.0.1', 'checksum': 'a'})
+        True
+        >>> _in_history(history, {'version': '0.0.3', 'checksum': 'c'})
+        False
+
+    '''
+
+    def matches(record):
+        return (
+            str(record.get('version')) == str(version_record.get('version'))
+            and record['checksum'] == version_record['checksum'])
+
+    if len(history) == 0:
+        return False
+
+    # unversioned archives repeat versions, so only the latest record can be
+    # the same write
+    if str(version_record.get('version')) == 'None':
+        return matches(history[-1])
+
+    return any(matches(record) for record in history)
+
+
+def _get_blob_path(checksum, algorithm, compression=None):
+    '''
+    Returns the content-addressed storage path for a checksum
+
+    Examples
+    --------
+
+    .. code-block:: python
+
+        >>> print(_get_blob_path('5a8dd3ad0756a93ded72b823b19dd877', 'md5'))
+        .blobs/md5/5a/5a8dd3ad0756a93ded72b823b19dd877
+        >>>
+        >>> print(_get_blob_path('5a8dd3ad', 'md5', compression='gzip'))
+        .blobs/md5/5a/5a8dd3ad.gzip
+
+    '''
+
+    filename = checksum
+
+    if compression is not None:
+        filename = '{}.{}'.format(checksum, compression)
+
+    return fs.path.join('.blobs', algorithm, checksum[:2], filename)
+
+
 class DataArchive(object):
 
     def __init__(
@@ -42,7 +110,8 @@ class DataArchive(object):
             authority_name,
             archive_path,
             versioned=True,
-            default_version=None):
+            default_version=None,
+            compression=None):
 
         self.api = api
         self.archive_name = archive_name
@@ -52,6 +121,10 @@ class DataArchive(object):
 
         self._versioned = versioned
         self._default_version = default_version
+        self._compression = compression
+
+        self._version_index = None
+        self._manifest = None
 
     def __repr__(self):
         return "<{} {}://{}>".format(self.__class__.__name__,
@@ -69,49 +142,47 @@ class DataArchive(object):
     def versioned(self):
         return self._versioned
 
-    def get_latest_version(self):
-
-        versions = self.get_versions()
+    @property
+    def compression(self):
+        '''
+        Compression codec used to store new versions of this archive
 
-        if len(versions) == 0:
-            return None
+        The archive's own codec if it was created with one, otherwise the
+        API's :py:attr:`~datafs.DataAPI.compression` setting.
+        '''
 
-        else:
-            return max(versions)
+        if self._compression is not None:
+            return self._compression
 
-    def get_versions(self):
+        return self.api.compression
 
-        versions = self.get_history()
+    def get_latest_version(self):
 
-        if len(versions) == 0:
-            return []
+        return self._get_version_index().latest
 
-        elif not self.versioned:
-            return [None]
+    def get_versions(self):
 
-        else:
-            return sorted(map(BumpableVersion, set(
-                [v['version'] for v in versions])))
+        return self._get_version_index().versions
 
     def get_default_version(self):
 
+        return self._get_default_version()
+
+    def _get_default_version(self, index=None):
+
         if not self.versioned:
             return None
 
-        versions = self.get_versions()
+        if index is None:
+            index = self._get_version_index()
 
         if self._default_version is None or self._default_version == 'latest':
-            if len(versions) == 0:
-                return None
+            return index.latest
 
-            return max(versions)
+        version = index.get_version(self._default_version)
 
-        matches = filter(
-            lambda v: v == self._default_version,
-            self.get_versions())
-
-        if len(matches) > 0:
-            return max(matches)
+        if version is not None:
+            return version
 
         raise ValueError('Archive "{}" version {} not found'.format(
             self.archive_name, self._default_version))
@@ -122,7 +193,8 @@ class DataArchive(object):
 
         If the archive is versioned, the version number is used as the file
         path and the archive path is the directory. If not, the archive path is
-        used as the file path.
+        used as the file path. Content-addressed versions are stored elsewhere;
+        use :py:meth:`get_storage_path` to locate a version's data.
 
         Parameters
         ----------
@@ -161,6 +233,38 @@ class DataArchive(object):
         else:
             return self.archive_path
 
+    def get_storage_path(self, version=None):
+        '''
+        Returns the path at which a version's data is stored
+
+        Versions written in content-addressed mode (see
+        :py:attr:`~datafs.DataAPI.content_addressed`) record the path of the
+        blob holding their data. All other versions are stored at
+        :py:meth:`get_version_path`.
+
+        Parameters
+        ----------
+        version : str or object
+            Version number (default latest unless ``default_version`` set)
+        '''
+
+        version = _process_version(self, version)
+
+        try:
+            record = self._get_version_record(version)
+
+        except ValueError:
+            record = None
+
+        return self._get_storage_path(version, record)
+
+    def _get_storage_path(self, version, version_record):
+
+        if version_record is not None and version_record.get('path'):
+            return version_record['path']
+
+        return self.get_version_path(version)
+
     @property
     def authority_name(self):
         return self._authority_name
@@ -177,27 +281,166 @@ class DataArchive(object):
         return self.api.manager.get_metadata(self.archive_name)
 
     def get_history(self):
-        return self.api.manager.get_version_history(self.archive_name)
+
+        return self._add_pending_versions(
+            self.api.manager.get_version_history(self.archive_name))
+
+    def _add_pending_versions(self, history):
+        '''
+        Return a copy of a fetched version history with pending writes added
+        '''
+
+        pending = self.api._get_pending_versions(self.archive_name)
+        history = list(history)
+
+        # versions written behind are included until they are registered
+        for version_record in pending:
+            if not _in_history(history, version_record):
+                history.append(version_record)
+
+        return history
+
+    def _get_version_index(self, history=None):
+        '''
+        Return a :py:class:`~datafs.core.versions.VersionIndex` of the history
+
+        The history is fetched on each call (unless given), so versions
+        written by other users are always seen. The index is only rebuilt
+        when the history has changed since it was last built.
+        '''
+
+        if history is None:
+            history = self.get_history()
+
+        index = self._version_index
+
+        if index is None or index.history != history:
+            index = VersionIndex(history, self.versioned)
+            self._version_index = index
+
+        return index
+
+    def _is_registered(self, version_metadata):
+        return _in_history(
+            self.api.manager.get_version_history(self.archive_name),
+            version_metadata)
+
+    def _writes_behind(self):
+        '''
+        Whether new versions are staged in the cache and written behind
+
+        See :py:meth:`~datafs.DataAPI.enable_write_behind`. Unversioned
+        archives overwrite their data in place, so they are only written
+        behind when new versions are content-addressed.
+        '''
+
+        return self.api.write_behind and not self._stores_chunks() and (
+            self.versioned or self.api.content_addressed)
+
+    def _stores_chunks(self):
+        '''
+        Whether new versions are stored as content-defined chunks
+
+        See :py:attr:`~datafs.DataAPI.chunked_storage`. Versions are stored
+        as whole files if :py:mod:`~datafs.core.chunking` is not available.
+        '''
+
+        if not self.api.chunked_storage:
+            return False
+
+        if not chunking.available():
+            warnings.warn(
+                'Chunked storage requires the fastcdc package. Storing '
+                'whole files.', RuntimeWarning)
+
+            return False
+
+        return True
 
     def get_latest_hash(self):
         return self.api.manager.get_latest_hash(self.archive_name)
 
     def get_version_hash(self, version=None):
         version = _process_version(self, version)
-        if self.versioned:
 
-            if version is None:
-                return None
+        record = self._get_version_record(version)
 
-            for ver in self.get_history():
-                if BumpableVersion(ver['version']) == version:
-                    return ver['checksum']
+        if record is None:
+            return None
 
+        return record['checksum']
+
+    def _get_version_record(self, version, index=None):
+        '''
+        Return the version history record for a processed ``version``
+
+        Returns ``None`` if the archive has no versions (or if ``version`` is
+        ``None`` on a versioned archive).
+        '''
+
+        if index is None:
+            index = self._get_version_index()
+
+        if not self.versioned:
+            return index.latest_record
+
+        if version is None:
+            return None
+
+        record = index.get_record(version)
+
+        if record is None:
             raise ValueError(
                 'Version "{}" not found in archive history'.format(version))
 
+        return record
+
+    def _get_hasher(self, version_record=None):
+        '''
+        Return a file hashing function for checking against a version record
+
+        Records are verified using the algorithm stored with them, so versions
+        written before :py:attr:`~datafs.DataAPI.hash_algorithm` was changed
+        remain valid. New content is hashed with the API's algorithm.
+        '''
+
+        if version_record is None:
+            algorithm = self.api.hash_algorithm
+            chunk_size = self.api.hash_chunk_size
         else:
-            return self.get_latest_hash()
+            algorithm = version_record.get('algorithm', 'md5')
+            chunk_size = version_record.get('chunk_size')
+
+            # DynamoDB returns numbers as Decimal objects
+            if chunk_size is not None:
+                chunk_size = int(chunk_size)
+
+        def hasher(f):
+            return self.api.hash_file(
+                f, algorithm=algorithm, chunk_size=chunk_size)
+
+        return hasher
+
+    def _get_write_hasher(self, version_record):
+        '''
+        Return the hasher for new content replacing ``version_record``
+
+        Returns ``None`` if new content is hashed as the record was, so the
+        record's hasher can be used for both.
+        '''
+
+        if version_record is None:
+            return None
+
+        algorithm = version_record.get('algorithm', 'md5')
+        chunk_size = version_record.get('chunk_size')
+
+        if algorithm == self.api.hash_algorithm and (
+                chunk_size is None or int(chunk_size) == (
+                    self.api.hash_chunk_size or hashing.TREE_CHUNK_SIZE)):
+            return None
+
+        return self._get_hasher()
 
     def update(
             self,
@@ -248,14 +491,32 @@ class DataArchive(object):
         if metadata is None:
             metadata = {}
 
-        latest_version = self.get_latest_version()
+        history = self.get_history()
+        latest_version = self._get_version_index(history).latest
+
+        latest_record = history[-1] if len(history) > 0 else None
+
+        hashval = self._get_hasher()(filepath)
+
+        checksum = hashval.pop('checksum')
+        algorithm = hashval.pop('algorithm')
 
-        hashval = self.api.hash_file(filepath)
+        if latest_record is None:
+            unchanged = False
 
-        checksum = hashval['checksum']
-        algorithm = hashval['algorithm']
+        elif (
+                (latest_record.get('algorithm', 'md5') == algorithm) and
+                (latest_record.get('chunk_size') ==
+                    hashval.get('chunk_size'))):
+            unchanged = (checksum == latest_record['checksum'])
 
-        if checksum == self.get_latest_hash():
+        else:
+            # compare against records written with a different algorithm
+            unchanged = (
+                self._get_hasher(latest_record)(filepath)['checksum'] ==
+                latest_record['checksum'])
+
+        if unchanged:
             self.update_metadata(metadata)
 
             if remove and os.path.isfile(filepath):
@@ -275,17 +536,30 @@ class DataArchive(object):
         else:
             next_version = None
 
-        next_path = self.get_version_path(next_version)
+        codec = self.compression
+        staged_path = None
 
-        if cache:
-            self.cache(next_version)
+        if codec is not None:
+            hashval['compression'] = codec
 
-        if self.is_cached(next_version):
-            self.authority.upload(filepath, next_path)
-            self.api.cache.upload(filepath, next_path, remove=remove)
+        if self._stores_chunks():
+            hashval.update(self._store_chunks(
+                filepath, next_version, codec, cache=cache, remove=remove))
 
         else:
-            self.authority.upload(filepath, next_path, remove=remove)
+            if self.api.content_addressed:
+                hashval['path'] = _get_blob_path(checksum, algorithm, codec)
+
+            next_path = hashval.get(
+                'path', self.get_version_path(next_version))
+
+            if self._writes_behind():
+                staged_path = next_path
+                self._stage_file(filepath, next_path, codec, remove=remove)
+
+            else:
+                self._store_file(
+                    filepath, next_path, codec, cache=cache, remove=remove)
 
         self._update_manager(
             archive_metadata=metadata,
@@ -294,7 +568,317 @@ class DataArchive(object):
                 algorithm=algorithm,
                 version=next_version,
                 dependencies=dependencies,
-                message=message))
+                message=message,
+                **hashval),
+            staged_path=staged_path)
+
+    def _store_file(
+            self,
+            filepath,
+            next_path,
+            codec,
+            cache=False,
+            remove=False):
+        '''
+        Upload a new version's data to the authority (and cache)
+        '''
+
+        self.authority.fs.validatepath(next_path)
+
+        if cache:
+            if not self.api.cache:
+                raise ValueError('No cache attached')
+
+            data_file._touch(self.api.cache.fs, next_path)
+
+        # content-addressed blobs already present on a service are identical
+        upload_to_authority = not (
+            self.api.content_addressed and
+            self.authority.fs.isfile(next_path))
+
+        if self.api.cache and self.api.cache.fs.isfile(next_path):
+
+            if upload_to_authority:
+                self.authority.upload(filepath, next_path, compression=codec)
+
+            if self.api.content_addressed and (
+                    self.api.cache.fs.getsize(next_path) > 0):
+
+                if remove:
+                    os.remove(filepath)
+
+            else:
+                self.api.cache.upload(
+                    filepath, next_path, remove=remove, compression=codec)
+
+        elif upload_to_authority:
+            self.authority.upload(
+                filepath, next_path, remove=remove, compression=codec)
+
+        elif remove:
+            os.remove(filepath)
+
+    def _stage_file(self, filepath, next_path, codec, remove=False):
+        '''
+        Store a new version's data in the cache for upload by the journal
+        '''
+
+        if self.api.content_addressed and (
+                self.api.cache.fs.isfile(next_path) and
+                self.api.cache.fs.getsize(next_path) > 0):
+
+            if remove:
+                os.remove(filepath)
+
+            return
+
+        self.api.cache.upload(
+            filepath, next_path, remove=remove, compression=codec)
+
+    def _store_chunks(
+            self,
+            filepath,
+            next_version,
+            codec,
+            cache=False,
+            remove=False):
+        '''
+        Store a new version's data as content-addressed chunks
+
+        Only chunks not already present on the authority (and, if the version
+        is cached, the cache) are written. The manifest of ``[digest, size]``
+        pairs is stored as a blob addressed by its own digest, keeping the
+        version record small however large the file.
+
+        Returns
+        -------
+        manifest : dict
+            ``manifest_algorithm`` used to address the chunks and the
+            manifest, and the ``manifest_checksum`` of the manifest blob
+        '''
+
+        next_path = self.get_version_path(next_version)
+
+        if cache:
+            if not self.api.cache:
+                raise ValueError('No cache attached')
+
+            data_file._touch(self.api.cache.fs, next_path)
+
+        services = [self.authority]
+
+        if self.api.cache and self.api.cache.fs.isfile(next_path):
+            services.append(self.api.cache)
+
+        algorithm = hashing.split_algorithm(self.api.hash_algorithm)[0]
+        manifest = []
+
+        for chunk in chunking.iter_chunks(filepath):
+            hasher = hashing.get_hasher(algorithm)
+            hasher.update(chunk)
+            digest = hasher.hexdigest()
+
+            chunk_path = _get_blob_path(digest, algorithm, codec)
+
+            for service in services:
+                if not service.fs.isfile(chunk_path):
+                    data_file._put_chunk(
+                        service.fs, chunk_path, chunk, codec)
+
+            manifest.append([digest, len(chunk)])
+
+        data = json.dumps(manifest, separators=(',', ':')).encode('utf-8')
+
+        hasher = hashing.get_hasher(algorithm)
+        hasher.update(data)
+        manifest_checksum = hasher.hexdigest()
+
+        manifest_path = self._get_manifest_path({
+            'manifest_algorithm': algorithm,
+            'manifest_checksum': manifest_checksum})
+
+        for service in services:
+            if not service.fs.isfile(manifest_path):
+                data_file._put_chunk(service.fs, manifest_path, data, None)
+
+        if remove:
+            os.remove(filepath)
+
+        return {
+            'manifest_algorithm': algorithm,
+            'manifest_checksum': manifest_checksum}
+
+    @staticmethod
+    def _get_manifest_path(version_record):
+        return _get_blob_path(
+            version_record['manifest_checksum'],
+            version_record['manifest_algorithm'])
+
+    @staticmethod
+    def _is_chunked(version_record):
+        return (version_record is not None) and (
+            ('manifest_checksum' in version_record) or
+            ('manifest' in version_record))
+
+    def _get_manifest(self, version_record, use_cache=False):
+        '''
+        Return the ``[digest, size]`` pairs of a chunked version's chunks
+        '''
+
+        # versions written before the manifest was stored separately
+        if 'manifest' in version_record:
+            return version_record['manifest']
+
+        checksum = version_record['manifest_checksum']
+
+        if self._manifest is not None and self._manifest[0] == checksum:
+            return self._manifest[1]
+
+        with data_file._open_chunk(
+                self.authority,
+                self.api.cache,
+                self._get_manifest_path(version_record),
+                None,
+                use_cache=use_cache) as f:
+
+            manifest = json.loads(f.read().decode('utf-8'))
+
+        # manifests are content-addressed, so a cached copy never goes stale
+        self._manifest = (checksum, manifest)
+
+        return manifest
+
+    @staticmethod
+    def _get_chunk_digests_path(version_record):
+        '''
+        Return the path of the chunk digests of a tree-hashed version
+
+        The digests are stored as a blob addressed by the tree checksum,
+        which is their digest with the base algorithm (see
+        :py:func:`~datafs.core.hashing.pack_chunk_digests`).
+        '''
+
+        return _get_blob_path(
+            version_record['checksum'],
+            hashing.split_algorithm(version_record['algorithm'])[0])
+
+    def _store_chunk_digests(self, version_metadata, chunks):
+        path = self._get_chunk_digests_path(version_metadata)
+
+        if not self.authority.fs.isfile(path):
+            data_file._put_chunk(
+                self.authority.fs,
+                path,
+                hashing.pack_chunk_digests(chunks),
+                None)
+
+    def _get_chunk_digests(self, version_record):
+        # versions written before the digests were stored separately
+        if 'chunks' in version_record:
+            return version_record['chunks']
+
+        with data_file._open_chunk(
+                self.authority,
+                self.api.cache,
+                self._get_chunk_digests_path(version_record),
+                None) as f:
+
+            data = f.read()
+
+        return hashing.unpack_chunk_digests(
+            data, version_record['algorithm'])
+
+    def _get_chunk_paths(self, version_record, use_cache=False):
+        return [
+            _get_blob_path(
+                digest,
+                version_record['manifest_algorithm'],
+                version_record.get('compression'))
+            for digest, _ in self._get_manifest(version_record, use_cache)]
+
+    def _copy_version(self, version, version_record, dst_fs, dst_path):
+        '''
+        Write the decoded contents of a version to ``dst_path`` on ``dst_fs``
+        '''
+
+        if version_record is None:
+            version_record = {}
+
+        if self._is_chunked(version_record):
+            data_file._copy_chunked(
+                self.authority,
+                self.api.cache,
+                self._get_chunk_paths(version_record),
+                dst_fs,
+                dst_path,
+                version_record.get('compression'),
+                use_cache=self.is_cached(version))
+
+            return
+
+        read_path = self._get_storage_path(version, version_record)
+
+        def version_check(chk):
+            return chk['checksum'] == version_record.get('checksum')
+
+        with data_file._choose_read_fs(
+                self.authority,
+                self.api.cache,
+                read_path,
+                version_check,
+                self._get_hasher(version_record or None),
+                version_record.get('compression')) as read_fs:
+
+            data_file._copy_decoded(
+                read_fs,
+                read_path,
+                dst_fs,
+                dst_path,
+                version_record.get('compression'))
+
+    @contextmanager
+    def _get_chunked_local_path(
+            self,
+            version,
+            version_record,
+            readwrite_mode=True,
+            **update_kwargs):
+        '''
+        Assemble a version locally and store changes with :py:meth:`update`
+
+        Used for reading and writing chunked versions and for writing new
+        versions when :py:attr:`~datafs.DataAPI.chunked_storage` or
+        write-behind is enabled.
+        '''
+
+        with data_file._get_write_fs() as write_fs:
+            local_path = fs.path.basename(self.archive_path)
+
+            if readwrite_mode and version_record is not None:
+                self._copy_version(
+                    version, version_record, write_fs, local_path)
+
+            else:
+                data_file._touch(write_fs, local_path)
+
+            yield write_fs.getsyspath(local_path)
+
+            if not write_fs.isfile(local_path):
+                raise OSError(
+                    'Local file removed during execution. '
+                    'Archive not updated.')
+
+            if write_fs.getsize(local_path) == 0:
+                return
+
+            filepath = write_fs.getsyspath(local_path)
+
+            if version_record is not None and (
+                    self._get_hasher(version_record)(filepath)['checksum'] ==
+                    version_record['checksum']):
+                return
+
+            self.update(filepath, **update_kwargs)
 
     def _get_default_dependencies(self):
         '''
@@ -327,7 +911,11 @@ class DataArchive(object):
         if version_metadata.get('dependencies', None) is None:
             version_metadata['dependencies'] = self._get_default_dependencies()
 
-    def _update_manager(self, archive_metadata=None, version_metadata=None):
+    def _update_manager(
+            self,
+            archive_metadata=None,
+            version_metadata=None,
+            staged_path=None):
 
         if archive_metadata is None:
             archive_metadata = {}
@@ -337,6 +925,22 @@ class DataArchive(object):
 
         self._set_version_defaults(version_metadata)
 
+        # tree chunk digests are too large for the version record
+        chunks = version_metadata.pop('chunks', None)
+
+        if chunks is not None:
+            self._store_chunk_digests(version_metadata, chunks)
+
+        # versions staged in the cache are registered by the journal
+        if staged_path is not None:
+            self.api._journal_version(
+                self.archive_name,
+                staged_path,
+                archive_metadata,
+                version_metadata)
+
+            return
+
         # update records in self.api.manager
         self.api.manager.update(self.archive_name, version_metadata)
         self.update_metadata(archive_metadata)
@@ -403,7 +1007,9 @@ class DataArchive(object):
         latest_version = self.get_latest_version()
         version = _process_version(self, version)
 
-        version_hash = self.get_version_hash(version)
+        version_record = self._get_version_record(version)
+        version_hash = None if version_record is None else (
+            version_record['checksum'])
 
         if self.versioned:
 
@@ -420,20 +1026,78 @@ class DataArchive(object):
 
             assert next_version > latest_version, msg
 
-            read_path = self.get_version_path(version)
+            read_path = self._get_storage_path(version, version_record)
             write_path = self.get_version_path(next_version)
 
         else:
-            read_path = self.archive_path
+            read_path = self._get_storage_path(None, version_record)
             write_path = self.archive_path
             next_version = None
 
+        chunked = self._is_chunked(version_record)
+
+        write_mode = ('w' in mode) or ('a' in mode) or ('+' in mode)
+
+        if chunked and not write_mode:
+            opener = data_file.open_chunked(
+                self.authority,
+                self.api.cache,
+                self._get_chunk_paths(version_record),
+                version_record.get('compression'),
+                mode,
+                use_cache=self.is_cached(version),
+                **kwargs)
+
+            with opener as f:
+                yield f
+
+            return
+
+        if write_mode and (
+                chunked or self._stores_chunks() or self._writes_behind()):
+            readwrite_mode = ('a' in mode) or (
+                ('r' in mode) and ('+' in mode))
+
+            path = self._get_chunked_local_path(
+                version,
+                version_record,
+                readwrite_mode,
+                bumpversion=bumpversion,
+                prerelease=prerelease,
+                dependencies=dependencies,
+                metadata=metadata,
+                message=message)
+
+            with path as fp:
+                with io.open(fp, mode, *args, **kwargs) as f:
+                    yield f
+
+            return
+
         # version_check returns true if fp's hash is current as of read
         def version_check(chk):
             return chk['checksum'] == version_hash
 
         # Updater updates the manager with the latest version number
-        def updater(checksum, algorithm):
+        read_compression = None if version_record is None else (
+            version_record.get('compression'))
+
+        write_compression = self.compression
+
+        def blob_path_for(checksum):
+            return _get_blob_path(
+                checksum['checksum'],
+                checksum['algorithm'],
+                write_compression)
+
+        def updater(checksum, algorithm, **hash_metadata):
+            if write_compression is not None:
+                hash_metadata['compression'] = write_compression
+
+            if self.api.content_addressed:
+                hash_metadata['path'] = _get_blob_path(
+                    checksum, algorithm, write_compression)
+
             self._update_manager(
                 archive_metadata=metadata,
                 version_metadata=dict(
@@ -441,17 +1105,21 @@ class DataArchive(object):
                     dependencies=dependencies,
                     checksum=checksum,
                     algorithm=algorithm,
-                    message=message))
+                    message=message,
+                    **hash_metadata))
 
         opener = data_file.open_file(
             self.authority,
             self.api.cache,
             updater,
             version_check,
-            self.api.hash_file,
+            self._get_hasher(version_record),
             read_path,
-            write_path,
+            blob_path_for if self.api.content_addressed else write_path,
             mode=mode,
+            read_compression=read_compression,
+            write_compression=write_compression,
+            write_hasher=self._get_write_hasher(version_record),
             *args,
             **kwargs)
 
@@ -466,7 +1134,8 @@ class DataArchive(object):
             prerelease=None,
             dependencies=None,
             metadata=None,
-            message=None):
+            message=None,
+            mode='r+'):
         '''
         Returns a local path for read/write
 
@@ -495,15 +1164,42 @@ class DataArchive(object):
             Updates to archive metadata. Pass {key: None} to remove a key from
             the archive's metadata.
 
+        mode : str
+            ``'r+'`` (default) yields a temporary copy of the file, which is
+            stored as a new version on exit if it was modified. ``'w'``
+            yields an empty temporary file, skipping the copy of the current
+            contents, for callers which overwrite the file. The current
+            contents are never copied in this mode: writes to a local path
+            by other code can't be intercepted, so the copy can't be deferred
+            until the file is first modified. Use ``'r+'`` to edit the
+            current contents. ``'r'`` is
+            read-only: on an OSFS authority, or if the archive is cached, the
+            stored file's own path is returned without copying, and no check
+            for changes is made on exit. Files opened with ``'r'`` must not be
+            modified.
+
         '''
 
+        if mode not in ('r', 'r+', 'w'):
+            raise ValueError(
+                'Mode "{}" not supported. Choose from r, r+, w'.format(mode))
+
         if metadata is None:
             metadata = {}
 
         latest_version = self.get_latest_version()
         version = _process_version(self, version)
 
-        version_hash = self.get_version_hash(version)
+        version_record = self._get_version_record(version)
+
+        if mode == 'r':
+            with self._get_read_syspath(version, version_record) as fp:
+                yield fp
+
+            return
+
+        version_hash = None if version_record is None else (
+            version_record['checksum'])
 
         if self.versioned:
 
@@ -520,20 +1216,56 @@ class DataArchive(object):
 
             assert next_version > latest_version, msg
 
-            read_path = self.get_version_path(version)
+            read_path = self._get_storage_path(version, version_record)
             write_path = self.get_version_path(next_version)
 
         else:
-            read_path = self.archive_path
+            read_path = self._get_storage_path(None, version_record)
             write_path = self.archive_path
             next_version = None
 
+        if self._stores_chunks() or self._writes_behind() or (
+                self._is_chunked(version_record)):
+
+            path = self._get_chunked_local_path(
+                version,
+                version_record,
+                readwrite_mode=(mode == 'r+'),
+                bumpversion=bumpversion,
+                prerelease=prerelease,
+                dependencies=dependencies,
+                metadata=metadata,
+                message=message)
+
+            with path as fp:
+                yield fp
+
+            return
+
         # version_check returns true if fp's hash is current as of read
         def version_check(chk):
             return chk['checksum'] == version_hash
 
         # Updater updates the manager with the latest version number
-        def updater(checksum, algorithm):
+        read_compression = None if version_record is None else (
+            version_record.get('compression'))
+
+        write_compression = self.compression
+
+        def blob_path_for(checksum):
+            return _get_blob_path(
+                checksum['checksum'],
+                checksum['algorithm'],
+                write_compression)
+
+        def updater(checksum, algorithm, **hash_metadata):
+            if write_compression is not None:
+                hash_metadata['compression'] = write_compression
+
+            if self.api.content_addressed:
+                hash_metadata['path'] = _get_blob_path(
+                    checksum, algorithm, write_compression)
+
             self._update_manager(
                 archive_metadata=metadata,
                 version_metadata=dict(
@@ -541,20 +1273,263 @@ class DataArchive(object):
                     dependencies=dependencies,
                     checksum=checksum,
                     algorithm=algorithm,
-                    message=message))
+                    message=message,
+                    **hash_metadata))
 
         path = data_file.get_local_path(
             self.authority,
             self.api.cache,
             updater,
             version_check,
-            self.api.hash_file,
+            self._get_hasher(version_record),
+            read_path,
+            blob_path_for if self.api.content_addressed else write_path,
+            read_compression=read_compression,
+            write_compression=write_compression,
+            mode=mode,
+            write_hasher=self._get_write_hasher(version_record))
+
+        with path as fp:
+            yield fp
+
+    @contextmanager
+    def open_ranged(
+            self,
+            mode='rb',
+            version=None,
+            block_size=None,
+            **kwargs):
+        '''
+        Opens a version for random-access reading
+
+        Unlike :py:meth:`open`, only the byte ranges which are read are
+        fetched from the authority, using ranged GET requests on S3. If the
+        cache holds a complete copy of the version, it is read directly.
+        Otherwise, if the archive is cached (see :py:meth:`cache`), fetched
+        blocks are kept in a sparse block cache on the cache filesystem and
+        reused by later reads.
+
+        Parameters
+        ----------
+        mode : str
+            Read mode (default 'rb'). Text modes wrap the stream in a
+            :py:class:`io.TextIOWrapper`, and ``kwargs`` (e.g. ``encoding``)
+            are passed to the wrapper.
+
+        version : str
+            Version number of the file to open (default latest)
+
+        block_size : int
+            Size in bytes of the blocks fetched and cached (default
+            :py:data:`datafs.core.ranged.BLOCK_SIZE`)
+
+        Raises
+        ------
+        ValueError
+            A ValueError is raised for write modes, for archives with no
+            versions, and for compressed or chunked versions, which cannot be
+            read by byte range.
+        '''
+
+        if ('w' in mode) or ('a' in mode) or ('+' in mode):
+            raise ValueError('Ranged files can only be opened for reading')
+
+        if block_size is None:
+            block_size = ranged.BLOCK_SIZE
+
+        version = _process_version(self, version)
+        version_record = self._get_version_record(version)
+
+        if version_record is None:
+            raise ValueError(
+                'Archive "{}" has no versions to read'.format(
+                    self.archive_name))
+
+        if ('compression' in version_record) or (
+                self._is_chunked(version_record)):
+            raise ValueError(
+                'Compressed and chunked versions do not support ranged reads')
+
+        read_path = self._get_storage_path(version, version_record)
+
+        if self._has_cached_copy(version, version_record):
+            cache_fs = self.api.cache.fs
+
+            if cache_fs.hassyspath(read_path):
+                f = io.open(
+                    cache_fs.getsyspath(read_path),
+                    'rb',
+                    buffering=block_size)
+
+            else:
+                f = io.BufferedReader(
+                    ranged.RangedReader(
+                        cache_fs, read_path, cache_fs.getsize(read_path)),
+                    buffer_size=block_size)
+
+        else:
+            size = self.authority.fs.getsize(read_path)
+
+            block_cache = None
+
+            if self.is_cached(version):
+                block_cache = ranged.BlockCache(
+                    self.api.cache.fs,
+                    ranged.get_block_cache_path(
+                        version_record['checksum'],
+                        version_record.get('algorithm', 'md5'),
+                        block_size),
+                    size,
+                    block_size=block_size)
+
+            f = io.BufferedReader(
+                ranged.RangedReader(
+                    self.authority.fs, read_path, size, block_cache),
+                buffer_size=block_size)
+
+        if 'b' not in mode:
+            f = io.TextIOWrapper(f, **kwargs)
+
+        try:
+            yield f
+
+        finally:
+            f.close()
+
+    def _has_cached_copy(self, version, version_record):
+        '''
+        Check whether the cache holds a complete copy of a version
+
+        Copies at versioned or content-addressed paths never change, so their
+        size is compared with the recorded size. Other copies, and copies of
+        versions with no recorded size, are checked against the checksum.
+        '''
+
+        if not self.api.cache:
+            return False
+
+        read_path = self._get_storage_path(version, version_record)
+        cache_fs = self.api.cache.fs
+
+        if not cache_fs.isfile(read_path):
+            return False
+
+        size = cache_fs.getsize(read_path)
+
+        # caching an archive leaves an empty file until the data is fetched
+        if size == 0 and version_record.get('size') != 0:
+            return False
+
+        immutable = self.versioned or version_record.get('path')
+
+        if immutable and version_record.get('size') is not None:
+            return size == int(version_record['size'])
+
+        with cache_fs.open(read_path, 'rb') as f:
+            checksum = self._get_hasher(version_record)(f)['checksum']
+
+        return checksum == version_record['checksum']
+
+    @contextmanager
+    def _get_read_syspath(self, version, version_record):
+        '''
+        Yield a read-only local path to a version, avoiding copies if possible
+        '''
+
+        if version_record is None:
+            raise ValueError(
+                'Archive "{}" has no versions to read'.format(
+                    self.archive_name))
+
+        if self._is_chunked(version_record):
+            with data_file._get_write_fs() as write_fs:
+                local_path = fs.path.basename(self.archive_path)
+
+                self._copy_version(
+                    version, version_record, write_fs, local_path)
+
+                yield write_fs.getsyspath(local_path)
+
+            return
+
+        read_path = self._get_storage_path(version, version_record)
+
+        def version_check(chk):
+            return chk['checksum'] == version_record['checksum']
+
+        path = data_file._get_read_syspath(
+            self.authority,
+            self.api.cache,
             read_path,
-            write_path)
+            version_check,
+            self._get_hasher(version_record),
+            version_record.get('compression'))
 
         with path as fp:
             yield fp
 
+    @contextmanager
+    def mmap(self, version=None):
+        '''
+        Memory-map a version of the archive for zero-copy reading
+
+        Versions on an OSFS authority, and versions which are already cached,
+        are mapped in place. Other versions (remote, compressed or chunked)
+        are copied into a temporary file for the life of the context manager.
+        Mapping a version does not add it to the cache.
+
+        Parameters
+        ----------
+        version : str
+            Version number of the file to map (default latest)
+
+        Yields
+        ------
+        data : memoryview
+            Read-only view of the version's contents (a ``buffer`` on python
+            2), of the same type for empty files. The view, and any buffers
+            created from it (e.g. with ``numpy.frombuffer``), are only valid
+            within the context manager.
+
+        Examples
+        --------
+
+        .. code-block:: python
+
+            >>> import numpy as np  # doctest: +SKIP
+            >>> with archive.mmap() as data:  # doctest: +SKIP
+            ...     arr = np.frombuffer(data, dtype='float64', count=10)
+            ...     print(arr.sum())
+            ...     del arr
+
+        '''
+
+        version = _process_version(self, version)
+        version_record = self._get_version_record(version)
+
+        with self._get_read_syspath(version, version_record) as fp:
+            with open(fp, 'rb') as f:
+
+                # empty files cannot be mapped
+                if os.fstat(f.fileno()).st_size == 0:
+                    yield read_only_buffer(b'')
+                    return
+
+                data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+                try:
+                    view = read_only_buffer(data)
+
+                    try:
+                        yield view
+
+                    finally:
+                        if hasattr(view, 'release'):
+                            view.release()
+
+                finally:
+                    data.close()
+
     def download(self, filepath, version=None):
         '''
         Downloads a file from authority to local path
@@ -565,6 +1540,11 @@ class DataArchive(object):
         '''
 
         version = _process_version(self, version)
+        version_record = self._get_version_record(version)
+
+        self._download(filepath, version, version_record)
+
+    def _download(self, filepath, version, version_record):
 
         dirname, filename = os.path.split(
             os.path.abspath(os.path.expanduser(filepath)))
@@ -574,30 +1554,138 @@ class DataArchive(object):
 
         local = OSFS(dirname)
 
-        version_hash = self.get_version_hash(version)
+        version_hash = None if version_record is None else (
+            version_record['checksum'])
+
+        hasher = self._get_hasher(version_record)
 
         # version_check returns true if fp's hash is current as of read
         def version_check(chk):
             return chk['checksum'] == version_hash
 
         if os.path.exists(filepath):
-            if version_check(self.api.hash_file(filepath)):
+            if version_check(hasher(filepath)):
                 return
 
-        read_path = self.get_version_path(version)
+            # replace links made by DataAPI.checkout rather than writing
+            # through them into the cache
+            if os.stat(filepath).st_nlink > 1:
+                os.remove(filepath)
+
+        self._copy_version(version, version_record, local, filename)
+
+    def _link_from_cache(self, filepath, version, version_record):
+        '''
+        Hardlink a valid cached copy of a version to ``filepath``
+
+        Only uncompressed, unchunked versions stored at paths which never
+        change (versioned or content-addressed) are linked. Linked files
+        share their data with the cache, so they are made read-only.
+
+        Returns
+        -------
+        linked : bool
+            False if the version could not be linked
+        '''
+
+        if not hasattr(os, 'link') or not self.api.cache:
+            return False
+
+        if version_record is None or (
+                'compression' in version_record) or (
+                self._is_chunked(version_record)):
+            return False
+
+        if not (self.versioned or version_record.get('path')):
+            return False
+
+        read_path = self._get_storage_path(version, version_record)
+        cache_fs = self.api.cache.fs
+
+        if not (cache_fs.hassyspath(read_path) and cache_fs.isfile(read_path)):
+            return False
+
+        cached = cache_fs.getsyspath(read_path)
+
+        if self._get_hasher(version_record)(cached)['checksum'] != (
+                version_record['checksum']):
+            return False
+
+        tmp = filepath + '.datafs-link'
+
+        if os.path.exists(tmp):
+            os.remove(tmp)
+
+        try:
+            os.link(cached, tmp)
+
+        except OSError:
+            # e.g. the cache is on another device
+            return False
+
+        mode = stat.S_IMODE(os.stat(tmp).st_mode)
+        os.chmod(tmp, mode & ~(stat.S_IWUSR | stat.S_IWGRP | stat.S_IWOTH))
+
+        if os.path.exists(filepath):
+            os.remove(filepath)
+
+        os.rename(tmp, filepath)
+
+        return True
+
+    def prefetch(self, version=None):
+        '''
+        Cache a version and make sure the cached copy is up to date
+
+        Cached copies which are already valid are not transferred again.
+        Chunked versions fetch only the chunks missing from the cache.
+
+        Parameters
+        ----------
+        version : str
+            Version number to prefetch (default latest)
+        '''
+
+        version = _process_version(self, version)
+        version_record = self._get_version_record(version)
+
+        self._prefetch(version, version_record)
+
+    def _prefetch(self, version, version_record):
+
+        if version_record is None:
+            raise ValueError(
+                'Archive "{}" has no versions to prefetch'.format(
+                    self.archive_name))
+
+        read_path = self._get_storage_path(version, version_record)
+
+        # the record is already resolved, so the history is not fetched again
+        self._cache(read_path)
+
+        if self._is_chunked(version_record):
+            for path in self._get_chunk_paths(version_record, use_cache=True):
+                if not self.api.cache.fs.isfile(path):
+                    data_file._makedirs(
+                        self.api.cache.fs, fs.path.dirname(path))
 
+                    transfer.copyfile(
+                        self.authority.fs, path, self.api.cache.fs, path)
+
+            return
+
+        def version_check(chk):
+            return chk['checksum'] == version_record['checksum']
+
+        # refreshes the cached copy if it is missing or out of date
         with data_file._choose_read_fs(
                 self.authority,
                 self.api.cache,
                 read_path,
                 version_check,
-                self.api.hash_file) as read_fs:
-
-            fs.utils.copyfile(
-                read_fs,
-                read_path,
-                local,
-                filename)
+                self._get_hasher(version_record),
+                version_record.get('compression')):
+            pass
 
     def log(self):
 
@@ -656,7 +1744,11 @@ class DataArchive(object):
             For help setting user permissions, see
             :ref:`Administrative Tools <admin>`
 
+        Content-addressed blobs may be shared with other archives and are not
+        removed.
+
         '''
+
         versions = self.get_versions()
         self.api.manager.delete_archive_record(self.archive_name)
 
@@ -679,85 +1771,126 @@ class DataArchive(object):
         '''
         Check whether the path exists and is a file
         '''
-        version = _process_version(self, version)
-
-        path = self.get_version_path(version)
+        path = self.get_storage_path(version)
         self.authority.fs.isfile(path, *args, **kwargs)
 
     def getinfo(self, version=None, *args, **kwargs):
         '''
         Return information about the path e.g. size, mtime
         '''
-        version = _process_version(self, version)
-
-        path = self.get_version_path(version)
+        path = self.get_storage_path(version)
         self.authority.fs.getinfo(path, *args, **kwargs)
 
     def desc(self, version=None, *args, **kwargs):
         '''
         Return a short descriptive text regarding a path
         '''
-        version = _process_version(self, version)
-
-        path = self.get_version_path(version)
+        path = self.get_storage_path(version)
         self.authority.fs.desc(path, *args, **kwargs)
 
     def exists(self, version=None, *args, **kwargs):
         '''
         Check whether a path exists as file or directory
         '''
-        version = _process_version(self, version)
-
-        path = self.get_version_path(version)
+        path = self.get_storage_path(version)
         self.authority.fs.exists(path, *args, **kwargs)
 
     def getmeta(self, version=None, *args, **kwargs):
         '''
         Get the value of a filesystem meta value, if it exists
         '''
-        version = _process_version(self, version)
-
-        path = self.get_version_path(version)
+        path = self.get_storage_path(version)
         self.authority.fs.getmeta(path, *args, **kwargs)
 
     def hasmeta(self, version=None, *args, **kwargs):
         '''
         Check if a filesystem meta value exists
         '''
-        version = _process_version(self, version)
-
-        path = self.get_version_path(version)
+        path = self.get_storage_path(version)
         self.authority.fs.hasmeta(path, *args, **kwargs)
 
     def is_cached(self, version=None):
         '''
         Set the cache property to start/stop file caching for this archive
         '''
-        version = _process_version(self, version)
-
         if self.api.cache and self.api.cache.fs.isfile(
-                self.get_version_path(version)):
+                self.get_storage_path(version)):
             return True
 
         return False
 
     def cache(self, version=None):
-        version = _process_version(self, version)
+        self._cache(self.get_storage_path(version))
 
+    def _cache(self, path):
         if not self.api.cache:
             raise ValueError('No cache attached')
 
-        if not self.api.cache.fs.isfile(self.get_version_path(version)):
-            data_file._touch(self.api.cache.fs, self.get_version_path(version))
+        if not self.api.cache.fs.isfile(path):
+            data_file._touch(self.api.cache.fs, path)
 
-        assert self.api.cache.fs.isfile(
-            self.get_version_path(version)), "Cache creation failed"
+        assert self.api.cache.fs.isfile(path), "Cache creation failed"
 
     def remove_from_cache(self, version=None):
         version = _process_version(self, version)
 
-        if self.api.cache.fs.isfile(self.get_version_path(version)):
-            self.api.cache.fs.remove(self.get_version_path(version))
+        try:
+            record = self._get_version_record(version)
+
+        except ValueError:
+            record = None
+
+        path = self._get_storage_path(version, record)
+
+        if self.api._is_pending(path):
+            raise ValueError(
+                'Version "{}" of archive "{}" has not been uploaded. Flush '
+                'pending writes before removing it from the cache.'.format(
+                    version, self.archive_name))
+
+        if self.api.cache.fs.isfile(path):
+            self.api.cache.fs.remove(path)
+
+        if record is not None:
+            blocks = ranged.get_block_cache_path(
+                record['checksum'], record.get('algorithm', 'md5'))
+
+            if self.api.cache.fs.isdir(blocks):
+                self.api.cache.fs.removedir(blocks, force=True)
+
+    def find_bad_chunks(self, filepath, version=None):
+        '''
+        Find the chunks of a local file which differ from a tree-hashed version
+
+        Parameters
+        ----------
+        filepath : str
+            Path of a local copy of the version
+
+        version : str
+            Version to check against (default the default version)
+
+        Returns
+        -------
+        bad_chunks : list
+            Indices of the chunks which do not match (see
+            :py:func:`~datafs.core.hashing.find_bad_chunks`)
+        '''
+
+        version = _process_version(self, version)
+        record = self._get_version_record(version)
+
+        if record is None or not hashing.split_algorithm(
+                record.get('algorithm', 'md5'))[1]:
+            raise ValueError(
+                'Archive "{}" version {} is not tree-hashed'.format(
+                    self.archive_name, version))
+
+        checksum = dict(record)
+        checksum['chunk_size'] = int(record['chunk_size'])
+        checksum['chunks'] = self._get_chunk_digests(record)
+
+        return hashing.find_bad_chunks(filepath, checksum)
 
     def get_dependencies(self, version=None):
         '''
@@ -769,11 +1902,10 @@ class DataArchive(object):
         '''
 
         version = _process_version(self, version)
-        history = self.get_history()
+        record = self._get_version_index().get_record(version)
 
-        for v in reversed(history):
-            if BumpableVersion(v['version']) == version:
-                return v['dependencies']
+        if record is not None:
+            return record['dependencies']
 
         raise ValueError('Version {} not found'.format(version))
 
@@ -1,5 +1,5 @@
 
-import fs.utils
+import io
 import fs.path
 import tempfile
 import shutil
@@ -9,6 +9,10 @@ from fs.multifs import MultiFS
 
 from fs.errors import (ResourceLockedError)
 
+from datafs.core import compression
+from datafs.core import chunking
+from datafs.services import transfer
+
 from contextlib import contextmanager
 
 
@@ -40,11 +44,104 @@ def _touch(filesystem, path):
         filesystem.createfile(path)
 
 
+def _open_decoded(filesystem, path, codec, mode='rb', *args, **kwargs):
+    '''
+    Open a stored file for reading, decompressing it if ``codec`` is set
+    '''
+
+    if codec is None:
+        return filesystem.open(path, mode, *args, **kwargs)
+
+    return compression.open_decompressed(
+        filesystem.open(path, 'rb'), codec, mode, **kwargs)
+
+
+def _copy_encoded(src_fs, src_path, dst_fs, dst_path, codec):
+    '''
+    Copy a file to storage, compressing it if ``codec`` is set
+    '''
+
+    if codec is None:
+        transfer.copyfile(src_fs, src_path, dst_fs, dst_path)
+        return
+
+    with src_fs.open(src_path, 'rb') as src:
+        with dst_fs.open(dst_path, 'wb') as dst:
+            compression.compress_stream(src, dst, codec)
+
+
+def _copy_decoded(src_fs, src_path, dst_fs, dst_path, codec):
+    '''
+    Copy a file from storage, decompressing it if ``codec`` is set
+    '''
+
+    if codec is None:
+        transfer.copyfile(src_fs, src_path, dst_fs, dst_path)
+        return
+
+    with src_fs.open(src_path, 'rb') as src:
+        with dst_fs.open(dst_path, 'wb') as dst:
+            compression.decompress_stream(src, dst, codec)
+
+
+def _put_chunk(filesystem, path, data, codec):
+    '''
+    Store a chunk of bytes, compressing it if ``codec`` is set
+    '''
+
+    _makedirs(filesystem, fs.path.dirname(path))
+
+    if codec is not None:
+        compressor = compression.get_compressor(codec)
+        data = compressor.compress(data) + compressor.flush()
+
+    filesystem.setcontents(path, data)
+
+
+def _open_chunk(authority, cache, path, codec, use_cache=False):
+    '''
+    Open a stored chunk, preferring (and optionally populating) the cache
+    '''
+
+    if cache and not cache.fs.isfile(path) and use_cache:
+        _makedirs(cache.fs, fs.path.dirname(path))
+        transfer.copyfile(authority.fs, path, cache.fs, path)
+
+    if cache and cache.fs.isfile(path):
+        return _open_decoded(cache.fs, path, codec)
+
+    return _open_decoded(authority.fs, path, codec)
+
+
+def _copy_chunked(
+        authority,
+        cache,
+        chunk_paths,
+        dst_fs,
+        dst_path,
+        codec=None,
+        use_cache=False):
+    '''
+    Reassemble a file from stored chunks into ``dst_path``
+    '''
+
+    with open_chunked(
+            authority, cache, chunk_paths, codec, 'rb', use_cache) as src:
+        with dst_fs.open(dst_path, 'wb') as dst:
+            shutil.copyfileobj(src, dst, compression.CHUNK_SIZE)
+
+
 # HELPER CONTEXT MANAGERS
 
 
 @contextmanager
-def _choose_read_fs(authority, cache, read_path, version_check, hasher):
+def _choose_read_fs(
+        authority,
+        cache,
+        read_path,
+        version_check,
+        hasher,
+        read_compression=None):
     '''
     Context manager returning the appropriate up-to-date readable filesystem
 
@@ -52,18 +149,35 @@ def _choose_read_fs(authority, cache, read_path, version_check, hasher):
     ``read_path``, otherwise use ``authority``. If the file at
     ``read_path`` is out of date, update the file in ``cache`` before
     returning it.
+
+    Cached files are stored in the same (possibly compressed) form as on the
+    authority. ``read_compression`` is used to check the cached file's
+    contents against ``version_check``.
     '''
 
     if cache and cache.fs.isfile(read_path):
-        if version_check(hasher(cache.fs.open(read_path, 'rb'))):
+        with _open_decoded(cache.fs, read_path, read_compression) as f:
+            up_to_date = version_check(hasher(f))
+
+        if up_to_date:
             yield cache.fs
 
         elif authority.fs.isfile(read_path):
-            fs.utils.copyfile(
+
+            # check the refilled copy against the version's checksum
+            def verify(f):
+                if read_compression is not None:
+                    f = compression.open_decompressed(f, read_compression)
+
+                return version_check(hasher(f))
+
+            transfer.copyfile(
                 authority.fs,
                 read_path,
                 cache.fs,
-                read_path)
+                read_path,
+                verify=verify)
+
             yield cache.fs
 
         else:
@@ -114,11 +228,18 @@ def _get_write_fs():
 
 
 @contextmanager
-def _prepare_write_fs(read_fs, cache, read_path, readwrite_mode=True):
+def _prepare_write_fs(
+        read_fs,
+        cache,
+        read_path,
+        readwrite_mode=True,
+        read_compression=None):
     '''
     Prepare a temporary filesystem for writing to read_path
 
-    The file will be moved to write_path on close if modified.
+    The file will be moved to write_path on close if modified. Existing
+    contents are decompressed into the temporary filesystem if
+    ``read_compression`` is set.
     '''
 
     with _get_write_fs() as write_fs:
@@ -131,8 +252,9 @@ def _prepare_write_fs(read_fs, cache, read_path, readwrite_mode=True):
                 _touch(write_fs, read_path)
 
                 if read_fs.isfile(read_path):
-                    fs.utils.copyfile(
-                        read_fs, read_path, write_fs, read_path)
+                    _copy_decoded(
+                        read_fs, read_path, write_fs, read_path,
+                        read_compression)
 
         else:
             _touch(write_fs, read_path)
@@ -140,8 +262,186 @@ def _prepare_write_fs(read_fs, cache, read_path, readwrite_mode=True):
         yield write_fs
 
 
+def _write_back(
+        write_fs,
+        read_path,
+        authority,
+        cache,
+        write_path,
+        checksum,
+        cache_on_write=False,
+        write_compression=None):
+    '''
+    Store modified contents from ``write_fs`` on the authority (and cache)
+
+    If ``write_path`` is callable, it is called with the checksum of the new
+    contents to determine the storage path. Such paths are content-addressed,
+    so the copy is skipped on services that already hold the file.
+    '''
+
+    content_addressed = callable(write_path)
+
+    if content_addressed:
+        write_path = write_path(checksum)
+
+    def _needs_copy(service):
+        return not (content_addressed and service.fs.isfile(write_path))
+
+    if (
+        cache_on_write or
+        (
+            cache
+            and (
+                fs.path.abspath(read_path) ==
+                fs.path.abspath(write_path))
+            and cache.fs.isfile(read_path)
+        )
+    ):
+        if _needs_copy(cache):
+            _makedirs(cache.fs, fs.path.dirname(write_path))
+            _copy_encoded(
+                write_fs, read_path, cache.fs, write_path,
+                write_compression)
+
+        if _needs_copy(authority):
+            _makedirs(authority.fs, fs.path.dirname(write_path))
+            transfer.copyfile(
+                cache.fs, write_path, authority.fs, write_path)
+
+    elif _needs_copy(authority):
+        _makedirs(authority.fs, fs.path.dirname(write_path))
+        _copy_encoded(
+            write_fs, read_path, authority.fs, write_path,
+            write_compression)
+
+
+@contextmanager
+def _get_read_syspath(
+        authority,
+        cache,
+        read_path,
+        version_check,
+        hasher,
+        read_compression=None):
+    '''
+    Context manager returning a local path to the contents of ``read_path``
+
+    Uncompressed files which already have a system path (on an OSFS authority
+    or in the cache) are used in place. Otherwise the contents are decoded
+    into a temporary directory which is removed on exit. The path must be
+    treated as read-only.
+    '''
+
+    with _choose_read_fs(
+            authority,
+            cache,
+            read_path,
+            version_check,
+            hasher,
+            read_compression) as read_fs:
+
+        if read_compression is None and read_fs.isfile(read_path) and (
+                read_fs.hassyspath(read_path)):
+
+            yield read_fs.getsyspath(read_path)
+
+            return
+
+        with _get_write_fs() as write_fs:
+            _makedirs(write_fs, fs.path.dirname(read_path))
+
+            _copy_decoded(
+                read_fs, read_path, write_fs, read_path, read_compression)
+
+            yield write_fs.getsyspath(read_path)
+
+
 # AVAILABLE I/O CONTEXT MANAGERS
 
+@contextmanager
+def open_chunked(
+        authority,
+        cache,
+        chunk_paths,
+        codec=None,
+        mode='rb',
+        use_cache=False,
+        **kwargs):
+    '''
+    Context manager streaming a file reassembled from stored chunks
+
+    Parameters
+    ----------
+    authority : object
+
+        :py:class:`~datafs.services.service.DataService` holding the chunks
+
+    cache : object
+
+        :py:class:`~datafs.services.service.DataService` used as the cache,
+        or ``None``. Chunks found in the cache are read from it.
+
+    chunk_paths : list
+
+        Paths of the chunks, in order
+
+    codec : str
+
+        Compression codec of the stored chunks (default ``None``)
+
+    mode : str
+
+        Read mode. If ``'b'`` is not in mode, the stream is wrapped in a
+        :py:class:`io.TextIOWrapper`, and ``kwargs`` (e.g. ``encoding``) are
+        passed to the wrapper.
+
+    use_cache : bool
+
+        Copy chunks missing from the cache into it as they are read
+    '''
+
+    if ('w' in mode) or ('a' in mode) or ('+' in mode):
+        raise ValueError('Chunked files can only be opened for reading')
+
+    openers = [
+        (lambda path=path: _open_chunk(
+            authority, cache, path, codec, use_cache))
+        for path in chunk_paths]
+
+    f = io.BufferedReader(chunking.ChunkedReader(openers))
+
+    if 'b' not in mode:
+        f = io.TextIOWrapper(f, **kwargs)
+
+    try:
+        yield f
+
+    finally:
+        f.close()
+
+
+def _hash_changes(write_fs, path, version_check, hasher, write_hasher=None):
+    '''
+    Hash modified contents, returning ``None`` if they match the read version
+
+    Contents are compared with the read version using ``hasher``, and the
+    returned checksum is computed with ``write_hasher`` if one is given.
+    '''
+
+    with write_fs.open(path, 'rb') as f:
+        checksum = (write_hasher or hasher)(f)
+
+    if write_hasher is not None:
+        with write_fs.open(path, 'rb') as f:
+            if version_check(hasher(f)):
+                return None
+
+    elif version_check(checksum):
+        return None
+
+    return checksum
+
+
 @contextmanager
 def open_file(
         authority,
@@ -153,6 +453,9 @@ def open_file(
         write_path=None,
         cache_on_write=False,
         mode='r',
+        read_compression=None,
+        write_compression=None,
+        write_hasher=None,
         *args,
         **kwargs):
     '''
@@ -174,13 +477,36 @@ def open_file(
     use_cache : bool
 
          update, service_path, version_check, \*\*kwargs
+
+    read_compression : str
+
+        Compression codec of the stored file at ``read_path`` (default
+        ``None``)
+
+    write_compression : str
+
+        Compression codec used to store modified contents at ``write_path``
+        (default ``None``)
+
+    write_hasher : function
+
+        Hashing function for modified contents, if they are hashed
+        differently from the version at ``read_path`` (default ``hasher``)
+
+    If ``write_path`` is a callable, it is called with the checksum of the
+    modified contents to get a content-addressed storage path.
     '''
 
     if write_path is None:
         write_path = read_path
 
     with _choose_read_fs(
-            authority, cache, read_path, version_check, hasher) as read_fs:
+            authority,
+            cache,
+            read_path,
+            version_check,
+            hasher,
+            read_compression) as read_fs:
 
         write_mode = ('w' in mode) or ('a' in mode) or ('+' in mode)
 
@@ -192,7 +518,11 @@ def open_file(
                         '+' in mode)))
 
             with _prepare_write_fs(
-                    read_fs, cache, read_path, readwrite_mode) as write_fs:
+                    read_fs,
+                    cache,
+                    read_path,
+                    readwrite_mode,
+                    read_compression) as write_fs:
 
                 wrapper = MultiFS()
                 wrapper.addfs('reader', read_fs)
@@ -207,38 +537,31 @@ def open_file(
                     if info['size'] == 0:
                         return
 
-                with write_fs.open(read_path, 'rb') as f:
-                    checksum = hasher(f)
-
-                if not version_check(checksum):
-                    if (
-                        cache_on_write or
-                        (
-                            cache
-                            and (
-                                fs.path.abspath(read_path) ==
-                                fs.path.abspath(write_path))
-                            and cache.fs.isfile(read_path)
-                        )
-                    ):
-                        _makedirs(cache.fs, fs.path.dirname(write_path))
-                        fs.utils.copyfile(
-                            write_fs, read_path, cache.fs, write_path)
-
-                        _makedirs(authority.fs, fs.path.dirname(write_path))
-                        fs.utils.copyfile(
-                            cache.fs, write_path, authority.fs, write_path)
-
-                    else:
-                        _makedirs(authority.fs, fs.path.dirname(write_path))
-                        fs.utils.copyfile(
-                            write_fs, read_path, authority.fs, write_path)
+                checksum = _hash_changes(
+                    write_fs, read_path, version_check, hasher, write_hasher)
+
+                if checksum is not None:
+                    _write_back(
+                        write_fs,
+                        read_path,
+                        authority,
+                        cache,
+                        write_path,
+                        checksum,
+                        cache_on_write,
+                        write_compression)
 
                     update(**checksum)
 
         else:
 
-            with read_fs.open(read_path, mode, *args, **kwargs) as f:
+            with _open_decoded(
+                    read_fs,
+                    read_path,
+                    read_compression,
+                    mode,
+                    *args,
+                    **kwargs) as f:
 
                 yield f
 
@@ -252,7 +575,11 @@ def get_local_path(
         hasher,
         read_path,
         write_path=None,
-        cache_on_write=False):
+        cache_on_write=False,
+        read_compression=None,
+        write_compression=None,
+        mode='r+',
+        write_hasher=None):
     '''
     Context manager for retrieving a system path for I/O and updating on change
 
@@ -272,16 +599,69 @@ def get_local_path(
     use_cache : bool
 
          update, service_path, version_check, \*\*kwargs
+
+    read_compression : str
+
+        Compression codec of the stored file at ``read_path`` (default
+        ``None``)
+
+    write_compression : str
+
+        Compression codec used to store modified contents at ``write_path``
+        (default ``None``)
+
+    write_hasher : function
+
+        Hashing function for modified contents, if they are hashed
+        differently from the version at ``read_path`` (default ``hasher``)
+
+    mode : str
+
+        ``'r+'`` (default) copies the current contents to a temporary path and
+        stores them on exit if modified. ``'w'`` yields an empty temporary
+        path without copying the current contents. ``'r'`` yields the path of
+        the stored file itself where possible (see
+        :py:func:`_get_read_syspath`), with no copy and no check for changes
+        on exit; the file must not be modified.
+
+    If ``write_path`` is a callable, it is called with the checksum of the
+    modified contents to get a content-addressed storage path.
     '''
 
+    if mode not in ('r', 'r+', 'w'):
+        raise ValueError(
+            'Mode "{}" not supported. Choose from r, r+, w'.format(mode))
+
+    if mode == 'r':
+        with _get_read_syspath(
+                authority,
+                cache,
+                read_path,
+                version_check,
+                hasher,
+                read_compression) as fp:
+
+            yield fp
+
+        return
+
     if write_path is None:
         write_path = read_path
 
     with _choose_read_fs(
-            authority, cache, read_path, version_check, hasher) as read_fs:
+            authority,
+            cache,
+            read_path,
+            version_check,
+            hasher,
+            read_compression) as read_fs:
 
         with _prepare_write_fs(
-                read_fs, cache, read_path, readwrite_mode=True) as write_fs:
+                read_fs,
+                cache,
+                read_path,
+                readwrite_mode=(mode == 'r+'),
+                read_compression=read_compression) as write_fs:
 
             yield write_fs.getsyspath(read_path)
 
@@ -292,33 +672,21 @@ def get_local_path(
                     if info['size'] == 0:
                         return
 
-                with write_fs.open(read_path, 'rb') as f:
-                    checksum = hasher(f)
-
-                if not version_check(checksum):
-
-                    if (
-                        cache_on_write or
-                        (
-                            cache
-                            and (
-                                fs.path.abspath(read_path) ==
-                                fs.path.abspath(write_path))
-                            and cache.fs.isfile(read_path)
-                        )
-                    ):
-
-                        _makedirs(cache.fs, fs.path.dirname(write_path))
-                        fs.utils.copyfile(
-                            write_fs, read_path, cache.fs, write_path)
-
-                        _makedirs(authority.fs, fs.path.dirname(write_path))
-                        fs.utils.copyfile(
-                            cache.fs, write_path, authority.fs, write_path)
-                    else:
-                        _makedirs(authority.fs, fs.path.dirname(write_path))
-                        fs.utils.copyfile(
-                            write_fs, read_path, authority.fs, write_path)
+                checksum = _hash_changes(
+                    write_fs, read_path, version_check, hasher, write_hasher)
+
+                if checksum is not None:
+
+                    _write_back(
+                        write_fs,
+                        read_path,
+                        authority,
+                        cache,
+                        write_path,
+                        checksum,
+                        cache_on_write,
+                        write_compression)
+
                     update(**checksum)
 
             else:
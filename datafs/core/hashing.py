@@ -0,0 +1,452 @@
+'''
+Checksum algorithms used to verify archive contents
+
+Algorithms from :py:mod:`hashlib` are always available. ``blake2b`` requires
+python 3.6 or later, and the ``xxh64`` and ``xxh3_128`` algorithms are
+registered if the optional `xxhash <https://pypi.python.org/pypi/xxhash>`_
+package is installed.
+
+Any algorithm can be used in chunked "tree" mode by appending ``-tree`` to its
+name (e.g. ``blake2b-tree``). Tree hashes split the file into fixed-size
+chunks, hash the chunks on a thread pool, and derive a root checksum from the
+chunk digests. The chunk digests are returned along with the root so that
+individual chunks can be re-verified later (see :py:func:`find_bad_chunks`).
+'''
+
+from __future__ import absolute_import
+
+import os
+import hashlib
+import binascii
+import collections
+import multiprocessing
+from multiprocessing.pool import ThreadPool
+from datafs._compat import open_filelike, string_types
+
+try:
+    import xxhash
+except ImportError:
+    xxhash = None
+
+
+BUFFER_SIZE = 1024 * 1024
+
+TREE_SUFFIX = '-tree'
+TREE_CHUNK_SIZE = 64 * 1024 * 1024
+
+_ALGORITHMS = {
+    'md5': hashlib.md5,
+    'sha1': hashlib.sha1,
+    'sha256': hashlib.sha256,
+    'sha512': hashlib.sha512}
+
+if hasattr(hashlib, 'blake2b'):
+    _ALGORITHMS['blake2b'] = hashlib.blake2b
+
+if xxhash is not None:
+    _ALGORITHMS['xxh64'] = xxhash.xxh64
+
+    if hasattr(xxhash, 'xxh3_128'):
+        _ALGORITHMS['xxh3_128'] = xxhash.xxh3_128
+
+
+def available_algorithms():
+    '''
+    List the names of the hash algorithms available in this environment
+
+    Examples
+    --------
+
+    .. code-block:: python
+
+        >>> 'md5' in available_algorithms()
+        True
+        >>> 'sha256' in available_algorithms()
+        True
+
+    '''
+
+    return sorted(_ALGORITHMS.keys())
+
+
+def get_hasher(algorithm):
+    '''
+    Return a new hash object for ``algorithm``
+
+    Raises
+    ------
+
+    ValueError
+        A ValueError is raised if the algorithm is not available
+
+    Examples
+    --------
+
+    .. code-block:: python
+
+        >>> h = get_hasher('md5')
+        >>> h.update(b'hello!')
+        >>> print(h.hexdigest())
+        5a8dd3ad0756a93ded72b823b19dd877
+        >>>
+        >>> get_hasher('crc0')   # doctest: +ELLIPSIS
+        Traceback (most recent call last):
+        ...
+        ValueError: Hash algorithm "crc0" not available. Choose from ...
+
+    '''
+
+    if algorithm not in _ALGORITHMS:
+        raise ValueError(
+            'Hash algorithm "{}" not available. Choose from {}'.format(
+                algorithm, ', '.join(available_algorithms())))
+
+    return _ALGORITHMS[algorithm]()
+
+
+def split_algorithm(algorithm):
+    '''
+    Split an algorithm name into its base algorithm and tree mode flag
+
+    Examples
+    --------
+
+    .. code-block:: python
+
+        >>> split_algorithm('sha256')
+        ('sha256', False)
+        >>> split_algorithm('sha256-tree')
+        ('sha256', True)
+
+    '''
+
+    if algorithm.endswith(TREE_SUFFIX):
+        return algorithm[:-len(TREE_SUFFIX)], True
+
+    return algorithm, False
+
+
+def validate_algorithm(algorithm):
+    '''
+    Raise a ValueError if ``algorithm`` (or its tree base) is not available
+    '''
+
+    get_hasher(split_algorithm(algorithm)[0])
+
+
+def hash_filelike(
+        f,
+        algorithm='md5',
+        buffer_size=BUFFER_SIZE,
+        chunk_size=None,
+        threads=None):
+    '''
+    Compute the checksum of a file-like object or file path
+
+    Parameters
+    ----------
+
+    f: file-like
+        File-like object or file path from which to compute checksum value
+
+    algorithm: str
+        Name of the hash algorithm to use (default 'md5'). See
+        :py:func:`available_algorithms`. Names ending in ``-tree`` are hashed
+        with :py:func:`hash_tree`.
+
+    buffer_size: int
+        Number of bytes to read from ``f`` at a time
+
+    chunk_size: int
+        Chunk size for tree algorithms (default ``TREE_CHUNK_SIZE``)
+
+    threads: int
+        Size of the thread pool for tree algorithms (default cpu count)
+
+    Returns
+    -------
+    checksum: dict
+        dictionary with {'algorithm': algorithm, 'checksum': hexdigest,
+        'size': size}, where ``size`` is the number of bytes hashed. Tree
+        algorithms also return the ``chunk_size`` and the list of ``chunks``
+        hex digests.
+
+    '''
+
+    base, tree = split_algorithm(algorithm)
+
+    if tree:
+        return hash_tree(
+            f, algorithm=base, chunk_size=chunk_size, threads=threads)
+
+    hasher = get_hasher(algorithm)
+    size = 0
+
+    with open_filelike(f, 'rb') as f_obj:
+        for chunk in iter(lambda: f_obj.read(buffer_size), b''):
+            hasher.update(chunk)
+            size += len(chunk)
+
+    return {
+        'algorithm': algorithm,
+        'checksum': hasher.hexdigest(),
+        'size': size}
+
+
+class _CountingReader(object):
+    '''
+    Count the bytes read from a file-like object
+    '''
+
+    def __init__(self, f):
+        self._f = f
+        self.size = 0
+
+    def read(self, size=-1):
+        data = self._f.read(size)
+        self.size += len(data)
+        return data
+
+
+def _digest(algorithm, data):
+    hasher = get_hasher(algorithm)
+    hasher.update(data)
+    return hasher.digest()
+
+
+def _digest_range(algorithm, filepath, offset, size):
+    with open(filepath, 'rb') as f:
+        f.seek(offset)
+        return _digest(algorithm, f.read(size))
+
+
+def _root_digest(algorithm, digests):
+    hasher = get_hasher(algorithm)
+
+    for digest in digests:
+        hasher.update(digest)
+
+    return hasher.hexdigest()
+
+
+def _iter_chunk_digests(f, algorithm, chunk_size, threads):
+    '''
+    Yield binary chunk digests in order, hashing on a bounded thread pool
+
+    File paths are read by the workers in parallel. Other file-like objects
+    are read serially and only the hashing is parallelized. At most
+    ``threads + 1`` chunks are held in memory at a time.
+    '''
+
+    pool = ThreadPool(threads)
+    pending = collections.deque()
+
+    try:
+        if isinstance(f, string_types):
+            size = os.path.getsize(f)
+
+            tasks = (
+                (_digest_range, (algorithm, f, offset, chunk_size))
+                for offset in range(0, size, chunk_size))
+
+            for func, args in tasks:
+                pending.append(pool.apply_async(func, args))
+
+                if len(pending) > threads:
+                    yield pending.popleft().get()
+
+        else:
+            for chunk in iter(lambda: f.read(chunk_size), b''):
+                pending.append(pool.apply_async(_digest, (algorithm, chunk)))
+
+                if len(pending) > threads:
+                    yield pending.popleft().get()
+
+        while len(pending) > 0:
+            yield pending.popleft().get()
+
+    finally:
+        pool.close()
+        pool.join()
+
+
+def hash_tree(f, algorithm='sha256', chunk_size=None, threads=None):
+    '''
+    Compute a chunked tree checksum of a file-like object or file path
+
+    The file is split into ``chunk_size`` chunks which are hashed
+    concurrently. The root checksum is the digest of the concatenated binary
+    chunk digests, using the same algorithm.
+
+    Parameters
+    ----------
+
+    f: file-like
+        File-like object or file path from which to compute checksum value
+
+    algorithm: str
+        Base hash algorithm (default 'sha256')
+
+    chunk_size: int
+        Size of each chunk in bytes (default ``TREE_CHUNK_SIZE``)
+
+    threads: int
+        Size of the thread pool (default cpu count)
+
+    Returns
+    -------
+    checksum: dict
+        dictionary with keys ``algorithm`` (e.g. 'sha256-tree'),
+        ``checksum``, ``size``, ``chunk_size`` and ``chunks``
+
+    Examples
+    --------
+
+    .. code-block:: python
+
+        >>> import io
+        >>> res = hash_tree(io.BytesIO(b'abcdefg'), 'md5', chunk_size=3)
+        >>> res['algorithm']
+        'md5-tree'
+        >>> len(res['chunks'])
+        3
+        >>> res == hash_tree(io.BytesIO(b'abcdefg'), 'md5', chunk_size=3)
+        True
+
+    '''
+
+    if chunk_size is None:
+        chunk_size = TREE_CHUNK_SIZE
+
+    if threads is None:
+        threads = multiprocessing.cpu_count()
+
+    # fail before starting the pool
+    get_hasher(algorithm)
+
+    if isinstance(f, string_types):
+        size = os.path.getsize(f)
+        digests = list(_iter_chunk_digests(f, algorithm, chunk_size, threads))
+
+    else:
+        with open_filelike(f, 'rb') as f_obj:
+            reader = _CountingReader(f_obj)
+            digests = list(
+                _iter_chunk_digests(reader, algorithm, chunk_size, threads))
+
+            size = reader.size
+
+    return {
+        'algorithm': algorithm + TREE_SUFFIX,
+        'checksum': _root_digest(algorithm, digests),
+        'size': size,
+        'chunk_size': chunk_size,
+        'chunks': [binascii.hexlify(d).decode('ascii') for d in digests]}
+
+
+def pack_chunk_digests(chunks):
+    '''
+    Concatenate the hex digests of a tree checksum's chunks as bytes
+
+    The tree checksum is the digest of these bytes with the base algorithm,
+    so they can be stored as a content-addressed object next to the data.
+
+    Examples
+    --------
+
+    .. code-block:: python
+
+        >>> import io
+        >>> rec = hash_tree(io.BytesIO(b'abcdefg'), 'md5', chunk_size=3)
+        >>> packed = pack_chunk_digests(rec['chunks'])
+        >>> len(packed)
+        48
+        >>> _root_digest('md5', [packed]) == rec['checksum']
+        True
+        >>> unpack_chunk_digests(packed, 'md5') == rec['chunks']
+        True
+
+    '''
+
+    return b''.join(binascii.unhexlify(chunk) for chunk in chunks)
+
+
+def unpack_chunk_digests(data, algorithm):
+    '''
+    Split bytes packed by :py:func:`pack_chunk_digests` into hex digests
+    '''
+
+    size = get_hasher(split_algorithm(algorithm)[0]).digest_size
+
+    return [
+        binascii.hexlify(data[i:i + size]).decode('ascii')
+        for i in range(0, len(data), size)]
+
+
+def find_bad_chunks(f, checksum, threads=None):
+    '''
+    Re-verify a file against the chunk digests of a tree checksum
+
+    Parameters
+    ----------
+
+    f: file-like
+        File-like object or file path to verify
+
+    checksum: dict
+        Tree checksum, with keys ``algorithm``, ``chunk_size`` and ``chunks``
+        (as returned by :py:func:`hash_tree`). Version records do not include
+        the ``chunks``; use
+        :py:meth:`~datafs.core.data_archive.DataArchive.find_bad_chunks` to
+        check a file against an archive version.
+
+    Returns
+    -------
+    bad_chunks: list
+        Indices of chunks which do not match the recorded digests. Chunks
+        missing from the end of the file and extra trailing chunks are
+        included.
+
+    Examples
+    --------
+
+    .. code-block:: python
+
+        >>> import io
+        >>> rec = hash_tree(io.BytesIO(b'abcdefg'), 'md5', chunk_size=3)
+        >>> find_bad_chunks(io.BytesIO(b'abcdXfg'), rec)
+        [1]
+
+    '''
+
+    algorithm, tree = split_algorithm(checksum['algorithm'])
+
+    if not tree:
+        raise ValueError(
+            'Algorithm "{}" is not a tree algorithm'.format(
+                checksum['algorithm']))
+
+    if threads is None:
+        threads = multiprocessing.cpu_count()
+
+    if isinstance(f, string_types):
+        digests = list(_iter_chunk_digests(
+            f, algorithm, checksum['chunk_size'], threads))
+
+    else:
+        with open_filelike(f, 'rb') as f_obj:
+            digests = list(_iter_chunk_digests(
+                f_obj, algorithm, checksum['chunk_size'], threads))
+
+    digests = [binascii.hexlify(d).decode('ascii') for d in digests]
+
+    expected = checksum['chunks']
+
+    bad = [
+        i for i, (found, exp) in enumerate(zip(digests, expected))
+        if found != exp]
+
+    bad.extend(range(min(len(digests), len(expected)),
+                     max(len(digests), len(expected))))
+
+    return bad
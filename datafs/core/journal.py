@@ -0,0 +1,458 @@
+'''
+Durable on-disk journal of pending writes
+
+A :py:class:`Journal` records each pending write as a JSON file in a local
+directory before it is acknowledged, and applies the entries with a handler on
+background worker threads. Entries are written to a temporary file, synced and
+renamed into place, so an entry is either completely recorded or absent.
+Entries are removed once their handler succeeds, so writes interrupted by a
+crash are applied when the journal is next used.
+
+Entries with the same key are applied one at a time, in the order they were
+added. Failed entries are retried with exponential backoff; entries which
+still fail are marked as failed and block later entries with the same key
+until they are retried.
+
+Several processes may share a journal directory. One of them holds a lock on
+the directory and runs the workers; the others only record entries, which
+the lock holder finds by rescanning the directory.
+'''
+
+from __future__ import absolute_import
+
+import os
+import json
+import time
+import uuid
+import itertools
+import threading
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+
+THREADS = 4
+RETRIES = 3
+RETRY_DELAY = 1.0
+
+# seconds between scans for entries added by other processes
+RESCAN_INTERVAL = 1.0
+
+_LOCK_FILE = 'lock'
+
+_counter = itertools.count()
+_counter_lock = threading.Lock()
+
+
+def _new_entry_id():
+    with _counter_lock:
+        count = next(_counter)
+
+    # ids sort in the order entries were added
+    return '{:016d}-{:08d}-{}'.format(
+        int(time.time() * 1e6), count, uuid.uuid4().hex[:8])
+
+
+def _fsync_dir(directory):
+    try:
+        fd = os.open(directory, os.O_RDONLY)
+
+    except (IOError, OSError):
+        return
+
+    try:
+        os.fsync(fd)
+
+    except (IOError, OSError):
+        pass
+
+    finally:
+        os.close(fd)
+
+
+class Journal(object):
+    '''
+    Durable queue of pending writes applied by background workers
+
+    Parameters
+    ----------
+
+    directory : str
+        Local directory in which entries are stored. Created if missing.
+
+    handler : function
+        Called with each entry dict to apply it. Exceptions are retried.
+
+    threads : int
+        Number of worker threads (default ``THREADS``)
+
+    retries : int
+        Number of times a failed entry is retried before it is marked as
+        failed (default ``RETRIES``)
+
+    retry_delay : float
+        Delay in seconds before the first retry, doubled on each later retry
+        (default ``RETRY_DELAY``)
+
+    Workers start when the first entry is added or on :py:meth:`wait`. Only
+    one process can run the workers for a directory at a time. Entries added
+    by other processes are recorded without starting workers, and are
+    applied by the process running them.
+
+    Examples
+    --------
+
+    .. code-block:: python
+
+        >>> import shutil
+        >>> import tempfile
+        >>> tmp = tempfile.mkdtemp()
+        >>>
+        >>> applied = []
+        >>> journal = Journal(tmp, lambda entry: applied.append(
+        ...     entry['record']['value']))
+        >>>
+        >>> for i in range(3):
+        ...     _ = journal.append('key', {'value': i})
+        ...
+        >>> journal.wait()
+        True
+        >>> applied
+        [0, 1, 2]
+        >>> journal.entries()
+        []
+        >>> journal.close()
+        >>> shutil.rmtree(tmp)
+
+    '''
+
+    def __init__(
+            self,
+            directory,
+            handler,
+            threads=THREADS,
+            retries=RETRIES,
+            retry_delay=RETRY_DELAY):
+
+        self.directory = directory
+        self.threads = threads
+        self.retries = retries
+        self.retry_delay = retry_delay
+
+        self._handler = handler
+        self._cond = threading.Condition()
+        self._entries = {}
+        self._active = set()
+        self._workers = []
+        self._lock_file = None
+        self._closed = False
+        self._scanned = None
+
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+
+        self._rescan()
+
+    def _rescan(self):
+        '''
+        Load the entries in the directory, including those added, updated or
+        removed by other processes
+        '''
+
+        entries = {}
+
+        for filename in os.listdir(self.directory):
+            if not filename.endswith('.json'):
+                continue
+
+            entry_id = filename[:-len('.json')]
+            entry = self._entries.get(entry_id)
+
+            # entries being applied here are newer in memory than on disk
+            if entry is not None and entry['key'] in self._active:
+                entries[entry_id] = entry
+                continue
+
+            try:
+                with open(os.path.join(self.directory, filename), 'r') as f:
+                    entries[entry_id] = json.load(f)
+
+            except (IOError, OSError):
+                # removed by the process running the workers
+                continue
+
+        self._entries = entries
+        self._scanned = time.time()
+
+    def _entry_path(self, entry_id):
+        return os.path.join(self.directory, entry_id + '.json')
+
+    def _persist(self, entry):
+        path = self._entry_path(entry['id'])
+        tmp = path + '.tmp'
+
+        with open(tmp, 'w') as f:
+            json.dump(entry, f, default=str)
+            f.flush()
+            os.fsync(f.fileno())
+
+        os.rename(tmp, path)
+        _fsync_dir(self.directory)
+
+    def append(self, key, record):
+        '''
+        Durably record a pending write and queue it for the workers
+
+        Parameters
+        ----------
+
+        key : str
+            Entries with the same key are applied in order
+
+        record : dict
+            JSON-serializable description of the write, passed to the handler
+            as ``entry['record']``
+
+        Returns
+        -------
+
+        entry_id : str
+        '''
+
+        entry = {
+            'id': _new_entry_id(),
+            'key': key,
+            'record': record,
+            'created': time.time(),
+            'attempts': 0,
+            'error': None}
+
+        self._persist(entry)
+
+        with self._cond:
+            self._entries[entry['id']] = entry
+            self._cond.notify_all()
+
+        self.start()
+
+        return entry['id']
+
+    def entries(self, key=None):
+        '''
+        List pending and failed entries in order, optionally for one key
+        '''
+
+        with self._cond:
+
+            # entries are only kept up to date by the workers
+            if not self._workers:
+                self._rescan()
+
+            return [
+                dict(self._entries[entry_id])
+                for entry_id in sorted(self._entries)
+                if key is None or self._entries[entry_id]['key'] == key]
+
+    def failed(self):
+        '''
+        List entries which failed after all retries
+        '''
+
+        return [
+            entry for entry in self.entries() if entry['error'] is not None]
+
+    def start(self):
+        '''
+        Start the worker threads if they are not running
+
+        Returns
+        -------
+
+        started : bool
+            False if another process is running the workers for this
+            journal. Its workers apply the entries added by this process.
+        '''
+
+        with self._cond:
+            if self._closed:
+                return False
+
+            if self._workers:
+                return True
+
+            if not self._lock():
+                return False
+
+            self._rescan()
+
+            for _ in range(self.threads):
+                worker = threading.Thread(target=self._work)
+                worker.daemon = True
+                worker.start()
+                self._workers.append(worker)
+
+            return True
+
+    def _lock(self):
+        if fcntl is None:
+            return True
+
+        lock_file = open(os.path.join(self.directory, _LOCK_FILE), 'a')
+
+        try:
+            fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+
+        except (IOError, OSError):
+            lock_file.close()
+            return False
+
+        self._lock_file = lock_file
+
+        return True
+
+    def _next_entry(self):
+        # the first entry for each key is runnable unless its key is busy
+        # or blocked by a failed entry
+        blocked = set(self._active)
+
+        for entry_id in sorted(self._entries):
+            entry = self._entries[entry_id]
+
+            if entry['key'] in blocked:
+                continue
+
+            blocked.add(entry['key'])
+
+            if entry['error'] is None:
+                return entry
+
+        return None
+
+    def _work(self):
+        while True:
+            with self._cond:
+                entry = self._next_entry()
+
+                while entry is None and not self._closed:
+                    self._cond.wait(RESCAN_INTERVAL)
+
+                    # one idle worker scans for other processes' entries
+                    if time.time() - self._scanned >= RESCAN_INTERVAL:
+                        self._rescan()
+
+                    entry = self._next_entry()
+
+                if self._closed:
+                    return
+
+                self._active.add(entry['key'])
+
+            error = self._apply(entry)
+
+            with self._cond:
+                self._active.discard(entry['key'])
+
+                if error is None:
+                    del self._entries[entry['id']]
+                    os.remove(self._entry_path(entry['id']))
+
+                else:
+                    entry['error'] = error
+                    self._persist(entry)
+
+                self._cond.notify_all()
+
+    def _apply(self, entry):
+        for attempt in range(self.retries + 1):
+            try:
+                self._handler(dict(entry))
+                return None
+
+            except Exception as e:
+                entry['attempts'] += 1
+
+                if attempt == self.retries:
+                    return '{}: {}'.format(type(e).__name__, e)
+
+                time.sleep(self.retry_delay * 2 ** attempt)
+
+    def retry(self):
+        '''
+        Queue failed entries to be attempted again
+        '''
+
+        with self._cond:
+            for entry in self._entries.values():
+                if entry['error'] is not None:
+                    entry['error'] = None
+                    self._persist(entry)
+
+            self._cond.notify_all()
+
+        if self._entries:
+            self.start()
+
+    def wait(self, timeout=None):
+        '''
+        Block until all entries have been applied or have failed
+
+        Starts the workers if there are entries left by an earlier process.
+        If another process is running the workers, waits for it to apply
+        the entries.
+
+        Returns
+        -------
+
+        done : bool
+            False if ``timeout`` seconds passed first
+        '''
+
+        if self._entries:
+            self.start()
+
+        deadline = None if timeout is None else time.time() + timeout
+
+        with self._cond:
+            while True:
+                if not self._workers:
+                    self._rescan()
+
+                if not (self._active or self._next_entry() is not None):
+                    return True
+
+                delay = RESCAN_INTERVAL
+
+                if deadline is not None:
+                    remaining = deadline - time.time()
+
+                    if remaining <= 0:
+                        return False
+
+                    delay = min(delay, remaining)
+
+                self._cond.wait(delay)
+
+                # take over if the process running the workers has exited
+                if not self._workers and self._entries:
+                    self.start()
+
+    def close(self):
+        '''
+        Stop the workers once their current entries finish
+
+        Entries which have not been applied stay in the journal.
+        '''
+
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+
+        for worker in self._workers:
+            if worker is not threading.current_thread():
+                worker.join()
+
+        if self._lock_file is not None:
+            self._lock_file.close()
+            self._lock_file = None
@@ -0,0 +1,282 @@
+'''
+Random-access reads of stored files using byte-range requests
+
+:py:class:`RangedReader` reads only the byte ranges it is asked for, using
+ranged GET requests on S3 filesystems and ``seek`` elsewhere. Fetched data can
+be kept in a :py:class:`BlockCache`: a sparse file on the cache filesystem
+with a bitmap recording which fixed-size blocks have been filled, so repeated
+reads of the same region of a large remote file are served locally.
+'''
+
+from __future__ import absolute_import
+
+import io
+import fs.path
+
+
+BLOCK_SIZE = 1024 * 1024
+
+
+def read_range(filesystem, path, offset, size):
+    '''
+    Read ``size`` bytes at ``offset`` from a file on a pyfilesystem
+
+    S3 filesystems are read with a single ranged GET request. Other
+    filesystems are read by seeking in the opened file.
+    '''
+
+    if size <= 0:
+        return b''
+
+    bucket = getattr(filesystem, '_s3bukt', None)
+
+    if bucket is not None:
+        key = bucket.new_key(filesystem._s3path(path))
+
+        return key.get_contents_as_string(headers={
+            'Range': 'bytes={}-{}'.format(offset, offset + size - 1)})
+
+    with filesystem.open(path, 'rb') as f:
+        f.seek(offset)
+        return f.read(size)
+
+
+def get_block_cache_path(checksum, algorithm, block_size=None):
+    '''
+    Returns the cache directory of the block cache for a file's contents
+
+    Block caches are keyed by checksum, so they are never stale, and by
+    block size, since the bitmaps of different block sizes are not
+    interchangeable. Without ``block_size``, the directory holding the block
+    caches of all block sizes is returned.
+
+    Examples
+    --------
+
+    .. code-block:: python
+
+        >>> print(get_block_cache_path('5a8dd3ad0756a93d', 'md5', 1024))
+        .blocks/md5/5a/5a8dd3ad0756a93d/1024
+        >>> print(get_block_cache_path('5a8dd3ad0756a93d', 'md5'))
+        .blocks/md5/5a/5a8dd3ad0756a93d
+
+    '''
+
+    path = fs.path.join('.blocks', algorithm, checksum[:2], checksum)
+
+    if block_size is not None:
+        path = fs.path.join(path, str(block_size))
+
+    return path
+
+
+class BlockCache(object):
+    '''
+    Sparse on-disk cache of the fixed-size blocks of a file
+
+    Parameters
+    ----------
+
+    filesystem : object
+        pyfilesystem object on which to store the cache
+
+    path : str
+        Directory in which the block data and bitmap are stored
+
+    size : int
+        Size of the cached file in bytes
+
+    block_size : int
+        Size of each block in bytes (default ``BLOCK_SIZE``)
+    '''
+
+    def __init__(self, filesystem, path, size, block_size=BLOCK_SIZE):
+        self.fs = filesystem
+        self.size = size
+        self.block_size = block_size
+        self.nblocks = (size + block_size - 1) // block_size
+
+        self._data_path = fs.path.join(path, 'data')
+        self._bitmap_path = fs.path.join(path, 'bitmap')
+
+        self.fs.makedir(path, recursive=True, allow_recreate=True)
+
+        nbytes = (self.nblocks + 7) // 8
+        bitmap = None
+
+        if self.fs.isfile(self._bitmap_path) and self.fs.isfile(
+                self._data_path):
+            bitmap = bytearray(self.fs.getcontents(self._bitmap_path, 'rb'))
+
+        if bitmap is None or len(bitmap) != nbytes:
+            bitmap = bytearray(nbytes)
+            self.fs.setcontents(self._data_path, b'')
+
+        self._bitmap = bitmap
+        self._data = self.fs.open(self._data_path, 'r+b')
+
+    def has_block(self, block):
+        return bool(self._bitmap[block // 8] & (1 << (block % 8)))
+
+    def filled_blocks(self):
+        return sum(1 for i in range(self.nblocks) if self.has_block(i))
+
+    def missing_runs(self, first, last):
+        '''
+        Yield ``(start, stop)`` ranges of unfilled blocks in [first, last]
+        '''
+
+        start = None
+
+        for block in range(first, last + 1):
+            if self.has_block(block):
+                if start is not None:
+                    yield start, block
+                    start = None
+
+            elif start is None:
+                start = block
+
+        if start is not None:
+            yield start, last + 1
+
+    def write_blocks(self, first, data):
+        '''
+        Store ``data`` starting at block ``first`` and mark its blocks filled
+        '''
+
+        self._data.seek(first * self.block_size)
+        self._data.write(data)
+        self._data.flush()
+
+        for block in range(
+                first, first + (len(data) + self.block_size - 1) //
+                self.block_size):
+            self._bitmap[block // 8] |= (1 << (block % 8))
+
+        # the bitmap is written after the data so filled blocks are complete
+        self.fs.setcontents(self._bitmap_path, bytes(self._bitmap))
+
+    def read(self, offset, size):
+        self._data.seek(offset)
+        return self._data.read(size)
+
+    def close(self):
+        self._data.close()
+
+
+class RangedReader(io.RawIOBase):
+    '''
+    Seekable read-only raw stream over a stored file
+
+    Parameters
+    ----------
+
+    filesystem : object
+        pyfilesystem object holding the file
+
+    path : str
+        Path of the file on ``filesystem``
+
+    size : int
+        Size of the file in bytes
+
+    block_cache : object
+        Optional :py:class:`BlockCache`. If given, reads are rounded out to
+        whole blocks, missing blocks are fetched and stored in the cache, and
+        data is served from the cache. The reader closes the cache on close.
+
+    Examples
+    --------
+
+    .. code-block:: python
+
+        >>> from fs.memoryfs import MemoryFS
+        >>> mem = MemoryFS()
+        >>> mem.setcontents('data.bin', b'0123456789' * 10)
+        >>>
+        >>> cache = BlockCache(MemoryFS(), 'blocks', 100, block_size=16)
+        >>> f = io.BufferedReader(
+        ...     RangedReader(mem, 'data.bin', 100, cache), buffer_size=16)
+        >>> _ = f.seek(42)
+        >>> print(f.read(5).decode('ascii'))
+        23456
+        >>> cache.filled_blocks()
+        1
+        >>> f.close()
+
+    '''
+
+    def __init__(self, filesystem, path, size, block_cache=None):
+        self._fs = filesystem
+        self._path = path
+        self._size = size
+        self._cache = block_cache
+        self._pos = 0
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def tell(self):
+        return self._pos
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        if whence == io.SEEK_SET:
+            pos = offset
+
+        elif whence == io.SEEK_CUR:
+            pos = self._pos + offset
+
+        elif whence == io.SEEK_END:
+            pos = self._size + offset
+
+        else:
+            raise ValueError('Invalid whence ({})'.format(whence))
+
+        if pos < 0:
+            raise ValueError('Negative seek position {}'.format(pos))
+
+        self._pos = pos
+
+        return self._pos
+
+    def _read(self, offset, size):
+        if self._cache is None:
+            return read_range(self._fs, self._path, offset, size)
+
+        block_size = self._cache.block_size
+        first = offset // block_size
+        last = (offset + size - 1) // block_size
+
+        for start, stop in self._cache.missing_runs(first, last):
+            fetch_offset = start * block_size
+            fetch_size = min(stop * block_size, self._size) - fetch_offset
+
+            self._cache.write_blocks(
+                start,
+                read_range(self._fs, self._path, fetch_offset, fetch_size))
+
+        return self._cache.read(offset, size)
+
+    def readinto(self, b):
+        size = min(len(b), self._size - self._pos)
+
+        if size <= 0:
+            return 0
+
+        data = self._read(self._pos, size)
+
+        n = len(data)
+        b[:n] = data
+        self._pos += n
+
+        return n
+
+    def close(self):
+        if not self.closed and self._cache is not None:
+            self._cache.close()
+
+        super(RangedReader, self).close()
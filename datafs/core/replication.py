@@ -0,0 +1,218 @@
+'''
+Replication of archive data between authorities
+
+:py:func:`replicate` copies the objects storing each version of a set of
+archives from one authority to another. Objects already stored on the
+destination with the recorded checksum are skipped, and each copied object is
+checked against its checksum before it is counted. Once all of an archive's
+objects are on the destination, the archive's record can be moved to the
+destination authority.
+'''
+
+from __future__ import absolute_import
+
+import time
+import fs.path
+from multiprocessing.pool import ThreadPool
+
+from datafs.core import data_file
+from datafs.core import verify
+from datafs.services import transfer
+
+
+BATCH_SIZE = 100
+THREADS = 8
+
+
+def _replicate_object(src_fs, dst_fs, obj, quick):
+    '''
+    Copy an object unless it is already valid on the destination
+
+    Returns the number of bytes copied (``None`` if skipped)
+    '''
+
+    if verify._check_object(dst_fs, obj, quick, None, False) is None:
+        return None
+
+    data_file._makedirs(dst_fs, fs.path.dirname(obj['path']))
+    transfer.copyfile(src_fs, obj['path'], dst_fs, obj['path'])
+
+    problem = verify._check_object(dst_fs, obj, False, None, False)
+
+    if problem is not None:
+        dst_fs.remove(obj['path'])
+
+        raise IOError('Copy of "{}" failed verification: {}'.format(
+            obj['path'], problem.get('reason', problem['problem'])))
+
+    return dst_fs.getsize(obj['path'])
+
+
+def replicate(
+        api,
+        src_authority,
+        dst_authority,
+        prefix=None,
+        switch=False,
+        quick=False,
+        threads=THREADS,
+        batch_size=BATCH_SIZE,
+        callback=None):
+    '''
+    Copy archive data from one authority to another
+
+    Parameters
+    ----------
+
+    api : :py:class:`~datafs.DataAPI`
+
+    src_authority : str
+        Name of the authority to copy from. Only archives on this authority
+        are replicated.
+
+    dst_authority : str
+        Name of the authority to copy to
+
+    prefix : str
+        Only replicate archives whose names start with ``prefix``
+
+    switch : bool
+        Move each archive to ``dst_authority`` in the manager once all of its
+        versions are stored and verified there (default False)
+
+    quick : bool
+        Treat objects on the destination with the recorded size as up to
+        date without reading them. Copied objects are always verified.
+
+    threads : int
+        Number of concurrent transfers (default ``THREADS``)
+
+    batch_size : int
+        Number of archives listed per manager query (default
+        ``BATCH_SIZE``)
+
+    callback : function
+        Called with ``(archive_name, error, completed, total)`` as each
+        archive finishes. ``error`` is ``None`` on success. ``total`` counts
+        the archives matching ``prefix`` on any authority.
+
+    Returns
+    -------
+
+    report : dict
+        Dictionary with the number of objects ``copied`` and ``skipped``,
+        the ``bytes`` copied, the elapsed ``seconds``, the ``throughput`` in
+        bytes per second, the archives ``switched`` to the destination and
+        any ``errors`` keyed by archive name.
+
+    '''
+
+    for authority_name in [src_authority, dst_authority]:
+        if authority_name not in api._authorities:
+            raise ValueError(
+                'Authority "{}" not found'.format(authority_name))
+
+    if src_authority == dst_authority:
+        raise ValueError('Source and destination authorities are the same')
+
+    src_fs = api._authorities[src_authority].fs
+    dst_fs = api._authorities[dst_authority].fs
+
+    report = {
+        'copied': 0,
+        'skipped': 0,
+        'bytes': 0,
+        'seconds': 0,
+        'throughput': 0,
+        'switched': [],
+        'errors': {}}
+
+    start_time = time.time()
+
+    archive_names = sorted(api.manager.search([], begins_with=prefix))
+
+    # objects shared between archives (e.g. content-addressed blobs) are
+    # only copied once
+    replicated = {}
+
+    completed = 0
+    pool = ThreadPool(threads)
+
+    try:
+        for start in range(0, len(archive_names), batch_size):
+            batch = archive_names[start:start + batch_size]
+
+            archives, histories = api._batch_get_archive(
+                batch, include_history=True)
+
+            tasks = []
+
+            for archive_name in batch:
+                archive = archives.get(archive_name)
+
+                if archive is None or archive.authority_name != src_authority:
+                    completed += 1
+                    continue
+
+                results = []
+
+                for obj in verify.get_objects(
+                        archive, histories.get(archive_name, [])):
+
+                    if obj['path'] not in replicated:
+                        replicated[obj['path']] = pool.apply_async(
+                            _replicate_object, (src_fs, dst_fs, obj, quick))
+
+                    results.append(replicated[obj['path']])
+
+                tasks.append((archive_name, results))
+
+            for archive_name, results in tasks:
+                error = None
+
+                for result in results:
+                    try:
+                        result.get()
+
+                    except Exception as e:
+                        error = e
+
+                if error is None and switch:
+                    api.manager.update_authority_name(
+                        archive_name, dst_authority)
+
+                    report['switched'].append(archive_name)
+
+                if error is not None:
+                    report['errors'][archive_name] = error
+
+                completed += 1
+
+                if callback is not None:
+                    callback(
+                        archive_name, error, completed, len(archive_names))
+
+    finally:
+        pool.close()
+        pool.join()
+
+    for result in replicated.values():
+        try:
+            copied = result.get()
+
+        except Exception:
+            continue
+
+        if copied is None:
+            report['skipped'] += 1
+
+        else:
+            report['copied'] += 1
+            report['bytes'] += copied
+
+    report['seconds'] = time.time() - start_time
+
+    if report['seconds'] > 0:
+        report['throughput'] = report['bytes'] / report['seconds']
+
+    return report
@@ -0,0 +1,521 @@
+'''
+Integrity checks of stored archive data against the manager's checksums
+
+:py:func:`verify` streams archive listings from the manager in batches and
+checks every stored object (version files, content-addressed blobs and
+chunks) on an authority, and optionally on the cache. Objects are first
+checked for existence and, where the version record includes a ``size``, for
+the expected size, which finds truncated and missing objects without reading
+them. Objects which pass are then hashed on a thread pool and compared with
+the recorded checksum.
+
+After all archives are checked, the services are walked for orphaned objects
+which are not referenced by any version. Progress can be saved to a
+checkpoint file after each batch, so an interrupted run over a large
+authority resumes where it stopped.
+'''
+
+from __future__ import absolute_import
+
+import os
+import json
+import time
+import threading
+import fs.path
+from multiprocessing.pool import ThreadPool
+
+from datafs.core import hashing
+from datafs.core import compression
+from datafs.services import transfer
+
+
+BATCH_SIZE = 100
+THREADS = 8
+
+_BLOB_DIR = '.blobs'
+
+
+class RateLimiter(object):
+    '''
+    Limit the combined read rate of several threads
+
+    Parameters
+    ----------
+
+    rate : float
+        Maximum number of bytes per second
+
+    Examples
+    --------
+
+    .. code-block:: python
+
+        >>> limiter = RateLimiter(1e9)
+        >>> limiter.consume(1000)
+
+    '''
+
+    def __init__(self, rate):
+        self.rate = float(rate)
+        self._lock = threading.Lock()
+        self._next = time.time()
+
+    def consume(self, nbytes):
+        '''
+        Block until ``nbytes`` more bytes may be read
+        '''
+
+        with self._lock:
+            now = time.time()
+            start = max(now, self._next)
+            self._next = start + nbytes / self.rate
+
+        if start > now:
+            time.sleep(start - now)
+
+
+class _ThrottledReader(object):
+
+    def __init__(self, f, limiter):
+        self._f = f
+        self._limiter = limiter
+
+    def read(self, size=-1):
+        data = self._f.read(size)
+
+        if self._limiter is not None:
+            self._limiter.consume(len(data))
+
+        return data
+
+    def close(self):
+        self._f.close()
+
+
+def get_objects(archive, history, blobs=True):
+    '''
+    List the objects storing an archive's versions
+
+    Parameters
+    ----------
+
+    archive : object
+        :py:class:`~datafs.core.data_archive.DataArchive` object
+
+    history : list
+        The archive's version history
+
+    blobs : bool
+        Include content-addressed blobs, which may be shared with other
+        archives (default True)
+
+    Returns
+    -------
+
+    objects : list
+        Dicts with each object's ``path`` and the ``algorithm``,
+        ``checksum``, ``codec`` and (if recorded) ``size`` and
+        ``chunk_size`` of its decoded contents. The chunk digests of
+        tree-hashed versions and the manifests of chunked versions are
+        listed as blobs.
+    '''
+
+    if not archive.versioned:
+        # unversioned archives overwrite their data unless content-addressed
+        history = [
+            record for i, record in enumerate(history)
+            if record.get('path') or i == len(history) - 1]
+
+    objects = []
+
+    for record in history:
+        version = None if str(record['version']) == 'None' else (
+            record['version'])
+
+        codec = record.get('compression')
+
+        base, tree = hashing.split_algorithm(record.get('algorithm', 'md5'))
+
+        if tree and 'chunks' not in record:
+            objects.append({
+                'archive_name': archive.archive_name,
+                'version': version,
+                'path': archive._get_chunk_digests_path(record),
+                'algorithm': base,
+                'checksum': record['checksum'],
+                'codec': None})
+
+        if archive._is_chunked(record):
+            if 'manifest_checksum' in record:
+                objects.append({
+                    'archive_name': archive.archive_name,
+                    'version': version,
+                    'path': archive._get_manifest_path(record),
+                    'algorithm': record['manifest_algorithm'],
+                    'checksum': record['manifest_checksum'],
+                    'codec': None})
+
+            for path, (digest, size) in zip(
+                    archive._get_chunk_paths(record),
+                    archive._get_manifest(record)):
+
+                objects.append({
+                    'archive_name': archive.archive_name,
+                    'version': version,
+                    'path': path,
+                    'algorithm': record['manifest_algorithm'],
+                    'checksum': digest,
+                    'codec': codec,
+                    'size': int(size)})
+
+            continue
+
+        obj = {
+            'archive_name': archive.archive_name,
+            'version': version,
+            'path': archive._get_storage_path(version, record),
+            'algorithm': record.get('algorithm', 'md5'),
+            'checksum': record['checksum'],
+            'codec': codec}
+
+        # DynamoDB returns numbers as Decimal objects
+        for key in ['size', 'chunk_size']:
+            if record.get(key) is not None:
+                obj[key] = int(record[key])
+
+        objects.append(obj)
+
+    if not blobs:
+        objects = [
+            obj for obj in objects
+            if not obj['path'].startswith(_BLOB_DIR + '/')]
+
+    return objects
+
+
+def _check_object(filesystem, obj, quick, limiter, missing_ok):
+    '''
+    Check a stored object, returning a problem dict or ``None``
+    '''
+
+    problem = dict(
+        (k, obj[k]) for k in ['archive_name', 'version', 'path'])
+
+    if not filesystem.isfile(obj['path']):
+        if missing_ok:
+            return None
+
+        problem['problem'] = 'missing'
+        return problem
+
+    # compressed objects are stored with a different size
+    if obj.get('size') is not None and obj['codec'] is None:
+        size = filesystem.getsize(obj['path'])
+
+        if size != obj['size']:
+            problem['problem'] = 'corrupt'
+            problem['reason'] = 'size {} != {}'.format(size, obj['size'])
+            return problem
+
+    if quick:
+        return None
+
+    f = _ThrottledReader(filesystem.open(obj['path'], 'rb'), limiter)
+
+    if obj['codec'] is not None:
+        f = compression.open_decompressed(f, obj['codec'])
+
+    try:
+        checksum = hashing.hash_filelike(
+            f,
+            algorithm=obj['algorithm'],
+            chunk_size=obj.get('chunk_size'),
+            threads=1)['checksum']
+
+    finally:
+        f.close()
+
+    if checksum != obj['checksum']:
+        problem['problem'] = 'corrupt'
+        problem['reason'] = 'checksum {} != {}'.format(
+            checksum, obj['checksum'])
+        return problem
+
+    return None
+
+
+def _walk_orphans(filesystem, referenced, prefix):
+    '''
+    Yield files on ``filesystem`` which are not in ``referenced``
+
+    Without a prefix, the whole filesystem is walked, including
+    content-addressed blobs. Other hidden top-level directories (e.g. the
+    ranged block cache) and partial transfers are skipped.
+    '''
+
+    if prefix is None:
+        top = '/'
+
+    else:
+        top = prefix if prefix.endswith('/') else fs.path.dirname(prefix)
+
+        if not top or not filesystem.isdir(top):
+            top = '/'
+
+    for path in filesystem.walkfiles(top):
+        path = fs.path.relpath(fs.path.normpath(path))
+
+        if prefix is not None and not path.startswith(prefix):
+            continue
+
+        head = path.split('/')[0]
+
+        if head.startswith('.') and head != _BLOB_DIR:
+            continue
+
+        if path.endswith(transfer.PARTIAL_SUFFIX) or path.endswith(
+                transfer.CHECKPOINT_SUFFIX):
+            continue
+
+        if path not in referenced:
+            yield path
+
+
+def _read_checkpoint(checkpoint, options):
+
+    if checkpoint is None or not os.path.isfile(checkpoint):
+        return None
+
+    with open(checkpoint, 'r') as f:
+        state = json.load(f)
+
+    if state['options'] != options:
+        raise ValueError(
+            'Checkpoint "{}" was written with different options: {}'.format(
+                checkpoint, state['options']))
+
+    return state
+
+
+def _write_checkpoint(checkpoint, state):
+
+    tmp = checkpoint + '.tmp'
+
+    with open(tmp, 'w') as f:
+        json.dump(state, f)
+
+    if os.path.exists(checkpoint):
+        os.remove(checkpoint)
+
+    os.rename(tmp, checkpoint)
+
+
+def verify(
+        api,
+        prefix=None,
+        authority_name=None,
+        cache=False,
+        quick=False,
+        orphans=True,
+        threads=THREADS,
+        rate_limit=None,
+        checkpoint=None,
+        batch_size=BATCH_SIZE,
+        callback=None):
+    '''
+    Check stored objects against the checksums recorded in the manager
+
+    Parameters
+    ----------
+
+    api : :py:class:`~datafs.DataAPI`
+
+    prefix : str
+        Only check archives whose names start with ``prefix``
+
+    authority_name : str
+        Only check archives on this authority (default all authorities)
+
+    cache : bool
+        Also check the copies in the cache. Objects missing from the cache
+        are not reported.
+
+    quick : bool
+        Only check that objects exist and have the recorded size
+
+    orphans : bool
+        Report objects which are not referenced by any version (default
+        True)
+
+    threads : int
+        Number of objects checked concurrently (default ``THREADS``)
+
+    rate_limit : float
+        Maximum combined read rate in bytes per second (default unlimited)
+
+    checkpoint : str
+        Local path of a checkpoint file. Progress is saved after each batch
+        of archives and a run with the same options resumes from it. The
+        checkpoint is removed when the run completes.
+
+    batch_size : int
+        Number of archives listed per manager query (default
+        ``BATCH_SIZE``)
+
+    callback : function
+        Called with ``(checked, total)`` archive counts after each batch
+
+    Returns
+    -------
+
+    report : dict
+        Dictionary with the number of objects ``checked`` and lists of
+        ``missing``, ``corrupt`` and ``orphaned`` objects, and of objects
+        which could not be read (``errors``). Each entry includes the
+        ``service`` (an authority name or ``'cache'``) and ``path`` of the
+        object. Other entries also include the ``archive_name`` and
+        ``version``, and corrupt objects and errors include a ``reason``.
+
+    '''
+
+    if cache and not api.cache:
+        raise ValueError('No cache attached')
+
+    if authority_name is not None:
+        api._validate_authority_name(authority_name)
+
+        if authority_name not in api._authorities:
+            raise ValueError(
+                'Authority "{}" not found'.format(authority_name))
+
+    options = {
+        'prefix': prefix,
+        'authority_name': authority_name,
+        'cache': cache,
+        'quick': quick,
+        'orphans': orphans}
+
+    state = _read_checkpoint(checkpoint, options)
+
+    if state is None:
+        state = {
+            'options': options,
+            'last': None,
+            'report': {
+                'checked': 0,
+                'missing': [],
+                'corrupt': [],
+                'orphaned': [],
+                'errors': []}}
+
+    report = state['report']
+
+    limiter = None if rate_limit is None else RateLimiter(rate_limit)
+
+    # paths referenced by versions on each service, for the orphan walk
+    referenced = {}
+    checked = set()
+
+    archive_names = sorted(api.manager.search([], begins_with=prefix))
+
+    pool = ThreadPool(threads)
+
+    try:
+        for start in range(0, len(archive_names), batch_size):
+            batch = archive_names[start:start + batch_size]
+
+            archives, histories = api._batch_get_archive(
+                batch, include_history=True)
+
+            done = state['last'] is not None and batch[-1] <= state['last']
+            tasks = []
+
+            for archive_name in batch:
+                if archive_name not in archives:
+                    continue
+
+                archive = archives[archive_name]
+
+                selected = not done and (
+                    authority_name in (None, archive.authority_name))
+
+                services = [(archive.authority_name, archive.authority)]
+
+                if cache:
+                    services.append(('cache', api.cache))
+
+                for obj in get_objects(
+                        archive, histories.get(archive_name, [])):
+
+                    for service_name, service in services:
+                        referenced.setdefault(
+                            service_name, set()).add(obj['path'])
+
+                        key = (service_name, obj['path'])
+
+                        if key in checked:
+                            continue
+
+                        checked.add(key)
+
+                        if not selected:
+                            continue
+
+                        tasks.append((obj, service_name, pool.apply_async(
+                            _check_object,
+                            (service.fs, obj, quick, limiter,
+                                service_name == 'cache'))))
+
+            for obj, service_name, task in tasks:
+                try:
+                    problem = task.get()
+
+                except Exception as e:
+                    problem = dict(
+                        (k, obj[k])
+                        for k in ['archive_name', 'version', 'path'])
+
+                    problem['problem'] = 'errors'
+                    problem['reason'] = '{}: {}'.format(type(e).__name__, e)
+
+                report['checked'] += 1
+
+                if problem is not None:
+                    problem['service'] = service_name
+                    report[problem.pop('problem')].append(problem)
+
+            if not done:
+                state['last'] = batch[-1]
+
+                if checkpoint is not None:
+                    _write_checkpoint(checkpoint, state)
+
+            if callback is not None:
+                callback(
+                    min(start + batch_size, len(archive_names)),
+                    len(archive_names))
+
+    finally:
+        pool.close()
+        pool.join()
+
+    if orphans:
+        services = list(api._authorities.items())
+
+        if authority_name is not None:
+            services = [(authority_name, api._authorities[authority_name])]
+
+        if cache:
+            services.append(('cache', api.cache))
+
+        for service_name, service in services:
+            for path in _walk_orphans(
+                    service.fs, referenced.get(service_name, set()), prefix):
+
+                report['orphaned'].append(
+                    {'service': service_name, 'path': path})
+
+    if checkpoint is not None and os.path.exists(checkpoint):
+        os.remove(checkpoint)
+
+    return report
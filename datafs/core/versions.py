@@ -1,15 +1,50 @@
 
 from __future__ import absolute_import
 
-import distutils.version
+import re
 from datafs._compat import string_types
 
 
-class BumpableVersion(distutils.version.StrictVersion):
+_VERSION_PATTERN = re.compile(
+    r'^([0-9]+)\.([0-9]+)(\.([0-9]+))?(([ab])([0-9]+))?$')
+
+
+def _parse(vstring):
+    '''
+    Parse a version string into ``(version, prerelease)`` tuples
     '''
 
-    Adds bumpversion functionality to python's native
-    :py:class:`~distutils.version.StrictVersion`
+    match = _VERSION_PATTERN.match(vstring)
+
+    if match is None:
+        raise ValueError("invalid version number '{}'".format(vstring))
+
+    major, minor, _, patch, _, stage, num = match.groups()
+
+    version = (int(major), int(minor), int(patch or 0))
+    prerelease = None if stage is None else (stage, int(num))
+
+    return version, prerelease
+
+
+def _make_key(version, prerelease):
+
+    # releases sort after their pre-releases
+    if prerelease is None:
+        return version, (1,)
+
+    return version, (0, prerelease[0], int(prerelease[1]))
+
+
+class BumpableVersion(object):
+    '''
+
+    Version number with bumpversion functionality
+
+    Versions follow the syntax and ordering of python's
+    :py:class:`~distutils.version.StrictVersion`. Each version is parsed once,
+    and its sort key is cached, so versions are cheap to compare, sort and
+    hash.
 
     Parameters
     ----------
@@ -38,8 +73,7 @@ class BumpableVersion(distutils.version.StrictVersion):
         Traceback (most recent call last):
         ValueError: invalid version number '1.a.f'
 
-    BumpableVersion subclasses python's native
-    :py:class:`distutils.version.StrictVersion`, which handles all comparisons:
+    Versions can be compared with other versions and with version strings:
 
     .. code-block:: python
 
@@ -51,6 +85,10 @@ class BumpableVersion(distutils.version.StrictVersion):
         >>>
         >>> BumpableVersion('0.2.0') > BumpableVersion('0.2.0a1')
         True
+        >>> BumpableVersion('0.2.0') == '0.2'
+        True
+        >>> len(set([BumpableVersion('0.2.0'), BumpableVersion('0.2')]))
+        1
 
     The :py:meth:`~BumpableVersion.bump` method allows the user to increment
     the version using the ``kind`` arugment, which can take the values
@@ -59,8 +97,87 @@ class BumpableVersion(distutils.version.StrictVersion):
 
     '''
 
+    __slots__ = ('_version', '_prerelease', '_key')
+
     def __init__(self, vstring='0.0.0'):
-        distutils.version.StrictVersion.__init__(self, vstring)
+        self._version, self._prerelease = _parse(vstring)
+        self._key = _make_key(self._version, self._prerelease)
+
+    @property
+    def version(self):
+        '''
+        Release segments as a ``(major, minor, patch)`` tuple
+        '''
+
+        return self._version
+
+    @version.setter
+    def version(self, version):
+        self._version = tuple(version)
+        self._key = _make_key(self._version, self._prerelease)
+
+    @property
+    def prerelease(self):
+        '''
+        Pre-release stage and number (e.g. ``('a', 1)``), or ``None``
+        '''
+
+        return self._prerelease
+
+    @prerelease.setter
+    def prerelease(self, prerelease):
+        self._prerelease = None if prerelease is None else tuple(prerelease)
+        self._key = _make_key(self._version, self._prerelease)
+
+    def __str__(self):
+        if self._version[2] == 0:
+            vstring = '{}.{}'.format(*self._version[:2])
+
+        else:
+            vstring = '{}.{}.{}'.format(*self._version)
+
+        if self._prerelease is not None:
+            vstring += '{}{}'.format(*self._prerelease)
+
+        return vstring
+
+    def __repr__(self):
+        return "{} ('{}')".format(self.__class__.__name__, self)
+
+    def __reduce__(self):
+        return (self.__class__, (str(self),))
+
+    def __hash__(self):
+        return hash(self._key)
+
+    def __eq__(self, other):
+        try:
+            other = _get_key(other)
+
+        except ValueError:
+            return False
+
+        return NotImplemented if other is None else self._key == other
+
+    def __ne__(self, other):
+        result = self.__eq__(other)
+        return result if result is NotImplemented else not result
+
+    def __lt__(self, other):
+        other = _get_key(other)
+        return NotImplemented if other is None else self._key < other
+
+    def __le__(self, other):
+        other = _get_key(other)
+        return NotImplemented if other is None else self._key <= other
+
+    def __gt__(self, other):
+        other = _get_key(other)
+        return NotImplemented if other is None else self._key > other
+
+    def __ge__(self, other):
+        other = _get_key(other)
+        return NotImplemented if other is None else self._key >= other
 
     def bump(self, kind=None, prerelease=None, inplace=True):
         '''
@@ -326,11 +443,204 @@ class BumpableVersion(distutils.version.StrictVersion):
 
         return new_prerelease
 
-    def __cmp__(self, other):
-        if other is None:
-            return False
-        elif isinstance(other, string_types):
-            other = distutils.version.StrictVersion(other)
-            return distutils.version.StrictVersion.__cmp__(self, other)
-        else:
-            return distutils.version.StrictVersion.__cmp__(self, other)
+
+def _get_version_key(version):
+    '''
+    Return a tuple which sorts in the same order as :py:class:`BumpableVersion`
+
+    Examples
+    --------
+
+    .. code-block:: python
+
+        >>> _get_version_key('1.2')
+        ((1, 2, 0), (1,))
+        >>> _get_version_key('1.2.0b3')
+        ((1, 2, 0), (0, 'b', 3))
+        >>> key = _get_version_key(BumpableVersion('1.2'))
+        >>> key == _get_version_key('1.2.0')
+        True
+        >>> _get_version_key('1.2.x')   # doctest: +ELLIPSIS
+        Traceback (most recent call last):
+        ValueError: invalid version number '1.2.x'
+
+    '''
+
+    if isinstance(version, BumpableVersion):
+        return version._key
+
+    # other version objects with StrictVersion's attributes
+    if hasattr(version, 'version') and hasattr(version, 'prerelease'):
+        return _make_key(tuple(version.version), version.prerelease)
+
+    return _make_key(*_parse(str(version)))
+
+
+def _get_key(other):
+    '''
+    Return the sort key of a comparison operand, or ``None`` if unsupported
+    '''
+
+    if isinstance(other, BumpableVersion):
+        return other._key
+
+    if isinstance(other, string_types):
+        return _get_version_key(other)
+
+    if hasattr(other, 'version') and hasattr(other, 'prerelease'):
+        return _get_version_key(other)
+
+    return None
+
+
+def _get_version_from_key(key):
+
+    version = BumpableVersion.__new__(BumpableVersion)
+    version._version = key[0]
+    version._prerelease = None if len(key[1]) == 1 else key[1][1:]
+    version._key = key
+
+    return version
+
+
+class VersionIndex(object):
+    '''
+    Index of an archive's version history
+
+    Version strings are parsed into sortable keys once, when the index is
+    built, so lookups of versions and their records do not parse or scan the
+    history. Versions are returned as new
+    :py:class:`BumpableVersion` objects, so bumping them in place does not
+    change the index. Where a version appears more than once (e.g. after
+    :py:meth:`~datafs.core.data_archive.DataArchive.set_dependencies`), its
+    latest record is used.
+
+    Parameters
+    ----------
+
+    history : list
+        Version history records, oldest first
+
+    versioned : bool
+        Whether the history belongs to a versioned archive (default True).
+        Records of unversioned archives all have the version ``None``.
+
+    Examples
+    --------
+
+    .. code-block:: python
+
+        >>> index = VersionIndex([
+        ...     {'version': '0.0.2', 'checksum': 'a'},
+        ...     {'version': '0.1', 'checksum': 'b'},
+        ...     {'version': '0.0.2', 'checksum': 'a', 'dependencies': {}}])
+        >>> index.versions
+        [BumpableVersion ('0.0.2'), BumpableVersion ('0.1')]
+        >>> index.latest
+        BumpableVersion ('0.1')
+        >>> index.get_record('0.0.2')['dependencies']
+        {}
+        >>> index.get_record('1.0') is None
+        True
+
+    '''
+
+    def __init__(self, history, versioned=True):
+        self.history = history
+        self.versioned = versioned
+
+        self._records = {}
+        self._names = {}
+
+        if versioned:
+            for record in history:
+                key = _get_version_key(record['version'])
+
+                self._records[key] = record
+                self._names[key] = str(record['version'])
+
+        self._keys = sorted(self._records.keys())
+
+    def __len__(self):
+        if not self.versioned:
+            return min(len(self.history), 1)
+
+        return len(self._keys)
+
+    @property
+    def versions(self):
+        '''
+        Sorted list of versions (``[None]`` for unversioned archives)
+        '''
+
+        if not self.versioned:
+            return [None] if len(self.history) > 0 else []
+
+        return [_get_version_from_key(key) for key in self._keys]
+
+    @property
+    def latest(self):
+        '''
+        The latest version (``None`` for empty and unversioned archives)
+        '''
+
+        if len(self._keys) == 0:
+            return None
+
+        return _get_version_from_key(self._keys[-1])
+
+    @property
+    def latest_record(self):
+        '''
+        The record of the latest version (``None`` for empty archives)
+        '''
+
+        if not self.versioned:
+            return self.history[-1] if len(self.history) > 0 else None
+
+        if len(self._keys) == 0:
+            return None
+
+        return self._records[self._keys[-1]]
+
+    def get_version(self, version):
+        '''
+        Return the indexed version equal to ``version``, or ``None``
+        '''
+
+        key = self._get_key(version)
+
+        if key not in self._records:
+            return None
+
+        return _get_version_from_key(key)
+
+    def get_name(self, version):
+        '''
+        Return the version string recorded for ``version``, or ``None``
+        '''
+
+        return self._names.get(self._get_key(version))
+
+    def get_record(self, version):
+        '''
+        Return the latest record of ``version``, or ``None``
+
+        On unversioned archives, the latest record is returned.
+        '''
+
+        if not self.versioned:
+            return self.latest_record
+
+        return self._records.get(self._get_key(version))
+
+    def _get_key(self, version):
+
+        if version is None:
+            return None
+
+        try:
+            return _get_version_key(version)
+
+        except ValueError:
+            return None
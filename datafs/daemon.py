@@ -0,0 +1,547 @@
+'''
+Local daemon which keeps APIs connected for the command line interface
+
+Every ``datafs`` command normally reads the config file, connects to the
+manager and builds the API's services before doing any work. ``datafs daemon
+start`` runs a :py:class:`Daemon` in the background instead, listening on a
+Unix socket. While it is running, the commands in :py:data:`COMMANDS` are sent
+to the daemon, which runs them with an API kept from earlier commands and
+returns their output. The manager's connections and the services are reused,
+so these commands skip the setup entirely.
+
+APIs are kept for each config file and profile, and are rebuilt when the
+config file changes. Requirements are read again for every command, since
+they depend on the working directory.
+
+The socket is ``daemon.sock`` in the DataFS config directory, or the path in
+the ``DATAFS_DAEMON_SOCKET`` environment variable. If no daemon is listening
+on it, commands run in the calling process as usual.
+'''
+
+from __future__ import absolute_import
+
+import os
+import sys
+import json
+import time
+import errno
+import socket
+import threading
+import traceback
+
+import click
+
+from datafs._compat import StringIO
+
+
+SOCKET_ENV = 'DATAFS_DAEMON_SOCKET'
+
+# seconds to wait for a daemon to start or stop
+TIMEOUT = 10
+
+# seconds the daemon waits on a client to send its request or to take the
+# reply, so a stalled client can't block the commands of others
+CLIENT_TIMEOUT = 10
+
+# commands which only use the API and don't prompt, so they can be run by
+# the daemon
+COMMANDS = set([
+    'add_tags',
+    'delete_tags',
+    'dependents',
+    'filter',
+    'get_dependencies',
+    'get_tags',
+    'history',
+    'listdir',
+    'log',
+    'metadata',
+    'search',
+    'set_dependencies',
+    'update_metadata',
+    'versions'])
+
+# the daemon running a command in this thread, if any
+_serving = threading.local()
+
+
+def get_current():
+    '''
+    Return the :py:class:`Daemon` running the current command, or ``None``
+    '''
+
+    return getattr(_serving, 'daemon', None)
+
+
+def get_socket_path(socket_path=None):
+    '''
+    Return the path of the daemon's socket
+
+    Parameters
+    ----------
+
+    socket_path : str
+        Path to use instead of the default (the ``DATAFS_DAEMON_SOCKET``
+        environment variable, or ``daemon.sock`` in the DataFS config
+        directory)
+    '''
+
+    if socket_path is None:
+        socket_path = os.environ.get(SOCKET_ENV)
+
+    if not socket_path:
+        socket_path = os.path.join(click.get_app_dir('datafs'), 'daemon.sock')
+
+    return socket_path
+
+
+def _connect(socket_path):
+    '''
+    Connect to the daemon's socket, or return ``None`` if no daemon is
+    listening on it
+    '''
+
+    if not hasattr(socket, 'AF_UNIX'):
+        return None
+
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+
+    try:
+        sock.connect(socket_path)
+
+    except socket.error as e:
+        sock.close()
+
+        if e.errno in (errno.ENOENT, errno.ECONNREFUSED):
+            return None
+
+        raise
+
+    return sock
+
+
+def _send(sock, message):
+    sock.sendall(json.dumps(message).encode('utf-8') + b'\n')
+
+
+def _receive(sock):
+    f = sock.makefile('rb')
+
+    try:
+        line = f.readline()
+
+    finally:
+        f.close()
+
+    if not line:
+        return None
+
+    return json.loads(line.decode('utf-8'))
+
+
+def request(message, socket_path=None):
+    '''
+    Send a message to the daemon and return its reply
+
+    Returns ``None`` if no daemon is listening on the socket.
+    '''
+
+    sock = _connect(get_socket_path(socket_path))
+
+    if sock is None:
+        return None
+
+    try:
+        _send(sock, message)
+        reply = _receive(sock)
+
+    finally:
+        sock.close()
+
+    if reply is None:
+        raise IOError('The daemon closed the connection without replying')
+
+    if 'error' in reply:
+        raise IOError(reply['error'])
+
+    return reply
+
+
+def run_command(
+        args,
+        config_file=None,
+        profile=None,
+        requirements=None,
+        socket_path=None):
+    '''
+    Run a command in the daemon
+
+    Parameters
+    ----------
+
+    args : list
+        Name and arguments of the command, e.g. ``['get_tags', 'my_archive']``
+
+    config_file : str
+        Config file (default: the daemon's default config file)
+
+    profile : str
+        Config profile (default: the config file's default profile)
+
+    requirements : str
+        Requirements file or string
+
+    socket_path : str
+        Daemon's socket (see :py:func:`get_socket_path`)
+
+    Returns
+    -------
+
+    reply : dict
+        The command's ``stdout``, ``stderr`` and ``exit_code``, or ``None`` if
+        no daemon is running
+
+    '''
+
+    if config_file is not None:
+        config_file = os.path.abspath(config_file)
+
+    if requirements is not None and os.path.isfile(requirements):
+        requirements = os.path.abspath(requirements)
+
+    return request({
+        'command': 'run',
+        'args': list(args),
+        'cwd': os.getcwd(),
+        'config_file': config_file,
+        'profile': profile,
+        'requirements': requirements}, socket_path)
+
+
+def status(socket_path=None):
+    '''
+    Return the status of the running daemon, or ``None`` if none is running
+    '''
+
+    return request({'command': 'status'}, socket_path)
+
+
+def start(socket_path=None, timeout=TIMEOUT):
+    '''
+    Start a daemon in a background process
+
+    The daemon's output is appended to a log file next to the socket.
+
+    Returns
+    -------
+
+    status : dict
+        The new daemon's status (see :py:meth:`Daemon.status`)
+
+    '''
+
+    import subprocess
+
+    socket_path = get_socket_path(socket_path)
+
+    if not hasattr(socket, 'AF_UNIX'):
+        raise ValueError('The daemon requires Unix sockets')
+
+    if status(socket_path) is not None:
+        raise ValueError(
+            'A daemon is already running on "{}"'.format(socket_path))
+
+    if not os.path.isdir(os.path.dirname(os.path.abspath(socket_path))):
+        os.makedirs(os.path.dirname(os.path.abspath(socket_path)))
+
+    log_path = socket_path + '.log'
+
+    with open(os.devnull, 'rb') as devnull:
+        with open(log_path, 'ab') as log:
+            process = subprocess.Popen(
+                [sys.executable, '-m', 'datafs.datafs', 'daemon', 'start',
+                    '--foreground', '--socket', socket_path],
+                stdin=devnull,
+                stdout=log,
+                stderr=log,
+                close_fds=True,
+                preexec_fn=os.setsid)
+
+    deadline = time.time() + timeout
+
+    while time.time() < deadline:
+        current = status(socket_path)
+
+        if current is not None:
+            return current
+
+        if process.poll() is not None:
+            raise IOError('The daemon exited with code {}. See "{}"'.format(
+                process.returncode, log_path))
+
+        time.sleep(0.05)
+
+    raise IOError('The daemon did not start within {} seconds'.format(
+        timeout))
+
+
+def stop(socket_path=None, timeout=TIMEOUT):
+    '''
+    Stop the running daemon
+
+    Returns the daemon's last status, or ``None`` if no daemon was running.
+    '''
+
+    socket_path = get_socket_path(socket_path)
+
+    reply = request({'command': 'stop'}, socket_path)
+
+    if reply is None:
+        return None
+
+    deadline = time.time() + timeout
+
+    while os.path.exists(socket_path) and time.time() < deadline:
+        time.sleep(0.05)
+
+    return reply
+
+
+class Daemon(object):
+    '''
+    Server running commands with APIs kept between commands
+
+    Commands are run one at a time, in the order they arrive. Connections
+    from clients which don't send a request or take the reply within
+    :py:data:`CLIENT_TIMEOUT` seconds are dropped.
+
+    Parameters
+    ----------
+
+    socket_path : str
+        Socket to listen on (see :py:func:`get_socket_path`)
+
+    '''
+
+    def __init__(self, socket_path=None):
+        self.socket_path = get_socket_path(socket_path)
+        self.started = None
+        self.requests = 0
+
+        self._apis = {}
+        self._running = False
+
+    def get_api(self, profile=None, config_file=None, requirements=None):
+        '''
+        Return the API for a profile, creating it if the config file changed
+
+        Takes the arguments of :py:func:`~datafs.get_api`.
+        '''
+
+        from datafs.config.config_file import ConfigFile
+        from datafs.config.helpers import get_api, _get_default_versions
+
+        config = ConfigFile(config_file=config_file)
+        config_file = os.path.abspath(config.config_file)
+
+        key = (config_file, profile)
+        modified = os.path.getmtime(config_file)
+
+        cached = self._apis.get(key)
+
+        if cached is None or cached['modified'] != modified:
+            if cached is not None:
+                del self._apis[key]
+                cached['api'].close()
+
+            api = get_api(
+                profile=profile,
+                config_file=config_file,
+                requirements=requirements)
+
+            config.read_config()
+
+            cached = {'modified': modified, 'config': config, 'api': api}
+            self._apis[key] = cached
+
+        api = cached['api']
+        api.default_versions = _get_default_versions(
+            cached['config'], requirements)
+
+        return api
+
+    def run(self, message):
+        '''
+        Run a command, returning its output and exit code
+        '''
+
+        from datafs.datafs import cli
+
+        args = []
+
+        for option in ['config_file', 'profile', 'requirements']:
+            if message.get(option) is not None:
+                args.extend(
+                    ['--' + option.replace('_', '-'), message[option]])
+
+        args.extend(message['args'])
+
+        stdout = StringIO()
+        stderr = StringIO()
+
+        # swapping the process-wide streams (and the working directory) is
+        # only safe because serve() handles one connection at a time
+        streams = sys.stdout, sys.stderr
+        cwd = os.getcwd()
+
+        exit_code = 0
+
+        try:
+            sys.stdout, sys.stderr = stdout, stderr
+            os.chdir(message['cwd'])
+            _serving.daemon = self
+
+            try:
+                result = cli.main(
+                    args=args, prog_name='datafs', standalone_mode=False)
+
+                if isinstance(result, int):
+                    exit_code = result
+
+            except click.ClickException as e:
+                e.show(file=stderr)
+                exit_code = e.exit_code
+
+            except click.Abort:
+                stderr.write('Aborted!\n')
+                exit_code = 1
+
+            except SystemExit as e:
+                if e.code is None or isinstance(e.code, int):
+                    exit_code = e.code or 0
+
+                else:
+                    stderr.write('{}\n'.format(e.code))
+                    exit_code = 1
+
+            except Exception:
+                traceback.print_exc(file=stderr)
+                exit_code = 1
+
+        finally:
+            _serving.daemon = None
+            os.chdir(cwd)
+            sys.stdout, sys.stderr = streams
+
+        self.requests += 1
+
+        return {
+            'exit_code': exit_code,
+            'stdout': stdout.getvalue(),
+            'stderr': stderr.getvalue()}
+
+    def status(self):
+        return {
+            'pid': os.getpid(),
+            'socket': self.socket_path,
+            'uptime': time.time() - self.started,
+            'requests': self.requests,
+            'apis': len(self._apis)}
+
+    def handle(self, message):
+        '''
+        Reply to a message from a client
+        '''
+
+        command = message.get('command')
+
+        if command == 'run':
+            return self.run(message)
+
+        elif command == 'status':
+            return self.status()
+
+        elif command == 'stop':
+            self._running = False
+            return self.status()
+
+        return {'error': 'Command "{}" not recognized'.format(command)}
+
+    def _handle_connection(self, connection):
+        try:
+            message = _receive(connection)
+
+            if message is None:
+                return
+
+            reply = self.handle(message)
+
+        except socket.timeout:
+            # the client never finished sending its request
+            return
+
+        except Exception as e:
+            reply = {'error': '{}: {}'.format(type(e).__name__, e)}
+
+        try:
+            _send(connection, reply)
+
+        except socket.error:
+            # the client went away
+            pass
+
+    def serve(self):
+        '''
+        Listen on the socket and run commands until stopped
+        '''
+
+        if status(self.socket_path) is not None:
+            raise ValueError(
+                'A daemon is already running on "{}"'.format(
+                    self.socket_path))
+
+        # remove the socket of a daemon which didn't shut down cleanly
+        if os.path.exists(self.socket_path):
+            os.remove(self.socket_path)
+
+        server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+
+        # only the user running the daemon may connect
+        umask = os.umask(0o077)
+
+        try:
+            server.bind(self.socket_path)
+
+        finally:
+            os.umask(umask)
+
+        server.listen(16)
+
+        self.started = time.time()
+        self._running = True
+
+        try:
+            while self._running:
+                connection, _ = server.accept()
+                connection.settimeout(CLIENT_TIMEOUT)
+
+                try:
+                    self._handle_connection(connection)
+
+                finally:
+                    connection.close()
+
+        finally:
+            self._running = False
+            server.close()
+
+            if os.path.exists(self.socket_path):
+                os.remove(self.socket_path)
+
+            self.close()
+
+    def close(self):
+        for cached in self._apis.values():
+            cached['api'].close()
+
+        self._apis = {}
@@ -10,9 +10,12 @@ from datafs.config.helpers import (
     _parse_requirement,
     check_requirements)
 from datafs._compat import u
+from datafs import daemon
 import click
+import json
 import sys
 import os
+import signal
 import pprint
 
 
@@ -57,6 +60,15 @@ def _parse_dependencies(dependency_args):
 
 def _generate_api(ctx):
 
+    # commands run by the daemon use its APIs (see datafs.daemon)
+    if daemon.get_current() is not None:
+        ctx.obj.api = daemon.get_current().get_api(
+            profile=ctx.obj.profile,
+            config_file=ctx.obj.config_file,
+            requirements=ctx.obj.requirements)
+
+        return
+
     ctx.obj.api = get_api(
         profile=ctx.obj.profile,
         config_file=ctx.obj.config_file,
@@ -68,11 +80,41 @@ class _DataFSInterface(object):
     def __init__(self):
         pass
 
+
+class _DataFSGroup(click.Group):
+    '''
+    Command group which sends commands to a running daemon
+
+    Commands in :py:data:`datafs.daemon.COMMANDS` are run by the daemon if
+    one is running, and in this process otherwise.
+    '''
+
+    def invoke(self, ctx):
+        args = ctx.protected_args + ctx.args
+
+        if (len(args) > 0
+                and args[0] in daemon.COMMANDS
+                and daemon.get_current() is None):
+
+            reply = daemon.run_command(
+                args,
+                config_file=ctx.params.get('config_file'),
+                profile=ctx.params.get('profile'),
+                requirements=ctx.params.get('requirements'))
+
+            if reply is not None:
+                click.echo(reply['stdout'], nl=False)
+                click.echo(reply['stderr'], nl=False, err=True)
+                ctx.exit(reply['exit_code'])
+
+        return super(_DataFSGroup, self).invoke(ctx)
+
 # this sets the command line environment for
 
 
 @click.group(
     name='datafs',
+    cls=_DataFSGroup,
     short_help='An abstraction layer for data storage systems')
 @click.option(
     '--config-file',
@@ -114,7 +156,8 @@ def cli(
     ctx.obj.profile = profile
 
     def teardown():
-        if hasattr(ctx.obj, 'api'):
+        # the daemon keeps its APIs open between commands
+        if hasattr(ctx.obj, 'api') and daemon.get_current() is None:
             ctx.obj.api.close()
 
     ctx.call_on_close(teardown)
@@ -338,20 +381,37 @@ def set_dependencies(ctx, archive_name, dependency=None):
     short_help='List the dependencies of an archive')
 @click.argument('archive_name')
 @click.option('--version', default=None)
+@click.option(
+    '--recursive',
+    is_flag=True,
+    help='List the pinned closure of all transitive dependencies')
+@click.option(
+    '--depth',
+    default=None,
+    type=int,
+    help='Levels of dependencies to resolve with --recursive')
 @click.pass_context
-def get_dependencies(ctx, archive_name, version):
+def get_dependencies(ctx, archive_name, version, recursive, depth):
     '''
     List the dependencies of an archive
+
+    With --recursive, the output can be saved as a requirements file to pin
+    every input of the archive.
     '''
 
     _generate_api(ctx)
 
-    var = ctx.obj.api.get_archive(archive_name)
-
     deps = []
 
-    dependencies = var.get_dependencies(version=version)
-    for arch, dep in dependencies.items():
+    if recursive:
+        dependencies = ctx.obj.api.resolve_dependencies(
+            archive_name, version=version, depth=depth)
+
+    else:
+        var = ctx.obj.api.get_archive(archive_name)
+        dependencies = var.get_dependencies(version=version)
+
+    for arch, dep in sorted(dependencies.items()):
         if dep is None:
             deps.append(arch)
         else:
@@ -360,6 +420,34 @@ def get_dependencies(ctx, archive_name, version):
     click.echo('\n'.join(deps))
 
 
+@cli.command(short_help='List the archive versions which depend on an archive')
+@click.argument('archive_name')
+@click.option(
+    '--version',
+    default=None,
+    help='List only dependents which pin this version')
+@click.pass_context
+def dependents(ctx, archive_name, version):
+    '''
+    List the archive versions which depend on an archive
+    '''
+
+    _generate_api(ctx)
+
+    results = []
+
+    for arch, versions in sorted(ctx.obj.api.get_dependents(
+            archive_name, version=version).items()):
+
+        for ver in versions:
+            if ver is None:
+                results.append(arch)
+            else:
+                results.append('{}=={}'.format(arch, ver))
+
+    click.echo('\n'.join(results))
+
+
 @cli.command(short_help='Add tags to an archive')
 @click.argument('archive_name')
 @click.argument('tags', nargs=-1)
@@ -432,6 +520,469 @@ def download(ctx, archive_name, filepath, version):
     click.echo('downloaded{} to {}'.format(archstr, filepath))
 
 
+@cli.command(short_help='Fetch archives into the cache')
+@click.argument('archive_names', nargs=-1)
+@click.option(
+    '--threads',
+    default=8,
+    type=int,
+    help='Number of concurrent transfers (default 8)')
+@click.pass_context
+def prefetch(ctx, archive_names, threads):
+    '''
+    Fetch archives into the cache
+
+    Caches the given archives, or every archive in the requirements file if
+    none are given, at the versions pinned in the requirements file.
+    Archives which are already cached and up to date are skipped.
+    '''
+
+    _generate_api(ctx)
+
+    if len(archive_names) == 0:
+        archive_names = list(ctx.obj.api.default_versions.keys())
+
+    def report(archive_name, error, completed, total):
+        if error is None:
+            click.echo('[{}/{}] prefetched {}'.format(
+                completed, total, archive_name))
+
+        else:
+            click.echo('[{}/{}] failed {}: {}'.format(
+                completed, total, archive_name, error), err=True)
+
+    errors = ctx.obj.api.prefetch(
+        archive_names, threads=threads, callback=report)
+
+    if len(errors) > 0:
+        ctx.exit(1)
+
+
+@cli.command(short_help='Check out the archives in a requirements file')
+@click.argument('requirements_file', type=click.Path(exists=True))
+@click.argument('dest', type=click.Path())
+@click.option(
+    '--threads',
+    default=8,
+    type=int,
+    help='Number of concurrent transfers (default 8)')
+@click.option(
+    '--link/--no-link',
+    default=True,
+    help='Hardlink files from the cache where possible (default --link)')
+@click.pass_context
+def checkout(ctx, requirements_file, dest, threads, link):
+    '''
+    Write the archives in a requirements file to a directory
+
+    Each archive is saved at its archive name within DEST, at the version
+    pinned in REQUIREMENTS_FILE. A manifest of versions and checksums is
+    written to DEST, and files which are unchanged since the last checkout
+    are skipped.
+    '''
+
+    _generate_api(ctx)
+
+    pins = {}
+
+    with open(requirements_file, 'r') as f:
+        for reqline in f.readlines():
+            if reqline.strip() == '':
+                continue
+
+            archive_name, version = _parse_requirement(reqline)
+            pins[archive_name] = version
+
+    def report(archive_name, error, completed, total):
+        if error is None:
+            click.echo('[{}/{}] checked out {}'.format(
+                completed, total, archive_name))
+
+        else:
+            click.echo('[{}/{}] failed {}: {}'.format(
+                completed, total, archive_name, error), err=True)
+
+    errors = ctx.obj.api.checkout(
+        pins, dest, threads=threads, callback=report, link=link)
+
+    if len(errors) > 0:
+        ctx.exit(1)
+
+
+@cli.command(short_help='Check stored data against recorded checksums')
+@click.option(
+    '--prefix',
+    default=None,
+    help='Only check archives whose names start with this prefix')
+@click.option(
+    '--authority',
+    'authority_name',
+    default=None,
+    help='Only check archives on this authority')
+@click.option(
+    '--cache',
+    is_flag=True,
+    help='Also check the copies in the cache')
+@click.option(
+    '--quick',
+    is_flag=True,
+    help='Only check that objects exist and have the recorded size')
+@click.option(
+    '--orphans/--no-orphans',
+    default=True,
+    help='Search for objects not referenced by any version')
+@click.option(
+    '--threads',
+    default=8,
+    type=int,
+    help='Number of objects checked concurrently (default 8)')
+@click.option(
+    '--rate-limit',
+    default=None,
+    type=float,
+    help='Maximum read rate in bytes per second')
+@click.option(
+    '--checkpoint',
+    default=None,
+    help='File in which progress is saved for resuming interrupted runs')
+@click.option(
+    '--report',
+    'report_file',
+    default=None,
+    help='Write the JSON report to this file instead of stdout')
+@click.pass_context
+def verify(
+        ctx,
+        prefix,
+        authority_name,
+        cache,
+        quick,
+        orphans,
+        threads,
+        rate_limit,
+        checkpoint,
+        report_file):
+    '''
+    Check stored data against the checksums recorded in the manager
+
+    Reports missing, corrupt and orphaned objects as JSON. Exits with an
+    error if any objects are missing, corrupt or unreadable.
+    '''
+
+    _generate_api(ctx)
+
+    def progress(checked, total):
+        click.echo('checked {}/{} archives'.format(checked, total), err=True)
+
+    report = ctx.obj.api.verify(
+        prefix=prefix,
+        authority_name=authority_name,
+        cache=cache,
+        quick=quick,
+        orphans=orphans,
+        threads=threads,
+        rate_limit=rate_limit,
+        checkpoint=checkpoint,
+        callback=progress)
+
+    if report_file is None:
+        click.echo(json.dumps(report, indent=2, sort_keys=True))
+
+    else:
+        with open(report_file, 'w+') as f:
+            json.dump(report, f, indent=2, sort_keys=True)
+
+    click.echo(
+        '{} objects checked: {} missing, {} corrupt, {} orphaned, '
+        '{} errors'.format(
+            report['checked'],
+            len(report['missing']),
+            len(report['corrupt']),
+            len(report['orphaned']),
+            len(report['errors'])),
+        err=True)
+
+    if report['missing'] or report['corrupt'] or report['errors']:
+        ctx.exit(1)
+
+
+@cli.command(short_help='Copy archive data between authorities')
+@click.argument('src_authority')
+@click.argument('dst_authority')
+@click.option(
+    '--prefix',
+    default=None,
+    help='Only replicate archives whose names start with this prefix')
+@click.option(
+    '--switch',
+    is_flag=True,
+    help='Move archives to the destination once their data is verified')
+@click.option(
+    '--quick',
+    is_flag=True,
+    help='Skip destination objects with the recorded size without reading')
+@click.option(
+    '--threads',
+    default=8,
+    type=int,
+    help='Number of concurrent transfers (default 8)')
+@click.pass_context
+def replicate(ctx, src_authority, dst_authority, prefix, switch, quick,
+              threads):
+    '''
+    Copy the archives on SRC_AUTHORITY to DST_AUTHORITY
+
+    Only versions which are missing or differ on the destination are copied.
+    '''
+
+    _generate_api(ctx)
+
+    def report_progress(archive_name, error, completed, total):
+        if error is None:
+            click.echo('[{}/{}] replicated {}'.format(
+                completed, total, archive_name))
+
+        else:
+            click.echo('[{}/{}] failed {}: {}'.format(
+                completed, total, archive_name, error), err=True)
+
+    report = ctx.obj.api.replicate(
+        src_authority,
+        dst_authority,
+        prefix=prefix,
+        switch=switch,
+        quick=quick,
+        threads=threads,
+        callback=report_progress)
+
+    click.echo(
+        'copied {} objects ({:.1f} MB) in {:.1f}s ({:.1f} MB/s), '
+        'skipped {}'.format(
+            report['copied'],
+            report['bytes'] / 1e6,
+            report['seconds'],
+            report['throughput'] / 1e6,
+            report['skipped']))
+
+    if switch:
+        click.echo('moved {} archives to {}'.format(
+            len(report['switched']), dst_authority))
+
+    if len(report['errors']) > 0:
+        ctx.exit(1)
+
+
+@cli.command(short_help='Remove files not referenced by any version')
+@click.option(
+    '--authority',
+    'authority_name',
+    default=None,
+    help='Only collect garbage on this authority')
+@click.option(
+    '--cache',
+    is_flag=True,
+    help='Also collect garbage in the cache')
+@click.option(
+    '--prefix',
+    default=None,
+    help='Only remove files whose paths start with this prefix')
+@click.option(
+    '--dry-run',
+    is_flag=True,
+    help='Report unreferenced files without removing them')
+@click.option(
+    '--min-age',
+    default=24 * 60 * 60,
+    type=float,
+    help='Only remove files older than this many seconds (default 1 day)')
+@click.option(
+    '--threads',
+    default=8,
+    type=int,
+    help='Number of concurrent removals (default 8)')
+@click.pass_context
+def gc(ctx, authority_name, cache, prefix, dry_run, min_age, threads):
+    '''
+    Remove stored files which are not referenced by any version
+
+    Use --dry-run to list the files which would be removed.
+    '''
+
+    _generate_api(ctx)
+
+    report = ctx.obj.api.collect_garbage(
+        authority_name=authority_name,
+        cache=cache,
+        prefix=prefix,
+        dry_run=dry_run,
+        min_age=min_age,
+        threads=threads)
+
+    for orphan in report['orphaned']:
+        click.echo('{}: {}'.format(orphan['service'], orphan['path']))
+
+    click.echo(
+        '{} files scanned, {} unreferenced, {} removed'.format(
+            report['scanned'],
+            len(report['orphaned']),
+            report['removed']),
+        err=True)
+
+
+@cli.group(short_help='Manage the write-behind journal')
+@click.pass_context
+def journal(ctx):
+    '''
+    Manage versions waiting to be uploaded by write-behind workers
+    '''
+
+    pass
+
+
+def _get_journal(ctx):
+
+    _generate_api(ctx)
+
+    if ctx.obj.api.journal is None:
+        click.echo('Write-behind is not enabled for this profile', err=True)
+        ctx.exit(1)
+
+    return ctx.obj.api.journal
+
+
+@journal.command(short_help='Show pending write-behind versions')
+@click.pass_context
+def status(ctx):
+    '''
+    Show versions waiting to be uploaded and registered
+    '''
+
+    entries = _get_journal(ctx).entries()
+    failed = [entry for entry in entries if entry['error'] is not None]
+
+    click.echo('{} pending, {} failed'.format(
+        len(entries) - len(failed), len(failed)))
+
+    for entry in entries:
+        version = entry['record']['version_metadata']['version']
+        archstr = entry['key'] + (
+            '' if version in (None, 'None') else ' v{}'.format(version))
+
+        if entry['error'] is None:
+            click.echo('pending {}'.format(archstr))
+
+        else:
+            click.echo('failed {} ({} attempts): {}'.format(
+                archstr, entry['attempts'], entry['error']))
+
+
+@journal.command(short_help='Upload pending write-behind versions')
+@click.pass_context
+def flush(ctx):
+    '''
+    Upload and register pending versions, retrying failed versions
+    '''
+
+    count = len(_get_journal(ctx).entries())
+
+    try:
+        ctx.obj.api.flush()
+
+    except IOError as e:
+        click.echo(str(e), err=True)
+        ctx.exit(1)
+
+    click.echo('flushed {} versions'.format(count))
+
+
+@cli.group(name='daemon', short_help='Manage the DataFS daemon')
+@click.pass_context
+def daemon_group(ctx):
+    '''
+    Keep APIs connected in a background process which runs commands
+
+    While the daemon is running, commands which only query or update the
+    manager (e.g. get_tags, search, metadata) are sent to it rather than
+    connecting to the manager and services on every call.
+    '''
+
+    pass
+
+
+@daemon_group.command(name='start', short_help='Start the daemon')
+@click.option(
+    '--socket',
+    'socket_path',
+    default=None,
+    help='Socket to listen on (default: $DATAFS_DAEMON_SOCKET or '
+    'daemon.sock in the config directory)')
+@click.option(
+    '--foreground',
+    is_flag=True,
+    help='Run the daemon in this process')
+@click.pass_context
+def daemon_start(ctx, socket_path, foreground):
+    '''
+    Start a daemon which runs commands with APIs kept between commands
+    '''
+
+    if foreground:
+        signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+        daemon.Daemon(socket_path).serve()
+        return
+
+    try:
+        current = daemon.start(socket_path)
+
+    except (ValueError, IOError) as e:
+        click.echo(str(e), err=True)
+        ctx.exit(1)
+
+    click.echo('started daemon (pid {}) on {}'.format(
+        current['pid'], current['socket']))
+
+
+@daemon_group.command(name='stop', short_help='Stop the daemon')
+@click.option('--socket', 'socket_path', default=None)
+@click.pass_context
+def daemon_stop(ctx, socket_path):
+    '''
+    Stop the running daemon
+    '''
+
+    last = daemon.stop(socket_path)
+
+    if last is None:
+        click.echo('No daemon is running', err=True)
+        ctx.exit(1)
+
+    click.echo('stopped daemon (pid {}) after {} requests'.format(
+        last['pid'], last['requests']))
+
+
+@daemon_group.command(name='status', short_help='Show the daemon\'s status')
+@click.option('--socket', 'socket_path', default=None)
+@click.pass_context
+def daemon_status(ctx, socket_path):
+    '''
+    Show whether a daemon is running, and the requests it has served
+    '''
+
+    current = daemon.status(socket_path)
+
+    if current is None:
+        click.echo('No daemon is running', err=True)
+        ctx.exit(1)
+
+    click.echo(
+        'daemon (pid {}) on {}: up {:.0f}s, {} requests, {} APIs'.format(
+            current['pid'],
+            current['socket'],
+            current['uptime'],
+            current['requests'],
+            current['apis']))
+
+
 @cli.command(short_help='Echo the contents of an archive')
 @click.argument('archive_name')
 @click.option('--version', default=None)
@@ -635,5 +1186,59 @@ def delete(ctx, archive_name):
     click.echo('deleted archive {}'.format(var))
 
 
+@cli.command(short_help='Delete a set of archives')
+@click.argument('archive_names', nargs=-1)
+@click.option(
+    '-t',
+    '--tag',
+    multiple=True,
+    help='Delete the archives with these tags')
+@click.option(
+    '--prefix',
+    default=None,
+    help='Delete the archives whose names start with this prefix')
+@click.option(
+    '--threads',
+    default=8,
+    type=int,
+    help='Number of concurrent delete requests (default 8)')
+@click.option(
+    '--yes',
+    is_flag=True,
+    help='Do not ask for confirmation')
+@click.pass_context
+def batch_delete(ctx, archive_names, tag, prefix, threads, yes):
+    '''
+    Delete the archives ARCHIVE_NAMES, or those matching --tag and --prefix
+    '''
+
+    _generate_api(ctx)
+
+    if len(archive_names) == 0:
+        archive_names = None
+
+    if not yes:
+        click.confirm(
+            'Permanently delete the selected archives and their data?',
+            abort=True)
+
+    report = ctx.obj.api.batch_delete(
+        archive_names,
+        query=(list(tag) or None),
+        prefix=prefix,
+        threads=threads)
+
+    for error in report['errors']:
+        click.echo(
+            'failed to remove {}: {}'.format(error['path'], error['reason']),
+            err=True)
+
+    click.echo('deleted {} archives ({} objects removed)'.format(
+        len(report['deleted']), report['removed']))
+
+    if len(report['errors']) > 0:
+        ctx.exit(1)
+
+
 if __name__ == '__main__':
     cli()
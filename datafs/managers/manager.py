@@ -94,6 +94,8 @@ class BaseDataManager(object):
             except KeyError:
                 pass
 
+        self._create_dependents_index(table_name)
+
     def update_spec_config(self, document_name, spec):
         '''
         Set the contents of a specification document by name
@@ -189,6 +191,8 @@ class BaseDataManager(object):
         else:
             self._delete_table(table_name + '.spec')
 
+        self._delete_dependents_index(table_name)
+
     def update(self, archive_name, version_metadata):
         '''
         Register a new version for archive ``archive_name``
@@ -206,6 +210,10 @@ class BaseDataManager(object):
 
         self._update(archive_name, version_metadata)
 
+        self._index_dependencies(
+            archive_name,
+            self._get_dependency_names([version_metadata]))
+
     def update_metadata(self, archive_name, archive_metadata):
         '''
         Update metadata for archive ``archive_name``
@@ -230,7 +238,8 @@ class BaseDataManager(object):
             metadata=None,
             user_config=None,
             tags=None,
-            helper=False):
+            helper=False,
+            compression=None):
         '''
         Create a new data archive
 
@@ -250,7 +259,8 @@ class BaseDataManager(object):
             metadata=metadata,
             user_config=user_config,
             tags=tags,
-            helper=helper)
+            helper=helper,
+            compression=compression)
 
         if raise_on_err:
             self._create_archive(
@@ -273,7 +283,8 @@ class BaseDataManager(object):
             metadata=None,
             user_config=None,
             tags=None,
-            helper=False):
+            helper=False,
+            compression=None):
 
         if metadata is None:
             metadata = {}
@@ -306,6 +317,10 @@ class BaseDataManager(object):
             'archive_metadata': metadata,
             'tags': tags
         }
+
+        if compression is not None:
+            archive_metadata['compression'] = compression
+
         archive_metadata.update(user_config)
 
         archive_metadata['creation_date'] = archive_metadata.get(
@@ -332,7 +347,7 @@ class BaseDataManager(object):
         except KeyError:
             raise KeyError('Archive "{}" not found'.format(archive_name))
 
-    def batch_get_archive(self, archive_names):
+    def batch_get_archive(self, archive_names, include_history=False):
         '''
         Batched version of :py:meth:`~DynamoDBManager._get_archive_listing`
 
@@ -351,6 +366,11 @@ class BaseDataManager(object):
 
             List of archive names
 
+        include_history : bool
+
+            Also return each archive's ``version_history`` from the same
+            query (default False)
+
         Returns
         -------
 
@@ -360,9 +380,10 @@ class BaseDataManager(object):
 
         '''
 
-        return map(
-            self._format_archive_listing_as_constructor_spec,
-            self._batch_get_archive_listing(archive_names))
+        return [
+            self._format_archive_listing_as_constructor_spec(
+                res, include_history=include_history)
+            for res in self._batch_get_archive_listing(archive_names)]
 
     def get_metadata(self, archive_name):
         '''
@@ -413,9 +434,166 @@ class BaseDataManager(object):
 
         self._delete_archive_record(archive_name)
 
+    def batch_delete_archive_records(self, archive_names):
+        '''
+        Batched version of :py:meth:`~BaseDataManager.delete_archive_record`
+
+        Parameters
+        ----------
+
+        archive_names : list
+            names of the archives to delete. Names which are not found are
+            ignored.
+
+        '''
+
+        archive_names = list(archive_names)
+
+        if len(archive_names) == 0:
+            return
+
+        self._batch_delete_archive_records(archive_names)
+
+    def update_authority_name(self, archive_name, authority_name):
+        '''
+        Move an archive's record to another authority
+
+        The archive's data must already be stored on the new authority at
+        the same paths (see :py:meth:`~datafs.DataAPI.replicate`).
+
+        Parameters
+        ----------
+
+        archive_name : str
+            name of the archive to move
+
+        authority_name : str
+            name of the authority now storing the archive
+
+        '''
+
+        self._set_authority_name(archive_name, authority_name)
+
     def get_version_history(self, archive_name):
         return self._get_version_history(archive_name)
 
+    def batch_get_version_history(self, archive_names):
+        '''
+        Batched version of :py:meth:`~BaseDataManager.get_version_history`
+
+        Parameters
+        ----------
+
+        archive_names : list
+
+            List of archive names
+
+        Returns
+        -------
+
+        version_histories : dict
+
+            Version histories keyed by archive name. Invalid archive names are
+            omitted.
+
+        '''
+
+        return {
+            res['_id']: res.get('version_history', [])
+            for res in self._batch_get_archive_listing(archive_names)}
+
+    def get_dependents(self, archive_name):
+        '''
+        Find the archive versions which depend on an archive
+
+        Candidate archives are found with the reverse-dependency index and
+        their version histories are retrieved in a single batched query. Only
+        the latest record of each version is used, so dependencies replaced
+        with :py:meth:`~datafs.core.DataArchive.set_dependencies` are not
+        returned.
+
+        Parameters
+        ----------
+
+        archive_name : str
+
+            Name of the dependency
+
+        Returns
+        -------
+
+        dependents : dict
+
+            Dictionary of ``{dependent_version: pinned_version}``
+            dictionaries keyed by dependent archive name. Versions are
+            ``None`` for unversioned archives and unpinned dependencies.
+
+        '''
+
+        candidates = list(self._get_dependent_archives(archive_name))
+
+        if len(candidates) == 0:
+            return {}
+
+        dependents = {}
+
+        histories = self.batch_get_version_history(candidates)
+
+        for dependent, history in histories.items():
+
+            # later records of a version replace earlier ones
+            records = {str(record['version']): record for record in history}
+
+            for version, record in records.items():
+                dependencies = {
+                    self._strip_authority(name): pin
+                    for name, pin in (
+                        record.get('dependencies') or {}).items()}
+
+                if archive_name not in dependencies:
+                    continue
+
+                pin = dependencies[archive_name]
+
+                dependents.setdefault(dependent, {})[
+                    None if version == 'None' else version] = (
+                        None if pin is None else str(pin))
+
+        return dependents
+
+    def rebuild_dependents_index(self):
+        '''
+        Index the dependencies of every archive in the table
+
+        Versions registered before the reverse-dependency index was added
+        are not returned by :py:meth:`get_dependents` until the index is
+        rebuilt. Rebuilding the index scans the full table.
+        '''
+
+        self._create_dependents_index(self._table_name)
+
+        archive_names = list(self.search([]))
+
+        for listing in self._batch_get_archive_listing(archive_names):
+            self._index_dependencies(
+                listing['_id'],
+                self._get_dependency_names(
+                    listing.get('version_history', [])))
+
+    @staticmethod
+    def _strip_authority(archive_name):
+        return archive_name.split('://', 1)[-1]
+
+    @classmethod
+    def _get_dependency_names(cls, version_history):
+        names = set()
+
+        for record in version_history:
+            for name in (record.get('dependencies') or {}):
+                names.add(cls._strip_authority(name))
+
+        return sorted(names)
+
     @classmethod
     def create_timestamp(cls):
         '''
@@ -513,13 +691,24 @@ class BaseDataManager(object):
         return self._format_archive_listing_as_constructor_spec(res)
 
     @staticmethod
-    def _format_archive_listing_as_constructor_spec(res):
+    def _format_archive_listing_as_constructor_spec(
+            res, include_history=False):
 
         res['archive_name'] = res.pop('_id')
 
-        spec = ['archive_name', 'authority_name', 'archive_path', 'versioned']
+        spec = [
+            'archive_name',
+            'authority_name',
+            'archive_path',
+            'versioned',
+            'compression']
 
-        return {k: v for k, v in res.items() if k in spec}
+        formatted = {k: v for k, v in res.items() if k in spec}
+
+        if include_history:
+            formatted['version_history'] = res.get('version_history', [])
+
+        return formatted
 
     def _get_archive_metadata(self, archive_name):
 
@@ -589,6 +778,10 @@ class BaseDataManager(object):
         raise NotImplementedError(
             'BaseDataManager cannot be used directly. Use a subclass.')
 
+    def _batch_delete_archive_records(self, archive_names):
+        raise NotImplementedError(
+            'BaseDataManager cannot be used directly. Use a subclass.')
+
     def _get_table_names(self):
         raise NotImplementedError(
             'BaseDataManager cannot be used directly. Use a subclass.')
@@ -616,3 +809,23 @@ class BaseDataManager(object):
     def _set_tags(self, archive_name, updated_tag_list):
         raise NotImplementedError(
             'BaseDataManager cannot be used directly. Use a subclass.')
+
+    def _set_authority_name(self, archive_name, authority_name):
+        raise NotImplementedError(
+            'BaseDataManager cannot be used directly. Use a subclass.')
+
+    def _create_dependents_index(self, table_name):
+        raise NotImplementedError(
+            'BaseDataManager cannot be used directly. Use a subclass.')
+
+    def _delete_dependents_index(self, table_name):
+        raise NotImplementedError(
+            'BaseDataManager cannot be used directly. Use a subclass.')
+
+    def _index_dependencies(self, archive_name, dependency_names):
+        raise NotImplementedError(
+            'BaseDataManager cannot be used directly. Use a subclass.')
+
+    def _get_dependent_archives(self, archive_name):
+        raise NotImplementedError(
+            'BaseDataManager cannot be used directly. Use a subclass.')
@@ -39,6 +39,11 @@ class DynamoDBManager(BaseDataManager):
         self._table = self._resource.Table(self._table_name)
         self._spec_table = self._resource.Table(self._spec_table_name)
 
+        self._dependents_table_name = self._table_name + '.dependents'
+        self._dependents_table = self._resource.Table(
+            self._dependents_table_name)
+        self._has_dependents_table = None
+
     @property
     def config(self):
         config = {
@@ -338,9 +343,112 @@ class DynamoDBManager(BaseDataManager):
 
         return self._table.delete_item(Key={'_id': archive_name})
 
+    def _batch_delete_archive_records(self, archive_names):
+
+        # the batch writer sends requests of up to 25 items and retries
+        # unprocessed items
+        with self._table.batch_writer() as batch:
+            for archive_name in archive_names:
+                batch.delete_item(Key={'_id': archive_name})
+
     def _get_spec_documents(self, table_name):
         return self._resource.Table(table_name + '.spec').scan()['Items']
 
+    def _set_authority_name(self, archive_name, authority_name):
+
+        self._table.update_item(
+                Key={'_id': archive_name},
+                UpdateExpression="SET authority_name = :a",
+                ExpressionAttributeValues={':a': authority_name},
+                ReturnValues='ALL_NEW')
+
+    def _create_dependents_index(self, table_name):
+        '''
+        Create the ``<table_name>.dependents`` side table
+
+        Each item maps a dependency (hash key ``dependency``) to an archive
+        which depends on it (range key ``_id``).
+        '''
+
+        dependents_table_name = table_name + '.dependents'
+
+        if dependents_table_name in self._get_table_names():
+            return
+
+        try:
+            table = self._resource.create_table(
+                TableName=dependents_table_name,
+                KeySchema=[
+                    {'AttributeName': 'dependency', 'KeyType': 'HASH'},
+                    {'AttributeName': '_id', 'KeyType': 'RANGE'}],
+                AttributeDefinitions=[
+                    {'AttributeName': 'dependency', 'AttributeType': 'S'},
+                    {'AttributeName': '_id', 'AttributeType': 'S'}],
+                ProvisionedThroughput={
+                    'ReadCapacityUnits': 123,
+                    'WriteCapacityUnits': 123})
+
+            table.meta.client.get_waiter('table_exists').wait(
+                TableName=dependents_table_name)
+
+        except ValueError:
+            # Error handling for windows incompatability issue
+            msg = 'Table creation failed'
+            assert dependents_table_name in self._get_table_names(), msg
+
+        if table_name == self._table_name:
+            self._has_dependents_table = True
+
+    def _delete_dependents_index(self, table_name):
+
+        dependents_table_name = table_name + '.dependents'
+
+        if dependents_table_name in self._get_table_names():
+            self._delete_table(dependents_table_name)
+
+        if table_name == self._table_name:
+            self._has_dependents_table = False
+
+    def _check_dependents_table(self):
+        if self._has_dependents_table is None:
+            self._has_dependents_table = (
+                self._dependents_table_name in self._get_table_names())
+
+        return self._has_dependents_table
+
+    def _index_dependencies(self, archive_name, dependency_names):
+
+        # tables created before the index was added are indexed with
+        # rebuild_dependents_index
+        if len(dependency_names) == 0 or not self._check_dependents_table():
+            return
+
+        with self._dependents_table.batch_writer() as batch:
+            for dependency in dependency_names:
+                batch.put_item(
+                    Item={'dependency': dependency, '_id': archive_name})
+
+    def _get_dependent_archives(self, archive_name):
+
+        if not self._check_dependents_table():
+            raise KeyError(
+                'Table "{}" not found. Use rebuild_dependents_index() to '
+                'create it.'.format(self._dependents_table_name))
+
+        kwargs = dict(
+            KeyConditionExpression=Key('dependency').eq(archive_name),
+            ProjectionExpression='#id',
+            ExpressionAttributeNames={"#id": "_id"})
+
+        while True:
+            res = self._dependents_table.query(**kwargs)
+            for r in res['Items']:
+                yield r['_id']
+            if 'LastEvaluatedKey' in res:
+                kwargs['ExclusiveStartKey'] = res['LastEvaluatedKey']
+            else:
+                break
+
     def _set_tags(self, archive_name, updated_tag_list):
 
         self._table.update_item(
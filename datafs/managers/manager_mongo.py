@@ -198,6 +198,10 @@ class MongoDBManager(BaseDataManager):
 
         return self.collection.remove({'_id': archive_name})
 
+    def _batch_delete_archive_records(self, archive_names):
+
+        return self.collection.remove({'_id': {'$in': archive_names}})
+
     def _search(self, search_terms, begins_with=None):
 
         if len(search_terms) == 0:
@@ -220,5 +224,40 @@ class MongoDBManager(BaseDataManager):
             {"_id": archive_name},
             {"$set": {"tags": updated_tag_list}})
 
+    def _set_authority_name(self, archive_name, authority_name):
+
+        self.collection.update(
+            {"_id": archive_name},
+            {"$set": {"authority_name": authority_name}})
+
     def _get_spec_documents(self, table_name):
         return [item for item in self.spec_collection.find({})]
+
+    def _create_dependents_index(self, table_name):
+        '''
+        Create a multikey index on the names of each archive's dependencies
+        '''
+
+        self.db[table_name].create_index('dependency_names')
+
+    def _delete_dependents_index(self, table_name):
+
+        # the index is dropped with the archive collection
+        pass
+
+    def _index_dependencies(self, archive_name, dependency_names):
+
+        if len(dependency_names) == 0:
+            return
+
+        self.collection.update(
+            {"_id": archive_name},
+            {"$addToSet": {"dependency_names": {"$each": dependency_names}}})
+
+    def _get_dependent_archives(self, archive_name):
+
+        res = self.collection.find(
+            {'dependency_names': archive_name}, {"_id": 1})
+
+        for r in res:
+            yield r['_id']
@@ -0,0 +1,133 @@
+'''
+Lazily constructed filesystems
+
+:py:class:`LazyFS` stands in for a pyfilesystem object which is only created
+the first time one of its attributes is used. Services built from a config
+file are wrapped in this proxy, so commands which only read or write the
+manager (``search``, ``get_tags``, ``metadata``) do not check local
+directories or connect to remote storage.
+'''
+
+from __future__ import absolute_import
+
+import time
+import threading
+
+
+_PROXY_ATTRS = set(['_get_class', '_args', '_kwargs', '_fs', '_lock'])
+
+
+class LazyFS(object):
+    '''
+    Proxy for a pyfilesystem object which is created on first access
+
+    Parameters
+    ----------
+
+    get_class : function
+        Function returning the filesystem's class. It is called when the
+        class is needed (see :py:attr:`wrapped_class`), which does not create
+        the filesystem.
+
+    args : list
+        Positional arguments used to create the filesystem
+
+    kwargs : dict
+        Keyword arguments used to create the filesystem
+
+    Attributes
+    ----------
+
+    wrapped_class : type
+        Class of the filesystem. Type checks of filesystems which may be
+        lazy should use ``getattr(fs, 'wrapped_class', type(fs))``.
+
+    connected : bool
+        Whether the filesystem has been created
+
+    connect_time : float
+        Seconds taken to create the filesystem (``None`` until connected)
+
+    Examples
+    --------
+
+    .. code-block:: python
+
+        >>> import tempfile
+        >>> from fs.osfs import OSFS
+        >>> tempdir = tempfile.mkdtemp()
+        >>> local = LazyFS(lambda: OSFS, [tempdir])
+        >>> local.connected
+        False
+        >>> issubclass(local.wrapped_class, OSFS)
+        True
+        >>> local.connected
+        False
+        >>> local.getsyspath('/') == OSFS(tempdir).getsyspath('/')
+        True
+        >>> local.connected
+        True
+        >>> local.close()
+        >>> import shutil
+        >>> shutil.rmtree(tempdir)
+
+    '''
+
+    def __init__(self, get_class, args=None, kwargs=None):
+        self._get_class = get_class
+        self._args = list(args) if args is not None else []
+        self._kwargs = dict(kwargs) if kwargs is not None else {}
+
+        self._fs = None
+        self._lock = threading.Lock()
+
+        self.connect_time = None
+
+    @property
+    def wrapped_class(self):
+        return self._get_class()
+
+    @property
+    def connected(self):
+        return self._fs is not None
+
+    def connect(self):
+        '''
+        Create the filesystem if it has not been created and return it
+        '''
+
+        if self._fs is None:
+            with self._lock:
+                if self._fs is None:
+                    start = time.time()
+                    filesystem = self._get_class()(
+                        *self._args, **self._kwargs)
+
+                    self.connect_time = time.time() - start
+                    self._fs = filesystem
+
+        return self._fs
+
+    def close(self):
+        if self._fs is not None:
+            self._fs.close()
+
+    def __getattr__(self, attr):
+        # only called for attributes not found on the proxy
+        if attr.startswith('__') or attr in _PROXY_ATTRS:
+            raise AttributeError(attr)
+
+        return getattr(self.connect(), attr)
+
+    def __enter__(self):
+        return self.connect().__enter__()
+
+    def __exit__(self, *args):
+        return self.connect().__exit__(*args)
+
+    def __repr__(self):
+        if self._fs is not None:
+            return repr(self._fs)
+
+        return '<{}:{} (not connected)>'.format(
+            type(self).__name__, self.wrapped_class.__name__)
@@ -2,21 +2,28 @@
 from __future__ import absolute_import
 
 import os
-import fs.utils
 import fs.path
 from fs.osfs import OSFS
+from datafs.core import compression as codecs
+from datafs.services import transfer
 
 
 class DataService(object):
 
-    def __init__(self, fs):
+    def __init__(self, fs, **transfer_options):
         self.fs = fs
+        self.transfer_options = transfer_options
+
+        if transfer_options:
+            transfer.set_options(fs, **transfer_options)
 
     def __repr__(self):
+        fs_class = getattr(self.fs, 'wrapped_class', type(self.fs))
+
         return "<{}:{} object at {}>".format(
-            self.__class__.__name__, self.fs.__class__.__name__, hex(id(self)))
+            self.__class__.__name__, fs_class.__name__, hex(id(self)))
 
-    def upload(self, filepath, service_path, remove=False):
+    def upload(self, filepath, service_path, remove=False, compression=None):
         '''
         "Upload" a file to a service
 
@@ -26,6 +33,9 @@ class DataService(object):
         If ``filepath`` and ``service_path`` paths are the same, ``upload``
         deletes the file if ``remove==True`` and returns.
 
+        If ``compression`` is given, the file is compressed as it is streamed
+        to the service.
+
         Parameters
         ----------
         filepath : str
@@ -38,6 +48,11 @@ class DataService(object):
 
         remove : bool
             If true, the file is moved rather than copied
+
+        compression : str
+            Name of a codec in
+            :py:func:`datafs.core.compression.available_codecs` (default
+            ``None``)
         '''
 
         local = OSFS(os.path.dirname(filepath))
@@ -47,6 +62,10 @@ class DataService(object):
             self.fs.getsyspath(service_path) == local.getsyspath(
                 os.path.basename(filepath))):
 
+            if compression is not None:
+                raise ValueError(
+                    'Cannot compress "{}" in place'.format(filepath))
+
             if remove:
                 os.remove(filepath)
 
@@ -58,15 +77,23 @@ class DataService(object):
                 recursive=True,
                 allow_recreate=True)
 
-        if remove:
-            fs.utils.movefile(
+        if compression is not None:
+            with open(filepath, 'rb') as src:
+                with self.fs.open(service_path, 'wb') as dst:
+                    codecs.compress_stream(src, dst, compression)
+
+            if remove:
+                os.remove(filepath)
+
+        elif remove:
+            transfer.movefile(
                 local,
                 os.path.basename(filepath),
                 self.fs,
                 service_path)
 
         else:
-            fs.utils.copyfile(
+            transfer.copyfile(
                 local,
                 os.path.basename(filepath),
                 self.fs,
@@ -0,0 +1,988 @@
+'''
+Transfer engine for copying and moving files between services
+
+When both ends of a transfer have a system path, files are copied by the
+kernel: with a copy-on-write reflink where the filesystem supports it (btrfs,
+XFS), otherwise with ``copy_file_range`` or ``sendfile``, so data is not
+copied through python. Moves on the same device are renames. Other transfers
+are streamed with a large buffer.
+
+Transfers between local files and S3 filesystems larger than the part size
+are split into parts which are transferred concurrently: multipart uploads to
+S3, and ranged GET requests for downloads. Failed parts are retried without
+restarting the transfer. The part size, concurrency and number of retries can
+be set for each filesystem with :py:func:`set_options`.
+
+Parallel transfers are resumable. Progress, including the MD5 digest of each
+completed part, is saved to a checkpoint file after every part. If a transfer
+fails, running it again skips the parts which were completed and verified.
+Downloads are written to a partial file next to the target, which is renamed
+into place only once every part is present and the copy has been verified.
+'''
+
+from __future__ import absolute_import
+
+import os
+import io
+import json
+import math
+import time
+import base64
+import binascii
+import errno
+import shutil
+import hashlib
+import weakref
+import tempfile
+import threading
+import fs.path
+from multiprocessing.pool import ThreadPool
+from datafs.core import ranged
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+
+BUFFER_SIZE = 8 * 1024 * 1024
+
+PART_SIZE = 16 * 1024 * 1024
+THREADS = 8
+RETRIES = 3
+
+# S3 limits on multipart uploads
+MIN_PART_SIZE = 5 * 1024 * 1024
+MAX_PARTS = 10000
+
+# S3 limit on keys per multi-object delete request
+MAX_DELETE_KEYS = 1000
+
+_OPTIONS = weakref.WeakKeyDictionary()
+
+# suffixes of the partial file and checkpoint of a resumable download
+PARTIAL_SUFFIX = '.datafs-partial'
+CHECKPOINT_SUFFIX = '.datafs-checkpoint'
+
+# checkpoints of resumable uploads (default: a directory in the temp dir)
+CHECKPOINT_DIR = None
+
+# _IOW(0x94, 9, int): clone a whole file on btrfs/XFS
+FICLONE = 0x40049409
+
+_UNSUPPORTED = set(
+    getattr(errno, name) for name in (
+        'ENOTSUP', 'EOPNOTSUPP', 'ENOSYS', 'EXDEV', 'EINVAL', 'ENOTTY',
+        'EBADF', 'ETXTBSY') if hasattr(errno, name))
+
+
+def _copy_reflink(src, dst, buffer_size=BUFFER_SIZE):
+    if fcntl is None:
+        raise OSError(errno.ENOSYS, 'reflinks not available')
+
+    with open(src, 'rb') as s:
+        with open(dst, 'wb') as d:
+            fcntl.ioctl(d.fileno(), FICLONE, s.fileno())
+
+
+def _copy_kernel(src, dst, func):
+    with open(src, 'rb') as s:
+        with open(dst, 'wb') as d:
+            remaining = os.fstat(s.fileno()).st_size
+
+            while remaining > 0:
+                n = func(s.fileno(), d.fileno(), remaining)
+
+                if n == 0:
+                    break
+
+                remaining -= n
+
+
+def _copy_file_range(src, dst, buffer_size=BUFFER_SIZE):
+    if not hasattr(os, 'copy_file_range'):
+        raise OSError(errno.ENOSYS, 'copy_file_range not available')
+
+    _copy_kernel(
+        src, dst, lambda s, d, count: os.copy_file_range(s, d, count))
+
+
+def _copy_sendfile(src, dst, buffer_size=BUFFER_SIZE):
+    if not hasattr(os, 'sendfile'):
+        raise OSError(errno.ENOSYS, 'sendfile not available')
+
+    # sendfile advances the offset of the input file when offset is None
+    _copy_kernel(
+        src, dst, lambda s, d, count: os.sendfile(d, s, None, count))
+
+
+def _copy_stream(src, dst, buffer_size=BUFFER_SIZE):
+    with open(src, 'rb') as s:
+        with open(dst, 'wb') as d:
+            shutil.copyfileobj(s, d, buffer_size)
+
+
+LOCAL_METHODS = [
+    ('reflink', _copy_reflink),
+    ('copy_file_range', _copy_file_range),
+    ('sendfile', _copy_sendfile),
+    ('stream', _copy_stream)]
+
+
+def copy_local(src, dst, buffer_size=BUFFER_SIZE, hardlink=False):
+    '''
+    Copy a file between system paths using the fastest available method
+
+    Parameters
+    ----------
+
+    src : str
+        Source system path
+
+    dst : str
+        Destination system path. Existing files are overwritten.
+
+    buffer_size : int
+        Buffer size used if the file has to be streamed
+
+    hardlink : bool
+        Link ``dst`` to ``src`` instead of copying, if possible (default
+        False). Only use links for files which are never modified in place,
+        since changes to either path are visible through both.
+
+    Returns
+    -------
+    method : str
+        Name of the method used (``'hardlink'`` or a name in
+        ``LOCAL_METHODS``)
+
+    Examples
+    --------
+
+    .. code-block:: python
+
+        >>> import tempfile
+        >>> tmp = tempfile.mkdtemp()
+        >>> src = os.path.join(tmp, 'src.txt')
+        >>> dst = os.path.join(tmp, 'dst.txt')
+        >>> with open(src, 'wb') as f:
+        ...     _ = f.write(b'hello!')
+        ...
+        >>> copy_local(src, dst) in dict(LOCAL_METHODS)
+        True
+        >>> with open(dst, 'rb') as f:
+        ...     print(f.read().decode('ascii'))
+        ...
+        hello!
+        >>> shutil.rmtree(tmp)
+
+    '''
+
+    if hardlink and hasattr(os, 'link'):
+        try:
+            if os.path.exists(dst):
+                os.remove(dst)
+
+            os.link(src, dst)
+            return 'hardlink'
+
+        except (IOError, OSError) as e:
+            if e.errno not in _UNSUPPORTED and e.errno != errno.EPERM:
+                raise
+
+    for name, method in LOCAL_METHODS:
+        try:
+            method(src, dst, buffer_size)
+            return name
+
+        except (IOError, OSError) as e:
+            if name == 'stream' or e.errno not in _UNSUPPORTED:
+                raise
+
+
+def set_options(filesystem, part_size=None, threads=None, retries=None):
+    '''
+    Set the options used for parallel transfers to and from ``filesystem``
+
+    Parameters
+    ----------
+
+    filesystem : object
+        pyfilesystem object (e.g. an S3FS)
+
+    part_size : int
+        Size in bytes of the parts uploaded or downloaded concurrently
+        (default ``PART_SIZE``). Files no larger than one part are transferred
+        in a single request.
+
+    threads : int
+        Number of parts transferred at a time (default ``THREADS``)
+
+    retries : int
+        Number of times a failed part is retried (default ``RETRIES``)
+    '''
+
+    if part_size is not None and part_size < MIN_PART_SIZE:
+        raise ValueError(
+            'part_size must be at least {} bytes'.format(MIN_PART_SIZE))
+
+    _OPTIONS[filesystem] = {
+        'part_size': part_size,
+        'threads': threads,
+        'retries': retries}
+
+
+def get_options(filesystem):
+    '''
+    Return the parallel transfer options for ``filesystem``, with defaults
+    '''
+
+    try:
+        options = _OPTIONS.get(filesystem, {})
+
+    except TypeError:
+        options = {}
+
+    return {
+        'part_size': options.get('part_size') or PART_SIZE,
+        'threads': options.get('threads') or THREADS,
+        'retries': (
+            RETRIES if options.get('retries') is None
+            else options['retries'])}
+
+
+def _is_s3(filesystem):
+    # check the class so the S3FS connection property is not evaluated, and
+    # check the wrapped class of lazy proxies (LazyFS) without creating them
+    cls = getattr(filesystem, 'wrapped_class', type(filesystem))
+    return hasattr(cls, '_s3bukt') and hasattr(cls, '_s3path')
+
+
+def _retry(func, retries, delay=0.5):
+    for attempt in range(retries + 1):
+        try:
+            return func()
+
+        except Exception:
+            if attempt == retries:
+                raise
+
+            time.sleep(delay * 2 ** attempt)
+
+
+def _get_parts(size, part_size):
+    # S3 allows at most MAX_PARTS parts in an upload
+    part_size = max(part_size, int(math.ceil(float(size) / MAX_PARTS)))
+
+    return [
+        (i + 1, offset, min(part_size, size - offset))
+        for i, offset in enumerate(range(0, size, part_size))]
+
+
+def _map_parts(func, parts, threads):
+    pool = ThreadPool(min(threads, len(parts)))
+
+    try:
+        pool.map(func, parts)
+
+    finally:
+        pool.close()
+        pool.join()
+
+
+class _Checkpoint(object):
+    '''
+    Progress of a resumable transfer, saved as JSON after each part
+
+    A saved checkpoint is only reused if it was written for the same
+    ``source``, a dict identifying the data and layout of the transfer.
+    '''
+
+    def __init__(self, path, source):
+        self.path = path
+        self.source = source
+        self.state = {}
+        self.parts = {}
+        self.etags = {}
+
+        self._lock = threading.Lock()
+
+        try:
+            with open(path, 'r') as f:
+                saved = json.load(f)
+
+        except (IOError, OSError, ValueError):
+            saved = {}
+
+        if saved.get('source') == source:
+            self.state = saved.get('state', {})
+            self.parts = saved.get('parts', {})
+            self.etags = saved.get('etags', {})
+
+    def _save(self):
+        # a unique temporary file, so concurrent transfers never write to
+        # each other's files
+        fd, tmp = tempfile.mkstemp(
+            dir=os.path.dirname(os.path.abspath(self.path)),
+            prefix=os.path.basename(self.path) + '.',
+            suffix='.tmp')
+
+        try:
+            with os.fdopen(fd, 'w') as f:
+                json.dump({
+                    'source': self.source,
+                    'state': self.state,
+                    'parts': self.parts,
+                    'etags': self.etags}, f)
+
+            getattr(os, 'replace', os.rename)(tmp, self.path)
+
+        except Exception:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+
+            raise
+
+    def update(self, **state):
+        with self._lock:
+            self.state.update(state)
+            self._save()
+
+    def reset_parts(self):
+        with self._lock:
+            self.parts = {}
+            self.etags = {}
+
+    def add_part(self, part_num, md5, etag=None):
+        with self._lock:
+            self.parts[str(part_num)] = md5
+
+            if etag is not None:
+                self.etags[str(part_num)] = etag
+
+            self._save()
+
+    def get_part(self, part_num):
+        return self.parts.get(str(part_num))
+
+    def get_etag(self, part_num):
+        return self.etags.get(str(part_num))
+
+    def remove(self):
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+
+def _md5_range(filepath, offset, size, buffer_size=BUFFER_SIZE):
+    '''
+    Return the MD5 digest of ``size`` bytes of a file at ``offset``
+    '''
+
+    md5 = hashlib.md5()
+
+    with open(filepath, 'rb') as f:
+        f.seek(offset)
+
+        while size > 0:
+            data = f.read(min(buffer_size, size))
+
+            if not data:
+                break
+
+            md5.update(data)
+            size -= len(data)
+
+    return md5.hexdigest()
+
+
+def _get_upload_checkpoint_path(key_name, bucket_name):
+    directory = CHECKPOINT_DIR or os.path.join(
+        tempfile.gettempdir(), 'datafs-transfers')
+
+    if not os.path.isdir(directory):
+        try:
+            os.makedirs(directory)
+
+        except OSError as e:
+            if e.errno != errno.EEXIST:
+                raise
+
+    name = hashlib.sha1('\n'.join([bucket_name, key_name]).encode(
+        'utf-8')).hexdigest()
+
+    return os.path.join(directory, name + '.json')
+
+
+def _find_upload(bucket, key_name, upload_id):
+    for upload in bucket.get_all_multipart_uploads():
+        if upload.id == upload_id and upload.key_name == key_name:
+            return upload
+
+    return None
+
+
+def _get_uploaded_parts(bucket, key_name, upload_id):
+    '''
+    Return ``{part_num: etag}`` for the parts stored in a multipart upload
+    '''
+
+    upload = _find_upload(bucket, key_name, upload_id)
+
+    if upload is None:
+        return None
+
+    return {
+        part.part_number: part.etag.strip('"') for part in upload}
+
+
+def upload_multipart(
+        filepath,
+        filesystem,
+        path,
+        part_size=PART_SIZE,
+        threads=THREADS,
+        retries=RETRIES):
+    '''
+    Upload a local file to an S3 filesystem in concurrent parts
+
+    Each part is read directly from ``filepath`` by its worker, uploaded with
+    its MD5 digest so S3 can check it, and retried up to ``retries`` times.
+
+    Progress is saved in a checkpoint in ``CHECKPOINT_DIR``, kept for each
+    destination, with the MD5 digest of each part and the ETag S3 returned
+    for it. If a part still fails, the multipart upload is left open and the
+    error is raised; uploading a file of the same size to the same path
+    again resumes the upload, skipping the parts S3 already holds with the
+    same data as the local file. The checkpoint does not depend on the
+    local path, so uploads from a new temporary copy of the file resume too.
+    If the open upload was aborted or has expired, a new one is started.
+    Before the upload is completed, the ETags of all stored parts are
+    checked against the checkpoint. Set a lifecycle rule on the bucket to
+    remove multipart uploads which are never resumed.
+
+    Part ETags are only the MD5 digest of the part on unencrypted and SSE-S3
+    buckets. With SSE-KMS or SSE-C they are not, so stored parts are matched
+    with the ETags recorded when they were uploaded (S3 checked each part
+    against its MD5 digest then).
+    '''
+
+    from boto.s3.multipart import MultiPartUpload
+
+    bucket = filesystem._s3bukt
+    key_name = filesystem._s3path(path)
+    stat = os.stat(filepath)
+    parts = _get_parts(stat.st_size, part_size)
+
+    # parts are matched by digest, so the local path and modification time
+    # are not part of the checkpoint's source
+    checkpoint = _Checkpoint(
+        _get_upload_checkpoint_path(key_name, bucket.name),
+        source={
+            'key': key_name,
+            'size': stat.st_size,
+            'part_size': parts[0][2]})
+
+    upload_id = checkpoint.state.get('upload_id')
+    uploaded = None
+    resumed = False
+
+    if upload_id is not None:
+        uploaded = _get_uploaded_parts(bucket, key_name, upload_id)
+        resumed = uploaded is not None
+
+    def get_upload():
+        # S3FS connections are thread-local
+        upload = MultiPartUpload(filesystem._s3bukt)
+        upload.key_name = key_name
+        upload.id = upload_id
+
+        return upload
+
+    def upload_part(part):
+        part_num, offset, size = part
+
+        md5 = _md5_range(filepath, offset, size)
+        etag = uploaded.get(part_num)
+
+        if etag is not None and (etag == md5 or (
+                checkpoint.get_part(part_num) == md5 and
+                checkpoint.get_etag(part_num) == etag)):
+
+            checkpoint.add_part(part_num, md5, etag)
+            return
+
+        def attempt():
+            with open(filepath, 'rb') as f:
+                f.seek(offset)
+                key = get_upload().upload_part_from_file(
+                    f,
+                    part_num,
+                    size=size,
+                    md5=(
+                        md5,
+                        base64.b64encode(
+                            binascii.unhexlify(md5)).decode('ascii')))
+
+            return key.etag.strip('"')
+
+        etag = _retry(attempt, retries)
+        checkpoint.add_part(part_num, md5, etag)
+
+    while True:
+        if uploaded is None:
+            upload_id = bucket.initiate_multipart_upload(key_name).id
+            uploaded = {}
+
+            checkpoint.reset_parts()
+            checkpoint.update(upload_id=upload_id)
+
+        _map_parts(upload_part, parts, threads)
+
+        stored = _get_uploaded_parts(
+            filesystem._s3bukt, key_name, upload_id)
+
+        if stored is not None:
+            break
+
+        if not resumed:
+            checkpoint.remove()
+
+            raise IOError(
+                'Multipart upload to "{}" was aborted'.format(path))
+
+        # the resumed upload was aborted or expired while the parts were
+        # sent. Start over with a new upload.
+        uploaded = None
+        resumed = False
+
+    for part_num, _, _ in parts:
+        if stored.get(part_num) != checkpoint.get_etag(part_num):
+            raise IOError(
+                'Part {} of upload to "{}" failed verification'.format(
+                    part_num, path))
+
+    get_upload().complete_upload()
+    checkpoint.remove()
+
+
+def _get_etag(filesystem, path):
+    if not _is_s3(filesystem):
+        return None
+
+    key = filesystem._s3bukt.get_key(filesystem._s3path(path))
+
+    if key is None:
+        return None
+
+    return key.etag
+
+
+def _verify_file(filepath, verify):
+    if verify is None:
+        return
+
+    with io.open(filepath, 'rb') as f:
+        valid = verify(f)
+
+    if not valid:
+        raise IOError('Copy of "{}" failed verification'.format(filepath))
+
+
+def download_ranged(
+        filesystem,
+        path,
+        filepath,
+        part_size=PART_SIZE,
+        threads=THREADS,
+        retries=RETRIES,
+        verify=None):
+    '''
+    Download a file to a local path in concurrent byte ranges
+
+    Each range is fetched with :py:func:`datafs.core.ranged.read_range`,
+    retried up to ``retries`` times, and written at its offset in a partial
+    file next to ``filepath``. The MD5 digest of each completed range is
+    saved in a checkpoint next to the partial file.
+
+    If the download fails, the partial file and checkpoint are kept.
+    Downloading the same source to the same path again checks the digests of
+    the ranges already on disk and fetches only the missing or damaged ones.
+
+    Once all ranges are present, ``verify`` (if given) is called with the
+    partial file opened for binary reading. If it returns False, the partial
+    file is discarded and an IOError is raised. Otherwise the partial file is
+    renamed to ``filepath``.
+    '''
+
+    size = filesystem.getsize(path)
+    parts = _get_parts(size, part_size)
+
+    partial = filepath + PARTIAL_SUFFIX
+
+    checkpoint = _Checkpoint(
+        partial + CHECKPOINT_SUFFIX,
+        source={
+            'path': path,
+            'size': size,
+            'etag': _get_etag(filesystem, path),
+            'part_size': parts[0][2] if parts else part_size})
+
+    if os.path.isfile(partial) and os.path.getsize(partial) == size:
+        for part_num, offset, nbytes in parts:
+            md5 = checkpoint.get_part(part_num)
+
+            if md5 is not None and (
+                    _md5_range(partial, offset, nbytes) != md5):
+                del checkpoint.parts[str(part_num)]
+
+    else:
+        checkpoint.parts = {}
+
+        with open(partial, 'wb') as f:
+            f.truncate(size)
+
+    def download_part(part):
+        part_num, offset, nbytes = part
+
+        data = _retry(
+            lambda: ranged.read_range(filesystem, path, offset, nbytes),
+            retries)
+
+        if len(data) != nbytes:
+            raise IOError(
+                'Incomplete read of "{}" at offset {}'.format(path, offset))
+
+        with open(partial, 'r+b') as f:
+            f.seek(offset)
+            f.write(data)
+
+        checkpoint.add_part(part_num, hashlib.md5(data).hexdigest())
+
+    missing = [
+        part for part in parts if checkpoint.get_part(part[0]) is None]
+
+    if len(missing) > 0:
+        _map_parts(download_part, missing, threads)
+
+    try:
+        _verify_file(partial, verify)
+
+    except IOError:
+        os.remove(partial)
+        checkpoint.remove()
+        raise
+
+    getattr(os, 'replace', os.rename)(partial, filepath)
+    checkpoint.remove()
+
+
+def _syspaths(src_fs, src_path, dst_fs, dst_path):
+    if src_fs.hassyspath(src_path) and dst_fs.hassyspath(dst_path):
+        return src_fs.getsyspath(src_path), dst_fs.getsyspath(dst_path)
+
+    return None
+
+
+def copyfile(
+        src_fs,
+        src_path,
+        dst_fs,
+        dst_path,
+        buffer_size=BUFFER_SIZE,
+        hardlink=False,
+        verify=None):
+    '''
+    Copy a file from one pyfilesystem to another
+
+    Local copies use :py:func:`copy_local`. Copies between local files and
+    S3 larger than the filesystem's part size (see :py:func:`set_options`)
+    use :py:func:`upload_multipart` or :py:func:`download_ranged`, and are
+    resumable. Other copies are streamed with a buffer of ``buffer_size``
+    bytes.
+
+    If ``verify`` is given, it is called with the copied file opened for
+    binary reading and must return True. Resumable downloads are verified
+    before the file is moved into place. Other copies which fail
+    verification are removed. In both cases an IOError is raised.
+    '''
+
+    if _is_s3(src_fs) and dst_fs.hassyspath(dst_path):
+        options = get_options(src_fs)
+
+        if src_fs.getsize(src_path) > options['part_size']:
+            download_ranged(
+                src_fs,
+                src_path,
+                dst_fs.getsyspath(dst_path),
+                verify=verify,
+                **options)
+
+            return
+
+    _copyfile(src_fs, src_path, dst_fs, dst_path, buffer_size, hardlink)
+
+    if verify is None:
+        return
+
+    with dst_fs.open(dst_path, 'rb') as f:
+        valid = verify(f)
+
+    if not valid:
+        dst_fs.remove(dst_path)
+        raise IOError('Copy of "{}" failed verification'.format(src_path))
+
+
+def _copyfile(src_fs, src_path, dst_fs, dst_path, buffer_size, hardlink):
+
+    paths = _syspaths(src_fs, src_path, dst_fs, dst_path)
+
+    if paths is not None:
+        copy_local(paths[0], paths[1], buffer_size, hardlink=hardlink)
+        return
+
+    if _is_s3(dst_fs) and src_fs.hassyspath(src_path):
+        options = get_options(dst_fs)
+        filepath = src_fs.getsyspath(src_path)
+
+        if os.path.getsize(filepath) > options['part_size']:
+            upload_multipart(filepath, dst_fs, dst_path, **options)
+            return
+
+    with src_fs.open(src_path, 'rb') as src:
+        with dst_fs.open(dst_path, 'wb') as dst:
+            shutil.copyfileobj(src, dst, buffer_size)
+
+
+def movefile(src_fs, src_path, dst_fs, dst_path, buffer_size=BUFFER_SIZE):
+    '''
+    Move a file from one pyfilesystem to another
+
+    Files on the same device are renamed. Otherwise the file is copied with
+    :py:func:`copyfile` and the source is removed.
+    '''
+
+    paths = _syspaths(src_fs, src_path, dst_fs, dst_path)
+
+    if paths is not None:
+        try:
+            getattr(os, 'replace', os.rename)(paths[0], paths[1])
+            return
+
+        except (IOError, OSError) as e:
+            if e.errno != errno.EXDEV:
+                raise
+
+    copyfile(src_fs, src_path, dst_fs, dst_path, buffer_size)
+    src_fs.remove(src_path)
+
+
+def _get_parent_dirs(paths):
+    '''
+    Return the directories containing ``paths`` and their ancestors,
+    deepest first
+    '''
+
+    dirs = set()
+
+    for path in paths:
+        parent = fs.path.dirname(fs.path.relpath(path))
+
+        while parent and parent not in dirs:
+            dirs.add(parent)
+            parent = fs.path.dirname(parent)
+
+    return sorted(dirs, key=lambda d: (-d.count('/'), d))
+
+
+def _get_common_dirs(paths):
+    '''
+    Return the deepest directory containing all of ``paths`` under each
+    top-level directory
+
+    Examples
+    --------
+
+    .. code-block:: python
+
+        >>> _get_common_dirs([
+        ...     'a/b/c/1.txt', 'a/b/d/2.txt', 'e/f/3.txt', '4.txt'])
+        ['a/b', 'e/f']
+
+    '''
+
+    common = {}
+
+    for path in paths:
+        parts = fs.path.dirname(fs.path.relpath(path)).split('/')
+
+        if parts == ['']:
+            continue
+
+        if parts[0] not in common:
+            common[parts[0]] = parts
+            continue
+
+        prefix = common[parts[0]]
+
+        i = 0
+
+        while i < min(len(prefix), len(parts)) and prefix[i] == parts[i]:
+            i += 1
+
+        common[parts[0]] = prefix[:i]
+
+    return sorted('/'.join(parts) for parts in common.values())
+
+
+def _remove_s3(filesystem, paths):
+
+    failed = {}
+
+    key_names = [filesystem._s3path(path) for path in paths]
+    keys = dict(zip(key_names, paths))
+
+    _delete_keys(filesystem, key_names, keys, failed)
+
+    deleted = set(
+        key_name for key_name in key_names if keys[key_name] not in failed)
+
+    # S3 still lists directories with a marker key once their contents are
+    # removed, so the markers of directories left empty are removed too.
+    # The deepest directory common to the removed files is listed once,
+    # rather than listing each of their parent directories.
+    dir_markers = [
+        filesystem._s3path(dirpath) + '/'
+        for dirpath in _get_parent_dirs(paths)]
+
+    removable = set(dir_markers)
+
+    root_markers = [
+        filesystem._s3path(root) + '/' for root in _get_common_dirs(paths)]
+
+    markers = set()
+
+    for root_marker in root_markers:
+        nonempty = set()
+
+        for key in filesystem._s3bukt.list(prefix=root_marker):
+            if key.name in deleted or key.name in removable:
+                continue
+
+            # any other key keeps the directories containing it
+            parent = key.name.rstrip('/')
+
+            while '/' in parent:
+                parent = parent.rsplit('/', 1)[0]
+
+                if not (parent + '/').startswith(root_marker):
+                    break
+
+                nonempty.add(parent + '/')
+
+        markers.update(
+            marker for marker in dir_markers
+            if marker.startswith(root_marker) and marker not in nonempty)
+
+    # directories above the common directories are listed one at a time,
+    # deepest first, and only once everything below them is removed
+    for marker in dir_markers:
+        if any(marker.startswith(root) for root in root_markers):
+            continue
+
+        if any(root.startswith(marker) and root not in markers
+               for root in root_markers):
+            continue
+
+        for key in filesystem._s3bukt.list(prefix=marker):
+            if key.name != marker and key.name not in markers and (
+                    key.name not in deleted):
+                break
+
+        else:
+            markers.add(marker)
+
+    _delete_keys(filesystem, sorted(markers), keys, failed)
+
+    return failed
+
+
+def _delete_keys(filesystem, key_names, keys, failed):
+
+    for start in range(0, len(key_names), MAX_DELETE_KEYS):
+        result = filesystem._s3bukt.delete_keys(
+            key_names[start:start + MAX_DELETE_KEYS], quiet=True)
+
+        for error in result.errors:
+            if error.key in keys:
+                failed[keys[error.key]] = '{}: {}'.format(
+                    error.code, error.message)
+
+
+def _remove_local(filesystem, paths):
+
+    failed = {}
+
+    for path in paths:
+        try:
+            os.remove(filesystem.getsyspath(path))
+
+        except (IOError, OSError) as e:
+            if e.errno != errno.ENOENT:
+                failed[path] = str(e)
+
+    for dirpath in _get_parent_dirs(paths):
+        try:
+            os.rmdir(filesystem.getsyspath(dirpath))
+
+        except (IOError, OSError):
+            # not empty, or already removed
+            pass
+
+    return failed
+
+
+def _remove_fs(filesystem, paths):
+
+    failed = {}
+
+    for path in paths:
+        try:
+            if filesystem.isfile(path):
+                filesystem.remove(path)
+
+        except Exception as e:
+            failed[path] = str(e)
+
+    return failed
+
+
+def remove_files(filesystem, paths):
+    '''
+    Remove files from a pyfilesystem
+
+    Files on S3 are removed with multi-object delete requests of up to
+    ``MAX_DELETE_KEYS`` keys. Files on local filesystems are unlinked
+    without checking that they exist first. In both cases, directories left
+    empty are removed. Files which do not exist are ignored.
+
+    Returns
+    -------
+
+    failed : dict
+        Reasons for the failures, keyed by the paths which could not be
+        removed
+
+    '''
+
+    paths = list(paths)
+
+    if len(paths) == 0:
+        return {}
+
+    if _is_s3(filesystem):
+        return _remove_s3(filesystem, paths)
+
+    if filesystem.hassyspath(paths[0]):
+        return _remove_local(filesystem, paths)
+
+    return _remove_fs(filesystem, paths)
@@ -38,7 +38,8 @@ requirements_test = [
     ]
 
 extras = {
-    'test': requirements_test
+    'test': requirements_test,
+    'chunking': ['fastcdc>=1.7']
 }
 
 
@@ -251,3 +251,15 @@ def test_begins_with_null_tag_search(api_with_diverse_archives):
             )
 
     assert len(variables) == 0
+
+
+def test_batch_get_archive_names(api_with_diverse_archives):
+
+    names = list(api_with_diverse_archives.filter())[:3]
+
+    archives = api_with_diverse_archives.batch_get_archive(names)
+
+    assert sorted(archives.keys()) == sorted(names)
+
+    for name, archive in archives.items():
+        assert archive.archive_name == name
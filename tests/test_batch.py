@@ -0,0 +1,204 @@
+from __future__ import absolute_import
+
+import os
+import json
+import threading
+import pytest
+
+from datafs._compat import u
+
+
+@pytest.fixture
+def batch_archives(api):
+
+    archives = []
+
+    for i in range(4):
+        arch = api.create('batch/archive{}.txt'.format(i))
+
+        with arch.open('w+', bumpversion='patch') as f:
+            f.write(u('archive {} version 1'.format(i)))
+
+        with arch.open('w+', bumpversion='patch') as f:
+            f.write(u('archive {} version 2'.format(i)))
+
+        archives.append(arch)
+
+    return archives
+
+
+def test_batch_download(api, batch_archives, tempdir, monkeypatch):
+
+    progress = []
+    fetched = []
+
+    get_version_history = api.manager.get_version_history
+
+    def counted_get_version_history(archive_name):
+        fetched.append(archive_name)
+        return get_version_history(archive_name)
+
+    monkeypatch.setattr(
+        api.manager, 'get_version_history', counted_get_version_history)
+
+    def callback(archive_name, error, completed, total):
+        progress.append((archive_name, error, completed, total))
+
+    specs = {arch.archive_name: None for arch in batch_archives}
+    specs[batch_archives[0].archive_name] = '0.0.1'
+    specs['batch/missing.txt'] = None
+
+    errors = api.batch_download(specs, tempdir, threads=2, callback=callback)
+
+    assert list(errors.keys()) == ['batch/missing.txt']
+    assert isinstance(errors['batch/missing.txt'], KeyError)
+
+    assert len(progress) == 5
+    assert sorted(p[2] for p in progress) == [1, 2, 3, 4, 5]
+
+    # versions are resolved from one batched query, not one per archive
+    assert fetched == []
+
+    for i, arch in enumerate(batch_archives):
+        with open(os.path.join(tempdir, 'batch', 'archive{}.txt'.format(i)),
+                  'r') as f:
+            version = 1 if i == 0 else 2
+            assert f.read() == u(
+                'archive {} version {}'.format(i, version))
+
+    # up-to-date files are skipped
+    assert api.batch_download(
+        [arch.archive_name for arch in batch_archives[1:]], tempdir) == {}
+
+
+def test_prefetch(api, cache, batch_archives, monkeypatch):
+
+    with pytest.raises(ValueError):
+        api.prefetch([arch.archive_name for arch in batch_archives])
+
+    api.attach_cache(cache)
+
+    fetched = []
+    get_version_history = api.manager.get_version_history
+
+    def counted_get_version_history(archive_name):
+        fetched.append(archive_name)
+        return get_version_history(archive_name)
+
+    monkeypatch.setattr(
+        api.manager, 'get_version_history', counted_get_version_history)
+
+    errors = api.prefetch(
+        [arch.archive_name for arch in batch_archives], threads=3)
+
+    assert errors == {}
+    assert fetched == []
+
+    for arch in batch_archives:
+        assert arch.is_cached()
+
+        with cache.fs.open(arch.get_version_path(), 'r') as f:
+            assert f.read().endswith(u('version 2'))
+
+    # a stale cached copy is refreshed
+    with cache.fs.open(batch_archives[0].get_version_path(), 'w') as f:
+        f.write(u('stale'))
+
+    assert api.prefetch([batch_archives[0].archive_name]) == {}
+
+    with cache.fs.open(batch_archives[0].get_version_path(), 'r') as f:
+        assert f.read() == u('archive 0 version 2')
+
+
+def test_batch_progress_order(api):
+
+    second_done = threading.Event()
+    progress = []
+
+    def first():
+        assert second_done.wait(10)
+
+    def second():
+        second_done.set()
+
+    def callback(archive_name, error, completed, total):
+        progress.append((archive_name, error, completed, total))
+
+    errors = api._run_batch(
+        [('first', first), ('second', second)], {}, 2, callback)
+
+    # progress is reported as tasks finish, not in submission order
+    assert errors == {}
+    assert progress == [('second', None, 1, 2), ('first', None, 2, 2)]
+
+
+def test_checkout(api, cache, batch_archives, tempdir, monkeypatch):
+
+    api.attach_cache(cache)
+    batch_archives[1].cache()
+
+    dest = os.path.join(tempdir, 'checkout')
+
+    specs = {arch.archive_name: None for arch in batch_archives}
+    specs[batch_archives[0].archive_name] = '0.0.1'
+
+    assert api.checkout(specs, dest, threads=2) == {}
+
+    with open(os.path.join(dest, api.CheckoutManifest), 'r') as f:
+        manifest = json.load(f)
+
+    assert sorted(manifest.keys()) == sorted(specs.keys())
+    assert manifest['batch/archive0.txt']['version'] == '0.0.1'
+    assert manifest['batch/archive2.txt']['version'] == '0.0.2'
+    assert not manifest['batch/archive2.txt']['linked']
+
+    for i, arch in enumerate(batch_archives):
+        path = os.path.join(dest, 'batch', 'archive{}.txt'.format(i))
+
+        with open(path, 'r') as f:
+            version = 1 if i == 0 else 2
+            assert f.read() == u('archive {} version {}'.format(i, version))
+
+        assert manifest[arch.archive_name]['checksum'] == (
+            arch.get_version_hash(manifest[arch.archive_name]['version']))
+
+    # cached versions are linked rather than copied
+    if manifest['batch/archive1.txt']['linked']:
+        assert os.path.samefile(
+            os.path.join(dest, 'batch', 'archive1.txt'),
+            cache.fs.getsyspath(batch_archives[1].get_version_path()))
+
+    # unchanged files are skipped without transfers
+    downloaded = []
+    DataArchive = type(batch_archives[0])
+    _download = DataArchive._download
+
+    def counted(self, filepath, version, version_record):
+        downloaded.append(self.archive_name)
+        return _download(self, filepath, version, version_record)
+
+    monkeypatch.setattr(DataArchive, '_download', counted)
+    monkeypatch.setattr(
+        DataArchive, '_link_from_cache', lambda *args: False)
+
+    assert api.checkout(specs, dest) == {}
+    assert downloaded == []
+
+    with batch_archives[2].open('w+', bumpversion='patch') as f:
+        f.write(u('archive 2 version 3'))
+
+    specs['batch/missing.txt'] = None
+
+    errors = api.checkout(specs, dest)
+
+    assert list(errors.keys()) == ['batch/missing.txt']
+    assert downloaded == ['batch/archive2.txt']
+
+    with open(os.path.join(dest, 'batch', 'archive2.txt'), 'r') as f:
+        assert f.read() == u('archive 2 version 3')
+
+    with open(os.path.join(dest, api.CheckoutManifest), 'r') as f:
+        manifest = json.load(f)
+
+    assert manifest['batch/archive2.txt']['version'] == '0.0.3'
+    assert 'batch/missing.txt' not in manifest
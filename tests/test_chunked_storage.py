@@ -0,0 +1,128 @@
+from __future__ import absolute_import
+
+import os
+import random
+import pytest
+
+from datafs._compat import u
+from datafs.core import chunking
+
+requires_chunking = pytest.mark.skipif(
+    not chunking.available(), reason='requires fastcdc')
+
+
+def _write_random(filepath, size, seed=0):
+    rand = random.Random(seed)
+
+    with open(filepath, 'wb+') as f:
+        f.write(bytes(bytearray(rand.getrandbits(8) for _ in range(size))))
+
+
+@requires_chunking
+def test_chunked_update(api, cache, tempdir):
+
+    api.attach_cache(cache)
+    api.chunked_storage = True
+
+    arch = api.create('chunked/archive.bin')
+
+    p = os.path.join(tempdir, 'chunked.bin')
+    _write_random(p, 4 * 1024 * 1024)
+
+    with open(p, 'rb') as f:
+        original = f.read()
+
+    arch.update(p, cache=True)
+
+    first = arch.get_history()[-1]
+
+    # only the checksum of the manifest is stored in the version record
+    assert 'manifest' not in first
+    assert arch.authority.fs.isfile(arch._get_manifest_path(first))
+    assert cache.fs.isfile(arch._get_manifest_path(first))
+
+    first_manifest = arch._get_manifest(first)
+    assert sum(size for _, size in first_manifest) == len(original)
+
+    # edit a few bytes in the middle of the file
+    edited = original[:2000000] + b'edited!' + original[2000000:]
+
+    with open(p, 'wb+') as f:
+        f.write(edited)
+
+    arch.update(p, bumpversion='patch')
+
+    second = arch.get_history()[-1]
+
+    new_chunks = (
+        set(d for d, _ in arch._get_manifest(second)) -
+        set(d for d, _ in first_manifest))
+
+    assert 0 < len(new_chunks) <= 2
+
+    with arch.open('rb') as f:
+        assert f.read() == edited
+
+    with arch.open('rb', version=arch.get_versions()[0]) as f:
+        assert f.read() == original
+
+    dl = os.path.join(tempdir, 'download.bin')
+    arch.download(dl)
+
+    with open(dl, 'rb') as f:
+        assert f.read() == edited
+
+    with arch.get_local_path() as fp:
+        with open(fp, 'rb') as f:
+            assert f.read() == edited
+
+
+@requires_chunking
+def test_chunked_open_write(api, tempdir):
+
+    api.chunked_storage = True
+
+    arch = api.create('chunked/text.txt')
+
+    with arch.open('w+', bumpversion='patch') as f:
+        f.write(u('first line\n'))
+
+    assert 'manifest_checksum' in arch.get_history()[-1]
+
+    with arch.open('a', bumpversion='patch') as f:
+        f.write(u('second line\n'))
+
+    with arch.open('r') as f:
+        assert f.read() == u('first line\nsecond line\n')
+
+    assert len(arch.get_versions()) == 2
+
+    # chunked versions remain readable when chunked storage is turned off
+    api.chunked_storage = False
+
+    with arch.open('a', bumpversion='patch') as f:
+        f.write(u('third line\n'))
+
+    assert 'manifest_checksum' not in arch.get_history()[-1]
+
+    with arch.open('r') as f:
+        assert f.read() == u('first line\nsecond line\nthird line\n')
+
+
+def test_chunked_storage_unavailable(api, tempdir, monkeypatch):
+
+    monkeypatch.setattr(chunking, '_fastcdc', None)
+
+    api.chunked_storage = True
+
+    arch = api.create('chunked/fallback.txt')
+
+    # versions are stored as whole files without fastcdc
+    with pytest.warns(RuntimeWarning):
+        with arch.open('w+', bumpversion='patch') as f:
+            f.write(u('stored whole'))
+
+    assert 'manifest_checksum' not in arch.get_history()[-1]
+
+    with arch.open('r') as f:
+        assert f.read() == u('stored whole')
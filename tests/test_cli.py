@@ -1,9 +1,15 @@
 
 from datafs.managers.manager_dynamo import DynamoDBManager
 from datafs.datafs import cli
+from datafs import daemon
 from datafs._compat import u
 from datafs import DataAPI, get_api, to_config_file
 import os
+import socket
+import sys
+import subprocess
+import threading
+import time
 from click.testing import CliRunner
 import pytest
 import traceback
@@ -1454,3 +1460,236 @@ def test_cli_log_with_various_messages(sample_config):
 
     finally:
         arch.delete()
+
+
+def _get_import_times(args):
+    '''
+    Run the CLI with ``-X importtime`` and return the cumulative import time
+    of each module in seconds
+    '''
+
+    proc = subprocess.Popen(
+        [sys.executable, '-X', 'importtime', '-m', 'datafs.datafs'] + args,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE)
+
+    _, stderr = proc.communicate()
+
+    assert proc.returncode == 0, stderr
+
+    times = {}
+
+    for line in stderr.decode('utf-8').splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+
+        _, cumulative, module = line.split('|')
+
+        # top-level imports are not indented
+        level = len(module) - len(module.lstrip()) - 1
+        times[module.strip()] = (int(cumulative) / 1e6, level)
+
+    total = sum(t for t, level in times.values() if level == 0)
+
+    return times, total
+
+
+@pytest.mark.cli
+@pytest.mark.skipif(
+    sys.version_info < (3, 7), reason='-X importtime requires python 3.7')
+def test_startup_help():
+
+    times, _ = _get_import_times(['--help'])
+
+    for module in [
+            'fs', 'yaml', 'boto3', 'pymongo', 'datafs.core.data_api',
+            'datafs.managers.manager']:
+
+        assert module not in times
+
+
+@pytest.mark.cli
+@pytest.mark.skipif(
+    sys.version_info < (3, 7), reason='-X importtime requires python 3.7')
+def test_startup_get_tags(preloaded_config):
+
+    profile, temp_file = preloaded_config
+
+    times, _ = _get_import_times([
+        '--config-file', temp_file,
+        '--profile', profile,
+        'get_tags', 'req/arch1'])
+
+    # only the configured manager and services are imported
+    for module in ['pymongo', 'datafs.managers.manager_mongo', 'fs.s3fs']:
+        assert module not in times
+
+
+@pytest.mark.big
+@pytest.mark.cli
+@pytest.mark.skipif(
+    sys.version_info < (3, 7), reason='-X importtime requires python 3.7')
+def test_startup_benchmark(preloaded_config):
+    '''
+    Report the import time of CLI commands
+
+    Run with ``pytest -s -m big -k startup tests/test_cli.py``
+    '''
+
+    profile, temp_file = preloaded_config
+
+    for name, args in [
+            ('--help', ['--help']),
+            ('get_tags', [
+                '--config-file', temp_file,
+                '--profile', profile,
+                'get_tags', 'req/arch1'])]:
+
+        _, total = _get_import_times(args)
+
+        print('datafs {:<22} {:>10.3f} s of imports'.format(name, total))
+
+
+@pytest.mark.cli
+def test_lazy_services(preloaded_config):
+
+    profile, temp_file = preloaded_config
+
+    api = get_api(profile=profile, config_file=temp_file)
+
+    local = api._authorities['local'].fs
+    assert not local.connected
+
+    # metadata commands don't create the authority's filesystem
+    arch = api.get_archive('req/arch1')
+    arch.get_tags()
+    arch.get_versions()
+    arch.get_metadata()
+    list(api.search(prefix='req/'))
+
+    # neither does creating an archive before data is written
+    api.create('req/lazy_archive').delete()
+
+    assert not local.connected
+    assert local.connect_time is None
+
+    with arch.open('r') as f:
+        assert f.read() == u'this is archive /req/arch1 version 1.1'
+
+    assert local.connected
+    assert local.connect_time is not None
+
+    api.close()
+
+
+@pytest.mark.cli
+def test_daemon(preloaded_config, tempdir, monkeypatch):
+
+    profile, temp_file = preloaded_config
+
+    monkeypatch.setenv(
+        'DATAFS_DAEMON_SOCKET', os.path.join(tempdir, 'daemon.sock'))
+
+    prefix = ['--config-file', temp_file, '--profile', profile]
+
+    runner = CliRunner()
+
+    result = runner.invoke(cli, ['daemon', 'status'])
+    assert result.exit_code == 1
+
+    expected = runner.invoke(cli, prefix + ['metadata', 'req/arch1']).output
+
+    server = daemon.Daemon()
+    thread = threading.Thread(target=server.serve)
+    thread.start()
+
+    try:
+        for _ in range(100):
+            if daemon.status() is not None:
+                break
+
+            time.sleep(0.05)
+
+        result = runner.invoke(cli, prefix + ['metadata', 'req/arch1'])
+        assert result.exit_code == 0
+        assert result.output == expected
+        assert server.requests == 1
+
+        # the API is kept between commands
+        api = server.get_api(profile=profile, config_file=temp_file)
+
+        result = runner.invoke(
+            cli, prefix + ['add_tags', 'req/arch1', 'daemon-tag'])
+        assert result.exit_code == 0
+
+        result = runner.invoke(cli, prefix + ['get_tags', 'req/arch1'])
+        assert 'daemon-tag' in result.output.split()
+
+        assert server.requests == 3
+        assert server.get_api(profile=profile, config_file=temp_file) is api
+
+        result = runner.invoke(
+            cli, prefix + ['delete_tags', 'req/arch1', 'daemon-tag'])
+        assert result.exit_code == 0
+
+        # errors are returned to the client
+        result = runner.invoke(
+            cli, prefix + ['get_tags', 'req/nonexistent'])
+        assert result.exit_code == 1
+        assert server.requests == 5
+
+        # other commands run in the client
+        result = runner.invoke(
+            cli, prefix + ['cat', 'req/arch1'])
+        assert result.exit_code == 0
+        assert server.requests == 5
+
+        result = runner.invoke(cli, ['daemon', 'status'])
+        assert result.exit_code == 0
+        assert '5 requests' in result.output
+
+    finally:
+        result = runner.invoke(cli, ['daemon', 'stop'])
+        thread.join()
+
+    assert result.exit_code == 0
+    assert not os.path.exists(os.path.join(tempdir, 'daemon.sock'))
+
+
+@pytest.mark.cli
+def test_daemon_client_timeout(tempdir, monkeypatch):
+
+    socket_path = os.path.join(tempdir, 'daemon.sock')
+
+    monkeypatch.setenv('DATAFS_DAEMON_SOCKET', socket_path)
+    monkeypatch.setattr(daemon, 'CLIENT_TIMEOUT', 0.2)
+
+    server = daemon.Daemon()
+    thread = threading.Thread(target=server.serve)
+    thread.start()
+
+    try:
+        for _ in range(100):
+            if daemon.status() is not None:
+                break
+
+            time.sleep(0.05)
+
+        # a client which never finishes its request doesn't block others
+        stalled = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        stalled.connect(socket_path)
+        stalled.sendall(b'{"command": "status"')
+
+        start = time.time()
+
+        try:
+            assert daemon.status() is not None
+
+        finally:
+            stalled.close()
+
+        assert time.time() - start < 5
+
+    finally:
+        daemon.stop()
+        thread.join()
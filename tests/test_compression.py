@@ -0,0 +1,134 @@
+from __future__ import absolute_import
+
+import io
+import os
+import hashlib
+import pytest
+
+from datafs._compat import u
+from datafs.core import compression
+
+
+@pytest.mark.parametrize('codec', compression.available_codecs())
+def test_compressed_archive_io(api, opener, cache, tempdir, codec):
+
+    api.attach_cache(cache)
+
+    arch = api.create('compressed/archive.txt', compression=codec)
+
+    assert arch.compression == codec
+
+    contents = u('compressible content ') * 100
+
+    with opener(arch, 'w+') as f:
+        f.write(contents)
+
+    record = arch.get_history()[-1]
+
+    assert record['compression'] == codec
+
+    # checksums are computed over the logical content
+    assert record['checksum'] == hashlib.md5(
+        contents.encode('utf-8')).hexdigest()
+
+    # stored data is compressed
+    stored_path = arch.get_version_path()
+
+    with arch.authority.fs.open(stored_path, 'rb') as f:
+        stored = f.read()
+
+    assert len(stored) < len(contents)
+
+    with opener(arch, 'r') as f:
+        assert f.read() == contents
+
+    # cached copies are validated against the logical content
+    arch.cache()
+
+    with opener(arch, 'r') as f:
+        assert f.read() == contents
+
+    assert arch.is_cached()
+
+    with opener(arch, 'a') as f:
+        f.write(u('more content'))
+
+    with opener(arch, 'r') as f:
+        assert f.read() == contents + u('more content')
+
+    dl = os.path.join(tempdir, 'download.txt')
+    arch.download(dl)
+
+    with open(dl, 'r') as f:
+        assert f.read() == contents + u('more content')
+
+    arch.delete()
+
+
+def test_compression_setting(api, tempdir):
+
+    with pytest.raises(ValueError):
+        api.compression = 'not-a-codec'
+
+    with pytest.raises(ValueError):
+        api.create('bad_codec', compression='not-a-codec')
+
+    uncompressed = api.create('uncompressed')
+
+    fp = os.path.join(tempdir, 'test.txt')
+
+    with open(fp, 'w+') as f:
+        f.write('uncompressed content')
+
+    uncompressed.update(fp)
+
+    assert 'compression' not in uncompressed.get_history()[-1]
+
+    api.compression = 'gzip'
+
+    assert uncompressed.compression == 'gzip'
+
+    with open(fp, 'w+') as f:
+        f.write('compressed content')
+
+    uncompressed.update(fp)
+
+    assert uncompressed.get_history()[-1]['compression'] == 'gzip'
+
+    # older, uncompressed versions remain readable
+    with uncompressed.open('r', version='0.0.1') as f:
+        assert f.read() == 'uncompressed content'
+
+    with uncompressed.open('r') as f:
+        assert f.read() == 'compressed content'
+
+
+@pytest.mark.parametrize('codec', compression.available_codecs())
+def test_bounded_decompression(codec):
+
+    size = 64 * 1024 * 1024
+    chunk_size = 64 * 1024
+
+    compressed = io.BytesIO()
+    compression.compress_stream(io.BytesIO(b'\0' * size), compressed, codec)
+    compressed.seek(0)
+
+    reader = compression.DecompressingReader(
+        compressed, codec, chunk_size=chunk_size)
+
+    buf = bytearray(chunk_size)
+    total = 0
+
+    while True:
+        n = reader.readinto(buf)
+
+        if n == 0:
+            break
+
+        # zstandard's decompressobj doesn't accept a maximum output size
+        if codec != 'zstd':
+            assert len(reader._buffer) <= chunk_size
+
+        total += n
+
+    assert total == size
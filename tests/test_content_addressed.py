@@ -0,0 +1,93 @@
+from __future__ import absolute_import
+
+import os
+
+from datafs._compat import u
+
+
+def test_content_addressed_dedup(api, cache, tempdir):
+
+    api.attach_cache(cache)
+    api.content_addressed = True
+
+    arch1 = api.create('cas/archive1.txt')
+    arch2 = api.create('cas/archive2.txt')
+
+    p = os.path.join(tempdir, 'cas.txt')
+
+    with open(p, 'w+') as f:
+        f.write(u('shared content'))
+
+    arch1.update(p, cache=True)
+    arch2.update(p)
+
+    path1 = arch1.get_storage_path()
+    path2 = arch2.get_storage_path()
+
+    assert path1 == path2
+    assert path1.startswith('.blobs/md5/')
+    assert arch1.get_history()[-1]['path'] == path1
+
+    # data is stored once and is not written to the version path
+    assert arch1.authority.fs.isfile(path1)
+    assert not arch1.authority.fs.exists(arch1.get_version_path())
+
+    # the shared blob is already cached
+    assert arch1.is_cached()
+    assert arch2.is_cached()
+
+    with arch2.open('r') as f:
+        assert f.read() == u('shared content')
+
+    # writes through open are also content-addressed
+    with arch1.open('w+', bumpversion='patch') as f:
+        f.write(u('new content'))
+
+    assert arch1.get_storage_path() != path1
+    assert arch1.get_storage_path().startswith('.blobs/md5/')
+
+    with arch1.open('r') as f:
+        assert f.read() == u('new content')
+
+    with arch1.get_local_path() as fp:
+        with open(fp, 'r') as f:
+            assert f.read() == u('new content')
+
+    # deleting an archive leaves shared blobs in place
+    arch1.delete()
+
+    with arch2.open('r') as f:
+        assert f.read() == u('shared content')
+
+
+def test_content_addressed_versions(api, tempdir):
+
+    arch = api.create('cas/versioned.txt')
+
+    p = os.path.join(tempdir, 'versioned.txt')
+
+    with open(p, 'w+') as f:
+        f.write(u('version 1'))
+
+    arch.update(p, bumpversion='minor')
+
+    # switching modes keeps earlier versions readable
+    api.content_addressed = True
+
+    with open(p, 'w+') as f:
+        f.write(u('version 2'))
+
+    arch.update(p, bumpversion='minor')
+
+    versions = arch.get_versions()
+
+    assert arch.get_storage_path(versions[0]) == arch.get_version_path(
+        versions[0])
+
+    assert arch.get_storage_path(versions[1]).startswith('.blobs/')
+
+    with arch.open('r', version=versions[0]) as f:
+        assert f.read() == u('version 1')
+
+    with arch.open('r', version=versions[1]) as f:
+        assert f.read() == u('version 2')
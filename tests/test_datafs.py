@@ -248,3 +248,121 @@ def test_log_with_various_messages(api):
         f.write(u('hello 5'))
 
     arch.log()
+
+
+def test_hash_algorithm_change(api, tempdir):
+    '''
+    Versions hashed with a previous algorithm remain valid after switching
+    '''
+
+    arch = api.create('test/hash_algorithms.txt')
+
+    with arch.open('w+') as f:
+        f.write(u('md5 content'))
+
+    assert arch.get_history()[-1]['algorithm'] == 'md5'
+
+    with pytest.raises(ValueError):
+        api.hash_algorithm = 'not-an-algorithm'
+
+    api.hash_algorithm = 'sha256'
+
+    fp = os.path.join(tempdir, 'test.txt')
+
+    # re-uploading identical content is not a new version
+    with open(fp, 'w+') as f:
+        f.write('md5 content')
+
+    arch.update(fp)
+
+    assert len(arch.get_versions()) == 1
+
+    with open(fp, 'w+') as f:
+        f.write('sha256 content')
+
+    arch.update(fp)
+
+    assert len(arch.get_versions()) == 2
+    assert arch.get_history()[-1]['algorithm'] == 'sha256'
+    assert arch.get_latest_hash() == hashlib.sha256(
+        b('sha256 content')).hexdigest()
+
+    # old versions are verified with their own algorithm on download
+    dl = os.path.join(tempdir, 'dl.txt')
+    arch.download(dl, version=arch.get_versions()[0])
+
+    with open(dl, 'r') as f:
+        assert f.read() == 'md5 content'
+
+    # content written through open and get_local_path is hashed with the
+    # API's algorithm, not the algorithm of the version it replaces
+    api.hash_algorithm = 'md5'
+
+    with arch.open('r+') as f:
+        f.read()
+
+    assert len(arch.get_versions()) == 2
+
+    with arch.open('w+') as f:
+        f.write(u('md5 again'))
+
+    assert len(arch.get_versions()) == 3
+    assert arch.get_history()[-1]['algorithm'] == 'md5'
+
+    api.hash_algorithm = 'sha256'
+
+    with arch.get_local_path() as fp:
+        with open(fp, 'w+') as f:
+            f.write('sha256 again')
+
+    assert len(arch.get_versions()) == 4
+    assert arch.get_latest_hash() == hashlib.sha256(
+        b('sha256 again')).hexdigest()
+
+    arch.delete()
+
+
+def test_tree_hash_versions(api, tempdir):
+    '''
+    Tree hashes record chunk digests and are verified with the stored size
+    '''
+
+    arch = api.create('test/tree_hash.txt')
+
+    api.hash_algorithm = 'md5-tree'
+    api.hash_chunk_size = 4
+
+    fp = os.path.join(tempdir, 'test.txt')
+
+    with open(fp, 'w+') as f:
+        f.write('tree hashed content')
+
+    arch.update(fp)
+
+    record = arch.get_history()[-1]
+
+    assert record['algorithm'] == 'md5-tree'
+    assert int(record['chunk_size']) == 4
+
+    # chunk digests are stored next to the data, not in the record
+    assert 'chunks' not in record
+    assert arch.authority.fs.isfile(arch._get_chunk_digests_path(record))
+    assert arch.find_bad_chunks(fp) == []
+
+    damaged = os.path.join(tempdir, 'damaged.txt')
+
+    with open(damaged, 'w+') as f:
+        f.write('tree hashXd content')
+
+    assert arch.find_bad_chunks(damaged) == [2]
+
+    # changing the chunk size does not invalidate the existing version
+    api.hash_chunk_size = 8
+    arch.update(fp)
+
+    assert len(arch.get_versions()) == 1
+
+    with arch.open('r') as f:
+        assert f.read() == 'tree hashed content'
+
+    arch.delete()
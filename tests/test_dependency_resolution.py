@@ -0,0 +1,129 @@
+from __future__ import absolute_import
+
+import os
+import pytest
+
+from datafs._compat import u
+
+
+def _create(api, tempdir, archive_name, dependencies, versions=1, **kwargs):
+
+    arch = api.create(archive_name, **kwargs)
+    fp = os.path.join(tempdir, 'contents.txt')
+
+    for i in range(versions):
+        with open(fp, 'w+') as f:
+            f.write(u('{} {}'.format(archive_name, i)))
+
+        arch.update(fp, bumpversion='patch', dependencies=dependencies)
+
+    return arch
+
+
+@pytest.fixture
+def graph(api, tempdir):
+
+    _create(api, tempdir, 'base', {}, versions=2)
+    _create(api, tempdir, 'unversioned', {}, versioned=False)
+    _create(api, tempdir, 'mid1', {'base': '0.0.1'})
+    _create(api, tempdir, 'mid2', {'base': '0.0.1', 'unversioned': None})
+    _create(api, tempdir, 'top', {'mid1': '0.0.1', 'mid2': None})
+
+    return api
+
+
+def test_resolve_dependencies(graph, monkeypatch):
+
+    api = graph
+
+    queries = []
+    batch_get_version_history = api.manager.batch_get_version_history
+
+    def counted(archive_names):
+        queries.append(sorted(archive_names))
+        return batch_get_version_history(archive_names)
+
+    monkeypatch.setattr(api.manager, 'batch_get_version_history', counted)
+
+    assert api.resolve_dependencies('top') == {
+        'mid1': '0.0.1',
+        'mid2': '0.0.1',
+        'base': '0.0.1',
+        'unversioned': None}
+
+    # one query per level of the graph
+    assert queries == [
+        ['top'], ['mid1', 'mid2'], ['base', 'unversioned']]
+
+    assert api.resolve_dependencies('top', depth=1) == {
+        'mid1': '0.0.1',
+        'mid2': '0.0.1'}
+
+    assert api.resolve_dependencies('base') == {}
+
+
+def test_resolve_dependency_errors(graph, tempdir):
+
+    api = graph
+
+    _create(api, tempdir, 'conflicted', {'mid1': None, 'base': '0.0.2'})
+
+    with pytest.raises(ValueError):
+        api.resolve_dependencies('conflicted')
+
+    _create(api, tempdir, 'broken', {'missing_archive': None})
+
+    with pytest.raises(KeyError):
+        api.resolve_dependencies('broken')
+
+    with pytest.raises(ValueError):
+        api.resolve_dependencies('top', version='1.0.0')
+
+
+def test_get_dependents(graph, tempdir, monkeypatch):
+
+    api = graph
+
+    assert api.get_dependents('base') == {
+        'mid1': ['0.0.1'],
+        'mid2': ['0.0.1']}
+
+    assert api.get_dependents('base', version='0.0.1') == {
+        'mid1': ['0.0.1'],
+        'mid2': ['0.0.1']}
+
+    assert api.get_dependents('base', version='0.0.2') == {}
+    assert api.get_dependents('unversioned') == {'mid2': ['0.0.1']}
+    assert api.get_dependents('top') == {}
+
+    # unpinned dependents are only returned without a version
+    assert api.get_dependents('mid2') == {'top': ['0.0.1']}
+    assert api.get_dependents('mid2', version='0.0.1') == {}
+
+    # only the latest record of each version is used
+    api.get_archive('mid1').set_dependencies({'base': '0.0.2'})
+
+    assert api.get_dependents('base', version='0.0.1') == {
+        'mid2': ['0.0.1']}
+
+    assert api.get_dependents('base', version='0.0.2') == {
+        'mid1': ['0.0.1']}
+
+    _create(api, tempdir, 'report', {'base': '0.0.2'}, versioned=False)
+
+    assert api.get_dependents('base', version='0.0.2') == {
+        'mid1': ['0.0.1'],
+        'report': [None]}
+
+    # versions registered without the index are found after a rebuild
+    monkeypatch.setattr(
+        api.manager, '_index_dependencies', lambda *args: None)
+
+    _create(api, tempdir, 'unindexed', {'base': '0.0.1'}, versions=2)
+
+    assert 'unindexed' not in api.get_dependents('base')
+
+    monkeypatch.undo()
+    api.manager.rebuild_dependents_index()
+
+    assert api.get_dependents('base')['unindexed'] == ['0.0.1', '0.0.2']
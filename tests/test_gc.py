@@ -0,0 +1,72 @@
+from __future__ import absolute_import
+
+import pytest
+
+from datafs._compat import u
+
+
+def test_collect_garbage(api, cache):
+
+    api.attach_cache(cache)
+
+    arch = api.create('gc/archive.txt')
+
+    for i in range(2):
+        with arch.open('w+', bumpversion='patch') as f:
+            f.write(u('version {}'.format(i)))
+
+    arch.cache()
+
+    deleted = api.create('gc/deleted.txt')
+
+    with deleted.open('w+', bumpversion='patch') as f:
+        f.write(u('deleted'))
+
+    deleted.cache()
+    deleted_path = deleted.get_version_path()
+
+    # remove the archive's record but leave its data behind
+    api.manager.delete_archive_record('gc/deleted.txt')
+
+    authority = arch.authority
+    authority.fs.setcontents('gc/failed_upload.txt', b'orphaned')
+
+    with pytest.raises(ValueError):
+        api.collect_garbage(authority_name='nonexistent')
+
+    # new files are kept until they are older than min_age
+    report = api.collect_garbage(cache=True)
+
+    assert report['orphaned'] == []
+
+    report = api.collect_garbage(cache=True, dry_run=True, min_age=0)
+
+    orphaned = sorted(
+        (orphan['service'], orphan['path'])
+        for orphan in report['orphaned'])
+
+    assert orphaned == [
+        ('cache', deleted_path),
+        ('filesys', deleted_path),
+        ('filesys', 'gc/failed_upload.txt')]
+
+    assert report['removed'] == 0
+    assert authority.fs.isfile('gc/failed_upload.txt')
+
+    report = api.collect_garbage(prefix='gc/failed', min_age=0)
+
+    assert report['removed'] == 1
+    assert not authority.fs.isfile('gc/failed_upload.txt')
+    assert authority.fs.isfile(deleted_path)
+
+    report = api.collect_garbage(cache=True, min_age=0)
+
+    assert report['removed'] == 2
+    assert not authority.fs.isfile(deleted_path)
+    assert not api.cache.fs.isfile(deleted_path)
+
+    for version in arch.get_versions():
+        assert authority.fs.isfile(arch.get_version_path(version))
+
+    with arch.open('r') as f:
+        assert f.read() == u('version 1')
@@ -0,0 +1,210 @@
+from __future__ import absolute_import
+
+import os
+import threading
+import pytest
+
+from datafs._compat import u
+from datafs.core.journal import Journal
+from datafs.services.lazy import LazyFS
+from fs.osfs import OSFS
+
+
+def test_journal_ordering_and_recovery(tempdir):
+
+    applied = []
+
+    def handler(entry):
+        if entry['record']['value'] == 'bad':
+            raise IOError('connection dropped')
+
+        applied.append((entry['key'], entry['record']['value']))
+
+    journal = Journal(tempdir, handler, threads=3, retries=1, retry_delay=0)
+
+    for key, value in [
+            ('a', 1), ('b', 1), ('a', 'bad'), ('a', 2), ('b', 2)]:
+        journal.append(key, {'value': value})
+
+    assert journal.wait(timeout=10)
+
+    # entries are applied in order for each key, and a failed entry blocks
+    # later entries with the same key
+    assert [v for k, v in applied if k == 'a'] == [1]
+    assert [v for k, v in applied if k == 'b'] == [1, 2]
+
+    failed = journal.failed()
+    assert len(failed) == 1
+    assert failed[0]['attempts'] == 2
+    assert 'connection dropped' in failed[0]['error']
+
+    assert len(journal.entries()) == 2
+
+    journal.close()
+
+    # pending entries are reloaded from disk
+    reopened = Journal(
+        tempdir, lambda entry: applied.append(
+            (entry['key'], entry['record']['value'])))
+
+    assert [e['record']['value'] for e in reopened.entries()] == ['bad', 2]
+
+    reopened.retry()
+    assert reopened.wait(timeout=10)
+
+    assert [v for k, v in applied if k == 'a'] == [1, 'bad', 2]
+    assert reopened.entries() == []
+
+    reopened.close()
+
+
+def test_journal_shared_between_processes(tempdir):
+
+    applied = []
+    other_applied = []
+
+    owner = Journal(
+        tempdir, lambda entry: applied.append(entry['record']['value']))
+
+    assert owner.start()
+
+    # a second journal on the directory can't take the lock, so it records
+    # entries for the owner's workers instead of raising
+    other = Journal(
+        tempdir, lambda entry: other_applied.append(entry['record']['value']))
+
+    other.append('key', {'value': 1})
+    assert not other.start()
+
+    assert other.wait(timeout=10)
+
+    assert applied == [1]
+    assert other_applied == []
+    assert other.entries() == []
+    assert owner.entries() == []
+
+    other.close()
+    owner.close()
+
+
+def test_write_behind(api, cache, tempdir):
+
+    api.attach_cache(cache)
+    api.enable_write_behind(journal_dir=os.path.join(tempdir, 'journal'))
+
+    # hold the workers until the pending state has been checked
+    release = threading.Event()
+    handler = api.journal._handler
+
+    def blocked(entry):
+        release.wait()
+        handler(entry)
+
+    api.journal._handler = blocked
+
+    arch = api.create('write_behind/archive.txt')
+
+    with arch.open('w+', bumpversion='patch') as f:
+        f.write(u('version 1'))
+
+    p = os.path.join(tempdir, 'version2.txt')
+
+    with open(p, 'w+') as f:
+        f.write(u('version 2'))
+
+    arch.update(p, bumpversion='patch')
+
+    # pending versions are visible to this api and read from the cache
+    assert arch.get_versions() == ['0.0.1', '0.0.2']
+    assert len(api.manager.get_version_history(arch.archive_name)) == 0
+    assert not arch.authority.fs.exists(arch.get_version_path())
+
+    with arch.open('r') as f:
+        assert f.read() == u('version 2')
+
+    with pytest.raises(ValueError):
+        arch.remove_from_cache()
+
+    release.set()
+    api.flush()
+
+    history = api.manager.get_version_history(arch.archive_name)
+    assert [h['version'] for h in history] == ['0.0.1', '0.0.2']
+    assert api.journal.entries() == []
+
+    arch.remove_from_cache()
+
+    with arch.open('r', version='0.0.1') as f:
+        assert f.read() == u('version 1')
+
+    with arch.open('r') as f:
+        assert f.read() == u('version 2')
+
+
+def test_write_behind_lazy_cache(api, tempdir):
+
+    cache_dir = os.path.join(tempdir, 'cache')
+    os.makedirs(cache_dir)
+
+    cache = LazyFS(lambda: OSFS, [cache_dir])
+
+    api.attach_cache(cache)
+    api.enable_write_behind()
+
+    # the journal in the cache is opened when it is first used
+    assert api.write_behind
+    assert not cache.connected
+
+    arch = api.create('write_behind/lazy.txt')
+
+    with arch.open('w+', bumpversion='patch') as f:
+        f.write(u('written behind'))
+
+    assert cache.connected
+    assert os.path.isdir(os.path.join(cache_dir, '.journal'))
+
+    api.flush()
+
+    assert len(api.manager.get_version_history(arch.archive_name)) == 1
+
+
+def test_write_behind_failures(api, cache, tempdir):
+
+    journal_dir = os.path.join(tempdir, 'journal')
+
+    with pytest.raises(ValueError):
+        api.enable_write_behind(journal_dir=journal_dir)
+
+    api.attach_cache(cache)
+    api.enable_write_behind(journal_dir=journal_dir, retries=0)
+
+    def failing(entry):
+        raise IOError('connection dropped')
+
+    api.journal._handler = failing
+
+    arch = api.create('write_behind/failing.txt')
+
+    with arch.open('w+', bumpversion='patch') as f:
+        f.write(u('written behind'))
+
+    with pytest.raises(IOError):
+        api.flush()
+
+    assert len(api.journal.failed()) == 1
+    assert len(api.manager.get_version_history(arch.archive_name)) == 0
+
+    # failed versions stay in the journal and are retried by the next flush
+    api.journal.close()
+
+    api.enable_write_behind(journal_dir=journal_dir)
+    assert len(api.journal.entries()) == 1
+
+    api.flush()
+
+    assert len(api.manager.get_version_history(arch.archive_name)) == 1
+
+    arch.remove_from_cache()
+
+    with arch.open('r') as f:
+        assert f.read() == u('written behind')
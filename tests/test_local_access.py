@@ -0,0 +1,99 @@
+from __future__ import absolute_import
+
+import os
+import pytest
+
+from datafs._compat import u
+
+
+@pytest.mark.parametrize('compression', [None, 'gzip'])
+def test_mmap(api, cache, tempdir, compression):
+
+    api.attach_cache(cache)
+
+    arch = api.create('local/mapped.bin', compression=compression)
+
+    with pytest.raises(ValueError):
+        with arch.mmap() as data:
+            pass
+
+    p = os.path.join(tempdir, 'mapped.bin')
+
+    with open(p, 'wb+') as f:
+        f.write(b'0123456789' * 1000)
+
+    arch.update(p)
+
+    with arch.mmap() as data:
+        assert len(data) == 10000
+        assert data[5:10] == b'56789'
+        assert bytes(memoryview(data)[-3:]) == b'789'
+
+        with pytest.raises(TypeError):
+            data[0] = b'x'
+
+    # mapping doesn't cache the archive
+    assert not arch.is_cached()
+
+    with arch.open('w+', bumpversion='patch') as f:
+        f.write(u('new'))
+
+    with arch.mmap(version=arch.get_versions()[0]) as data:
+        assert data[:3] == b'012'
+
+    with arch.mmap() as data:
+        assert data[:] == b'new'
+
+    with arch.open('w+', bumpversion='patch') as f:
+        f.write(u(''))
+
+    with arch.mmap() as empty:
+        assert len(empty) == 0
+        assert type(empty) is type(data)
+
+
+def test_get_local_path_modes(api, cache, tempdir):
+
+    api.attach_cache(cache)
+
+    arch = api.create('local/modes.txt')
+
+    with pytest.raises(ValueError):
+        with arch.get_local_path(mode='a') as fp:
+            pass
+
+    with arch.get_local_path(mode='w', bumpversion='patch') as fp:
+        assert os.path.getsize(fp) == 0
+
+        with open(fp, 'w+') as f:
+            f.write(u('written'))
+
+    with arch.get_local_path(mode='r') as fp:
+        with open(fp, 'r') as f:
+            assert f.read() == u('written')
+
+        # read-only paths are the stored file where one exists locally
+        if arch.authority.fs.hassyspath(arch.get_version_path()):
+            assert fp == arch.authority.fs.getsyspath(
+                arch.get_version_path())
+
+    arch.cache()
+
+    with arch.get_local_path(mode='r') as fp:
+        assert fp == cache.fs.getsyspath(arch.get_version_path())
+
+    # write mode does not copy the current contents
+    with arch.get_local_path(mode='w', bumpversion='patch') as fp:
+        assert os.path.getsize(fp) == 0
+
+        with open(fp, 'w+') as f:
+            f.write(u('replaced'))
+
+    with arch.get_local_path(mode='r+', bumpversion='patch') as fp:
+        with open(fp, 'a') as f:
+            f.write(u(' and appended'))
+
+    with arch.open('r') as f:
+        assert f.read() == u('replaced and appended')
+
+    assert len(arch.get_versions()) == 3
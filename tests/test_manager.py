@@ -168,6 +168,11 @@ def test_base_manager_delete_archive_record(base_manager):
         base_manager._delete_archive_record('archive_name')
 
 
+def test_base_manager_batch_delete_archive_records(base_manager):
+    with pytest.raises(NotImplementedError):
+        base_manager._batch_delete_archive_records(['archive_name'])
+
+
 def test_base_manager_get_table_names(base_manager):
     with pytest.raises(NotImplementedError):
         base_manager._get_table_names()
@@ -209,3 +214,8 @@ def test_base_manager_search(base_manager):
 def test_base_manager_set_tags(base_manager):
     with pytest.raises(NotImplementedError):
         base_manager._set_tags('archive_name', ['term1', 'term2'])
+
+
+def test_base_manager_set_authority_name(base_manager):
+    with pytest.raises(NotImplementedError):
+        base_manager._set_authority_name('archive_name', 'authority_name')
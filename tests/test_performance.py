@@ -0,0 +1,295 @@
+'''
+Throughput benchmarks
+
+These tests report timings for performance-sensitive operations. The size of
+the generated test files is set in megabytes by the ``DATAFS_BENCHMARK_SIZE``
+environment variable (default 32). Run with multi-GB files using, e.g.::
+
+    DATAFS_BENCHMARK_SIZE=4096 pytest -s -m big tests/test_performance.py
+
+The version benchmarks parse, compare and sort ``DATAFS_BENCHMARK_VERSIONS``
+version strings (default 10000) and run with the rest of the test suite::
+
+    pytest -s -k version tests/test_performance.py
+
+'''
+
+from __future__ import absolute_import
+
+import os
+import time
+import random
+import hashlib
+import pytest
+
+from datafs import DataAPI
+from datafs.core import chunking
+from datafs.core import hashing
+from datafs.core import ranged
+from datafs.core.versions import BumpableVersion, VersionIndex
+from datafs.services import transfer
+
+BENCHMARK_SIZE = int(os.environ.get('DATAFS_BENCHMARK_SIZE', 32))
+BENCHMARK_VERSIONS = int(os.environ.get('DATAFS_BENCHMARK_VERSIONS', 10000))
+
+
+def _report(name, nbytes, elapsed):
+    print('{:<30} {:>10.1f} MB/s'.format(
+        name, nbytes / (1024. * 1024) / max(elapsed, 1e-9)))
+
+
+def _report_rate(name, count, elapsed):
+    print('{:<30} {:>10.0f} ops/s'.format(name, count / max(elapsed, 1e-9)))
+
+
+@pytest.yield_fixture(scope='module')
+def benchmark_file(temp_dir_mod):
+
+    fp = os.path.join(temp_dir_mod, 'benchmark.dat')
+
+    block = os.urandom(1024 * 1024)
+
+    with open(fp, 'wb+') as f:
+        for _ in range(BENCHMARK_SIZE):
+            f.write(block)
+
+    yield fp
+
+
+@pytest.mark.big
+@pytest.mark.parametrize('algorithm', hashing.available_algorithms())
+def test_hash_throughput(benchmark_file, algorithm):
+
+    start = time.time()
+    res = DataAPI.hash_file(benchmark_file, algorithm=algorithm)
+    elapsed = time.time() - start
+
+    _report('hash {}'.format(algorithm), os.path.getsize(benchmark_file),
+            elapsed)
+
+    assert res['algorithm'] == algorithm
+
+    if algorithm in hashlib.algorithms_available:
+        direct = hashlib.new(algorithm)
+
+        with open(benchmark_file, 'rb') as f:
+            for chunk in iter(lambda: f.read(1024 * 1024), b''):
+                direct.update(chunk)
+
+        assert res['checksum'] == direct.hexdigest()
+
+
+@pytest.mark.big
+@pytest.mark.parametrize('threads', [1, 2, 4, 8])
+def test_tree_hash_throughput(benchmark_file, threads):
+
+    start = time.time()
+    res = hashing.hash_tree(
+        benchmark_file,
+        'sha256',
+        chunk_size=8 * 1024 * 1024,
+        threads=threads)
+    elapsed = time.time() - start
+
+    _report('hash sha256-tree x{}'.format(threads),
+            os.path.getsize(benchmark_file), elapsed)
+
+    assert hashing.find_bad_chunks(benchmark_file, res) == []
+
+
+@pytest.mark.big
+@pytest.mark.skipif(not chunking.available(), reason='requires fastcdc')
+def test_chunking_throughput(benchmark_file):
+
+    start = time.time()
+    size = sum(len(chunk) for chunk in chunking.iter_chunks(benchmark_file))
+    elapsed = time.time() - start
+
+    _report('content-defined chunking', size, elapsed)
+
+    assert size == os.path.getsize(benchmark_file)
+
+
+@pytest.mark.big
+def test_ranged_read_benchmark(benchmark_file, cache):
+
+    import moto
+    from fs.s3fs import S3FS
+
+    m = moto.mock_s3()
+    m.start()
+
+    try:
+        s3 = S3FS(
+            'test-bucket',
+            aws_access_key='MY_KEY',
+            aws_secret_key='MY_SECRET_KEY')
+
+        api = DataAPI(username='My Name', contact='my.email@example.com')
+        api.attach_authority('s3', s3)
+        api.attach_cache(cache)
+
+        with s3.open('benchmark.dat', 'wb') as dst:
+            with open(benchmark_file, 'rb') as src:
+                for chunk in iter(lambda: src.read(1024 * 1024), b''):
+                    dst.write(chunk)
+
+        size = os.path.getsize(benchmark_file)
+        offsets = [size * i // 16 for i in range(16)]
+
+        # sequential stream: reads through the file to reach each offset
+        start = time.time()
+
+        with s3.open('benchmark.dat', 'rb') as f:
+            for offset in offsets:
+                f.read(offset - f.tell())
+                f.read(4096)
+
+        _report('S3 streamed seek+read', size, time.time() - start)
+
+        # ranged reads fetch only the touched blocks
+        block_cache = ranged.BlockCache(
+            cache.fs, 'benchmark', size, block_size=1024 * 1024)
+
+        start = time.time()
+
+        with ranged.RangedReader(s3, 'benchmark.dat', size, block_cache) as f:
+            for offset in offsets:
+                f.seek(offset)
+                f.read(4096)
+
+        _report('S3 ranged seek+read', size, time.time() - start)
+
+        block_cache = ranged.BlockCache(
+            cache.fs, 'benchmark', size, block_size=1024 * 1024)
+
+        assert block_cache.filled_blocks() == len(offsets)
+
+        block_cache.close()
+        s3.close()
+
+    finally:
+        m.stop()
+
+
+@pytest.mark.big
+@pytest.mark.parametrize('name,method', transfer.LOCAL_METHODS)
+def test_local_copy_throughput(benchmark_file, temp_dir_mod, name, method):
+
+    dst = os.path.join(temp_dir_mod, 'copy-{}.dat'.format(name))
+
+    start = time.time()
+
+    try:
+        method(benchmark_file, dst)
+
+    except (IOError, OSError):
+        pytest.skip('{} not supported here'.format(name))
+
+    _report('copy {}'.format(name), os.path.getsize(benchmark_file),
+            time.time() - start)
+
+    assert os.path.getsize(dst) == os.path.getsize(benchmark_file)
+
+    os.remove(dst)
+
+
+@pytest.mark.big
+def test_streamed_copy_throughput(benchmark_file, temp_dir_mod):
+
+    from fs.osfs import OSFS
+    from fs.memoryfs import MemoryFS
+
+    local = OSFS(temp_dir_mod)
+    mem = MemoryFS()
+
+    start = time.time()
+    transfer.copyfile(local, 'benchmark.dat', mem, 'benchmark.dat')
+
+    _report('copy streamed', os.path.getsize(benchmark_file),
+            time.time() - start)
+
+    mem.close()
+    local.close()
+
+
+@pytest.fixture(scope='module')
+def version_strings():
+
+    rand = random.Random(0)
+
+    def make_version():
+        vstring = '{}.{}'.format(rand.randint(0, 20), rand.randint(0, 20))
+
+        if rand.random() < 0.5:
+            vstring += '.{}'.format(rand.randint(1, 20))
+
+        if rand.random() < 0.2:
+            vstring += '{}{}'.format(rand.choice('ab'), rand.randint(1, 9))
+
+        return vstring
+
+    return [make_version() for _ in range(BENCHMARK_VERSIONS)]
+
+
+def test_version_parse_benchmark(version_strings):
+
+    start = time.time()
+    versions = [BumpableVersion(v) for v in version_strings]
+    _report_rate('version parse', len(versions), time.time() - start)
+
+    assert [str(v) for v in versions[:3]] == [
+        str(BumpableVersion(str(v))) for v in versions[:3]]
+
+
+def test_version_compare_benchmark(version_strings):
+
+    versions = [BumpableVersion(v) for v in version_strings]
+    pairs = list(zip(versions, reversed(versions)))
+
+    start = time.time()
+    less = sum(1 for a, b in pairs if a < b)
+    _report_rate('version compare', len(pairs), time.time() - start)
+
+    start = time.time()
+    equal = sum(1 for a, b in zip(versions, version_strings) if a == b)
+    _report_rate('version compare str', len(versions), time.time() - start)
+
+    assert equal == len(versions)
+    assert less <= len(pairs)
+
+
+def test_version_sort_benchmark(version_strings):
+
+    start = time.time()
+    ordered = sorted(version_strings, key=BumpableVersion)
+    _report_rate('version sort', len(ordered), time.time() - start)
+
+    start = time.time()
+    unique = set(BumpableVersion(v) for v in version_strings)
+    _report_rate('version hash', len(version_strings), time.time() - start)
+
+    versions = [BumpableVersion(v) for v in ordered]
+
+    assert all(a <= b for a, b in zip(versions[:-1], versions[1:]))
+    assert len(unique) == len(set(str(v) for v in versions))
+
+
+def test_version_index_benchmark(version_strings):
+
+    history = [
+        {'version': v, 'checksum': str(i)}
+        for i, v in enumerate(version_strings)]
+
+    start = time.time()
+    index = VersionIndex(history)
+    _report_rate('version index build', len(history), time.time() - start)
+
+    start = time.time()
+
+    for v in version_strings:
+        index.get_record(v)
+
+    _report_rate('version index lookup', len(history), time.time() - start)
+
+    assert index.latest == max(BumpableVersion(v) for v in version_strings)
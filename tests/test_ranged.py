@@ -0,0 +1,121 @@
+from __future__ import absolute_import
+
+import os
+import random
+import pytest
+
+from datafs._compat import u
+from datafs.core import ranged
+
+
+def test_ranged_reads(api, cache, tempdir):
+
+    api.attach_cache(cache)
+
+    arch = api.create('ranged/archive.bin')
+
+    rand = random.Random(0)
+    data = bytes(bytearray(rand.getrandbits(8) for _ in range(100000)))
+
+    p = os.path.join(tempdir, 'ranged.bin')
+
+    with open(p, 'wb+') as f:
+        f.write(data)
+
+    arch.update(p)
+
+    # uncached reads fetch ranges directly from the authority
+    with arch.open_ranged(block_size=1000) as f:
+        f.seek(50000)
+        assert f.read(10) == data[50000:50010]
+
+        f.seek(-5, os.SEEK_END)
+        assert f.read() == data[-5:]
+
+    assert not cache.fs.exists('.blocks')
+
+    arch.cache()
+
+    with arch.open_ranged(block_size=1000) as f:
+        for _ in range(20):
+            offset = rand.randrange(len(data))
+            size = rand.randrange(2000)
+
+            f.seek(offset)
+            assert f.read(size) == data[offset:offset + size]
+
+    block_path = ranged.get_block_cache_path(
+        arch.get_version_hash(), 'md5', 1000)
+
+    block_cache = ranged.BlockCache(
+        cache.fs, block_path, len(data), block_size=1000)
+
+    filled = block_cache.filled_blocks()
+    block_cache.close()
+
+    # only the blocks which were read are cached
+    assert 0 < filled < 100
+
+    # cached blocks are reused by later readers
+    with arch.open_ranged(block_size=1000) as f:
+        assert f.read() == data
+
+    # blocks cached with another block size are kept separately
+    with arch.open_ranged(block_size=1024) as f:
+        f.seek(30000)
+        assert f.read(5000) == data[30000:35000]
+
+        f.seek(0)
+        assert f.read() == data
+
+    arch.remove_from_cache()
+
+    assert not cache.fs.exists(block_path)
+
+
+def test_ranged_reads_from_cached_copy(api, cache, tempdir):
+
+    api.attach_cache(cache)
+
+    arch = api.create('ranged/cached.bin')
+
+    data = os.urandom(10000)
+
+    p = os.path.join(tempdir, 'ranged.bin')
+
+    with open(p, 'wb+') as f:
+        f.write(data)
+
+    arch.update(p, cache=True)
+
+    read_path = arch.get_storage_path()
+    assert cache.fs.getsize(read_path) == len(data)
+
+    # complete cached copies are read without touching the authority
+    arch.authority.fs.remove(read_path)
+
+    with arch.open_ranged(block_size=1000) as f:
+        f.seek(5000)
+        assert f.read(10) == data[5000:5010]
+
+    assert not cache.fs.exists('.blocks')
+
+
+def test_ranged_read_errors(api, tempdir):
+
+    arch = api.create('ranged/compressed.txt', compression='gzip')
+
+    with pytest.raises(ValueError):
+        with arch.open_ranged() as f:
+            pass
+
+    with arch.open('w+', bumpversion='patch') as f:
+        f.write(u('compressed'))
+
+    with pytest.raises(ValueError):
+        with arch.open_ranged() as f:
+            pass
+
+    with pytest.raises(ValueError):
+        with arch.open_ranged('r+') as f:
+            pass
@@ -158,3 +158,65 @@ def test_multi_api(api1, api2, auth1, cache1, cache2, opener):
 
     with pytest.raises(ResourceNotFoundError):
         api1.cache.fs.open('myArchive', 'r')
+
+
+@pytest.mark.remove_dir
+def test_batch_delete(api, auth1):
+
+    cache = TempFS()
+    api.attach_authority('auth1', auth1)
+    api.attach_cache(cache)
+
+    for i in range(3):
+        var = api.create(
+            'experiment/run{}'.format(i),
+            authority_name='auth1',
+            tags=['experiment'])
+
+        for j in range(2):
+            with var.open('w+') as f:
+                f.write(u('run {} version {}'.format(i, j)))
+
+        var.cache()
+
+    keep = api.create('keep', authority_name='auth1', versioned=False)
+
+    with keep.open('w+') as f:
+        f.write(u('keep this'))
+
+    other = api.create(
+        'experiment/other', authority_name='auth1', versioned=False)
+
+    with other.open('w+') as f:
+        f.write(u('keep this too'))
+
+    with pytest.raises(ValueError):
+        api.batch_delete()
+
+    with pytest.raises(ValueError):
+        api.batch_delete(['keep'], prefix='experiment/')
+
+    report = api.batch_delete(query=['experiment'], batch_size=2)
+
+    assert sorted(report['deleted']) == [
+        'experiment/run{}'.format(i) for i in range(3)]
+
+    # both versions are removed from the authority and the cache, whether
+    # or not they were cached
+    assert report['removed'] == 12
+    assert report['errors'] == []
+
+    for i in range(3):
+        with pytest.raises(KeyError):
+            api.get_archive('experiment/run{}'.format(i))
+
+    # directories which still hold other archives are kept
+    assert sorted(api.listdir('', authority_name='auth1')) == [
+        'experiment', 'keep']
+    assert api.listdir('experiment', authority_name='auth1') == ['other']
+    assert not api.cache.fs.exists('experiment/run0')
+
+    report = api.batch_delete(['keep', 'experiment/other', 'nonexistent'])
+
+    assert sorted(report['deleted']) == ['experiment/other', 'keep']
+    assert api.listdir('', authority_name='auth1') == []
@@ -0,0 +1,74 @@
+from __future__ import absolute_import
+
+import pytest
+
+from datafs._compat import u
+
+
+def test_replicate(api_dual_auth):
+
+    api = api_dual_auth
+
+    for i in range(3):
+        arch = api.create(
+            'replicate/archive{}.txt'.format(i), authority_name='auth1')
+
+        for j in range(2):
+            with arch.open('w+', bumpversion='patch') as f:
+                f.write(u('archive {} version {}'.format(i, j)))
+
+    other = api.create('replicate/other.txt', authority_name='auth2')
+
+    with other.open('w+', bumpversion='patch') as f:
+        f.write(u('already on auth2'))
+
+    with pytest.raises(ValueError):
+        api.replicate('auth1', 'auth1')
+
+    with pytest.raises(ValueError):
+        api.replicate('auth1', 'nonexistent')
+
+    progress = []
+
+    def callback(archive_name, error, completed, total):
+        progress.append((archive_name, error))
+
+    report = api.replicate(
+        'auth1', 'auth2', prefix='replicate/', callback=callback)
+
+    assert report['copied'] == 6
+    assert report['skipped'] == 0
+    assert report['bytes'] > 0
+    assert report['errors'] == {}
+    assert report['switched'] == []
+
+    assert progress == [
+        ('replicate/archive{}.txt'.format(i), None) for i in range(3)]
+
+    dst = api._authorities['auth2'].fs
+
+    for i in range(3):
+        arch = api.get_archive('replicate/archive{}.txt'.format(i))
+        assert arch.authority_name == 'auth1'
+
+        for version in arch.get_versions():
+            assert dst.isfile(arch.get_version_path(version))
+
+    # only missing or changed objects are copied again
+    arch = api.get_archive('replicate/archive0.txt')
+    dst.setcontents(arch.get_version_path(), b'changed')
+
+    report = api.replicate('auth1', 'auth2', switch=True)
+
+    assert report['copied'] == 1
+    assert report['skipped'] == 5
+    assert sorted(report['switched']) == [
+        'replicate/archive{}.txt'.format(i) for i in range(3)]
+
+    arch = api.get_archive('replicate/archive0.txt')
+    assert arch.authority_name == 'auth2'
+
+    api._authorities['auth1'].fs.remove(arch.get_version_path())
+
+    with arch.open('r') as f:
+        assert f.read() == u('archive 0 version 1')
@@ -0,0 +1,447 @@
+from __future__ import absolute_import
+
+import os
+import moto
+import pytest
+import hashlib
+import threading
+
+from fs.osfs import OSFS
+from fs.s3fs import S3FS
+from fs.memoryfs import MemoryFS
+
+from datafs import DataAPI
+from datafs.core import ranged
+from datafs.services import transfer
+from datafs.services.lazy import LazyFS
+
+
+@pytest.fixture
+def source(tempdir):
+
+    fp = os.path.join(tempdir, 'source.bin')
+
+    with open(fp, 'wb+') as f:
+        f.write(os.urandom(3 * 1024 * 1024 + 17))
+
+    return fp
+
+
+def _read(fp):
+    with open(fp, 'rb') as f:
+        return f.read()
+
+
+@pytest.mark.parametrize('name,method', transfer.LOCAL_METHODS)
+def test_local_methods(source, tempdir, name, method):
+
+    dst = os.path.join(tempdir, name)
+
+    try:
+        method(source, dst)
+
+    except (IOError, OSError):
+        pytest.skip('{} not supported here'.format(name))
+
+    assert _read(dst) == _read(source)
+
+
+def test_copyfile(source, tempdir):
+
+    local = OSFS(tempdir)
+    mem = MemoryFS()
+
+    # local copies are done by the kernel
+    transfer.copyfile(local, 'source.bin', local, 'copy.bin')
+    assert _read(os.path.join(tempdir, 'copy.bin')) == _read(source)
+
+    # copies to and from other filesystems are streamed
+    transfer.copyfile(local, 'source.bin', mem, 'source.bin')
+    assert mem.getcontents('source.bin', 'rb') == _read(source)
+
+    transfer.copyfile(mem, 'source.bin', local, 'back.bin')
+    assert _read(os.path.join(tempdir, 'back.bin')) == _read(source)
+
+    transfer.movefile(local, 'copy.bin', local, 'moved.bin')
+    assert not local.exists('copy.bin')
+    assert _read(os.path.join(tempdir, 'moved.bin')) == _read(source)
+
+    transfer.movefile(local, 'moved.bin', mem, 'moved.bin')
+    assert not local.exists('moved.bin')
+    assert mem.getcontents('moved.bin', 'rb') == _read(source)
+
+    assert transfer.copy_local(
+        source, os.path.join(tempdir, 'link.bin'), hardlink=True) in (
+            'hardlink', 'reflink', 'copy_file_range', 'sendfile', 'stream')
+
+    mem.close()
+    local.close()
+
+
+@pytest.yield_fixture
+def s3():
+
+    m = moto.mock_s3()
+    m.start()
+
+    try:
+        s3 = S3FS(
+            'test-bucket',
+            aws_access_key='MY_KEY',
+            aws_secret_key='MY_SECRET_KEY')
+
+        yield s3
+        s3.close()
+
+    finally:
+        m.stop()
+
+
+def test_is_s3(s3, tempdir):
+
+    assert transfer._is_s3(s3)
+    assert not transfer._is_s3(OSFS(tempdir))
+
+    # lazy proxies are detected without creating the filesystem
+    lazy = LazyFS(lambda: S3FS, ['test-bucket'])
+
+    assert transfer._is_s3(lazy)
+    assert not lazy.connected
+
+    lazy = LazyFS(lambda: OSFS, [tempdir])
+
+    assert not transfer._is_s3(lazy)
+    assert not lazy.connected
+
+
+def test_remove_s3_files(s3, monkeypatch):
+
+    for path in [
+            'a/b/c/1.txt', 'a/b/d/2.txt', 'a/b/d/3.txt', 'e/f/4.txt',
+            'g/h/5.txt', 'g/i/6.txt']:
+        s3.makedir(os.path.dirname(path), recursive=True, allow_recreate=True)
+        s3.setcontents(path, b'data')
+
+    listed = []
+    bucket_list = s3._s3bukt.list
+
+    def counted_list(prefix='', *args, **kwargs):
+        listed.append(prefix)
+        return bucket_list(prefix, *args, **kwargs)
+
+    monkeypatch.setattr(s3._s3bukt, 'list', counted_list)
+
+    failed = transfer.remove_files(
+        s3, ['a/b/c/1.txt', 'a/b/d/2.txt', 'e/f/4.txt', 'g/h/5.txt'])
+
+    assert failed == {}
+
+    # the common directory of each group of files is listed once, and only
+    # directories emptied below it are listed on their own
+    assert sorted(listed) == sorted([
+        s3._s3path(d) + '/' for d in ['a/b', 'e/f', 'g/h', 'e', 'g']])
+
+    assert not s3.exists('a/b/c')
+    assert s3.isfile('a/b/d/3.txt')
+    assert not s3.exists('e')
+    assert not s3.exists('g/h')
+    assert s3.isfile('g/i/6.txt')
+
+
+def test_parallel_s3_transfers(s3, tempdir, monkeypatch):
+
+    part_size = transfer.MIN_PART_SIZE
+
+    api = DataAPI(username='My Name', contact='my.email@example.com')
+    api.attach_authority('s3', s3, part_size=part_size, threads=4)
+
+    assert transfer.get_options(s3)['part_size'] == part_size
+
+    p = os.path.join(tempdir, 'large.bin')
+    data = os.urandom(2 * part_size + 1024)
+
+    with open(p, 'wb+') as f:
+        f.write(data)
+
+    # fail the first attempt at each part to exercise per-part retries
+    failed = set()
+    read_range = ranged.read_range
+
+    def flaky_read_range(filesystem, path, offset, size):
+        if offset not in failed:
+            failed.add(offset)
+            raise IOError('connection reset')
+
+        return read_range(filesystem, path, offset, size)
+
+    api._authorities['s3'].upload(p, 'large.bin')
+
+    assert s3.getsize('large.bin') == len(data)
+
+    monkeypatch.setattr(ranged, 'read_range', flaky_read_range)
+
+    local = OSFS(tempdir)
+    transfer.copyfile(s3, 'large.bin', local, 'downloaded.bin')
+
+    assert len(failed) == 3
+    assert _read(os.path.join(tempdir, 'downloaded.bin')) == data
+
+    local.close()
+
+
+def test_resumable_download(s3, tempdir, monkeypatch):
+
+    part_size = transfer.MIN_PART_SIZE
+    transfer.set_options(s3, part_size=part_size, retries=0)
+
+    data = os.urandom(3 * part_size + 1024)
+    s3.setcontents('large.bin', data)
+
+    local = OSFS(tempdir)
+    dst = os.path.join(tempdir, 'large.bin')
+    partial = dst + transfer.PARTIAL_SUFFIX
+    checkpoint = partial + transfer.CHECKPOINT_SUFFIX
+
+    read_range = ranged.read_range
+    reads = []
+
+    def dropped_read_range(filesystem, path, offset, size):
+        if offset == part_size:
+            raise IOError('connection dropped')
+
+        return read_range(filesystem, path, offset, size)
+
+    def counted_read_range(filesystem, path, offset, size):
+        reads.append(offset)
+        return read_range(filesystem, path, offset, size)
+
+    monkeypatch.setattr(ranged, 'read_range', dropped_read_range)
+
+    with pytest.raises(IOError):
+        transfer.copyfile(s3, 'large.bin', local, 'large.bin')
+
+    # progress is kept next to the target, which is not created
+    assert not os.path.exists(dst)
+    assert os.path.isfile(partial)
+    assert os.path.isfile(checkpoint)
+
+    # damage a completed part on disk
+    with open(partial, 'r+b') as f:
+        f.seek(10)
+        f.write(b'x')
+
+    monkeypatch.setattr(ranged, 'read_range', counted_read_range)
+
+    transfer.copyfile(s3, 'large.bin', local, 'large.bin')
+
+    # only the failed and damaged parts are fetched again
+    assert sorted(reads) == [0, part_size]
+    assert _read(dst) == data
+    assert not os.path.exists(partial)
+    assert not os.path.exists(checkpoint)
+
+    # copies which fail verification are discarded
+    with pytest.raises(IOError):
+        transfer.copyfile(
+            s3, 'large.bin', local, 'rejected.bin', verify=lambda f: False)
+
+    assert not os.path.exists(os.path.join(tempdir, 'rejected.bin'))
+    assert not os.path.exists(
+        os.path.join(tempdir, 'rejected.bin') + transfer.PARTIAL_SUFFIX)
+
+    local.close()
+
+
+def test_resumable_upload(s3, tempdir, monkeypatch):
+
+    from boto.s3.multipart import MultiPartUpload
+
+    monkeypatch.setattr(
+        transfer, 'CHECKPOINT_DIR', os.path.join(tempdir, 'checkpoints'))
+
+    part_size = transfer.MIN_PART_SIZE
+
+    p = os.path.join(tempdir, 'large.bin')
+    data = os.urandom(3 * part_size + 1024)
+
+    with open(p, 'wb+') as f:
+        f.write(data)
+
+    upload_part = MultiPartUpload.upload_part_from_file
+    uploaded = []
+
+    def dropped_upload_part(self, fp, part_num, *args, **kwargs):
+        if part_num == 2:
+            raise IOError('connection dropped')
+
+        return upload_part(self, fp, part_num, *args, **kwargs)
+
+    def counted_upload_part(self, fp, part_num, *args, **kwargs):
+        uploaded.append(part_num)
+        return upload_part(self, fp, part_num, *args, **kwargs)
+
+    monkeypatch.setattr(
+        MultiPartUpload, 'upload_part_from_file', dropped_upload_part)
+
+    with pytest.raises(IOError):
+        transfer.upload_multipart(
+            p, s3, 'large.bin', part_size=part_size, retries=0)
+
+    assert not s3.exists('large.bin')
+    assert len(os.listdir(transfer.CHECKPOINT_DIR)) == 1
+
+    monkeypatch.setattr(
+        MultiPartUpload, 'upload_part_from_file', counted_upload_part)
+
+    # resume from a copy of the file, as open() and get_local_path() upload
+    # from a new temporary directory each time
+    copy = os.path.join(tempdir, 'copy', 'large.bin')
+    os.makedirs(os.path.dirname(copy))
+
+    with open(copy, 'wb+') as f:
+        f.write(data)
+
+    transfer.upload_multipart(copy, s3, 'large.bin', part_size=part_size)
+
+    # the upload is resumed rather than restarted
+    assert uploaded == [2]
+    assert s3.getcontents('large.bin', 'rb') == data
+    assert len(os.listdir(transfer.CHECKPOINT_DIR)) == 0
+
+
+def test_resumable_upload_encrypted(s3, tempdir, monkeypatch):
+
+    from boto.s3.multipart import MultiPartUpload
+
+    monkeypatch.setattr(
+        transfer, 'CHECKPOINT_DIR', os.path.join(tempdir, 'checkpoints'))
+
+    part_size = transfer.MIN_PART_SIZE
+
+    p = os.path.join(tempdir, 'large.bin')
+    data = os.urandom(2 * part_size + 1024)
+
+    with open(p, 'wb+') as f:
+        f.write(data)
+
+    # part ETags on SSE-KMS and SSE-C buckets are not MD5 digests
+    def encrypted_etag(etag):
+        return hashlib.sha256(
+            etag.strip('"').encode('ascii')).hexdigest()[:32]
+
+    upload_part = MultiPartUpload.upload_part_from_file
+    get_uploaded_parts = transfer._get_uploaded_parts
+    uploaded = []
+
+    def encrypted_upload_part(self, fp, part_num, *args, **kwargs):
+        uploaded.append(part_num)
+
+        if part_num == 2 and len(uploaded) == 2:
+            raise IOError('connection dropped')
+
+        key = upload_part(self, fp, part_num, *args, **kwargs)
+        key.etag = '"{}"'.format(encrypted_etag(key.etag))
+
+        return key
+
+    def encrypted_uploaded_parts(*args):
+        parts = get_uploaded_parts(*args)
+
+        if parts is None:
+            return None
+
+        return {
+            part_num: encrypted_etag(etag)
+            for part_num, etag in parts.items()}
+
+    monkeypatch.setattr(
+        MultiPartUpload, 'upload_part_from_file', encrypted_upload_part)
+
+    monkeypatch.setattr(
+        transfer, '_get_uploaded_parts', encrypted_uploaded_parts)
+
+    with pytest.raises(IOError):
+        transfer.upload_multipart(
+            p, s3, 'large.bin', part_size=part_size, threads=1, retries=0)
+
+    del uploaded[:]
+
+    # stored parts are matched with the ETags recorded in the checkpoint
+    transfer.upload_multipart(p, s3, 'large.bin', part_size=part_size)
+
+    assert uploaded == [2]
+    assert s3.getcontents('large.bin', 'rb') == data
+    assert len(os.listdir(transfer.CHECKPOINT_DIR)) == 0
+
+
+def test_concurrent_checkpoints(tempdir):
+
+    path = os.path.join(tempdir, 'transfer.checkpoint')
+
+    def add_parts(checkpoint):
+        for part_num in range(1, 51):
+            checkpoint.add_part(part_num, 'digest', 'etag')
+
+    # transfers sharing a checkpoint path never write to the same
+    # temporary file
+    workers = [
+        threading.Thread(
+            target=add_parts,
+            args=(transfer._Checkpoint(path, {'key': 'large.bin'}),))
+        for _ in range(4)]
+
+    for worker in workers:
+        worker.start()
+
+    for worker in workers:
+        worker.join()
+
+    assert os.listdir(tempdir) == ['transfer.checkpoint']
+
+    checkpoint = transfer._Checkpoint(path, {'key': 'large.bin'})
+
+    assert checkpoint.get_part(50) == 'digest'
+    assert checkpoint.get_etag(50) == 'etag'
+
+
+def test_resume_aborted_upload(s3, tempdir, monkeypatch):
+
+    from boto.s3.multipart import MultiPartUpload
+
+    monkeypatch.setattr(
+        transfer, 'CHECKPOINT_DIR', os.path.join(tempdir, 'checkpoints'))
+
+    part_size = transfer.MIN_PART_SIZE
+
+    p = os.path.join(tempdir, 'large.bin')
+    data = os.urandom(2 * part_size + 1024)
+
+    with open(p, 'wb+') as f:
+        f.write(data)
+
+    upload_part = MultiPartUpload.upload_part_from_file
+
+    def dropped_upload_part(self, fp, part_num, *args, **kwargs):
+        if part_num == 2:
+            raise IOError('connection dropped')
+
+        return upload_part(self, fp, part_num, *args, **kwargs)
+
+    monkeypatch.setattr(
+        MultiPartUpload, 'upload_part_from_file', dropped_upload_part)
+
+    with pytest.raises(IOError):
+        transfer.upload_multipart(
+            p, s3, 'large.bin', part_size=part_size, retries=0)
+
+    # the open upload is removed, e.g. by a lifecycle rule
+    for upload in s3._s3bukt.get_all_multipart_uploads():
+        upload.cancel_upload()
+
+    monkeypatch.setattr(
+        MultiPartUpload, 'upload_part_from_file', upload_part)
+
+    transfer.upload_multipart(p, s3, 'large.bin', part_size=part_size)
+
+    assert s3.getcontents('large.bin', 'rb') == data
+    assert len(os.listdir(transfer.CHECKPOINT_DIR)) == 0
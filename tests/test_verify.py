@@ -0,0 +1,133 @@
+from __future__ import absolute_import
+
+import os
+import pytest
+
+from datafs._compat import u
+from datafs.core import verify
+
+
+@pytest.fixture
+def verify_archives(api, tempdir):
+
+    archives = {}
+
+    for name in ['good', 'corrupt', 'missing']:
+        arch = api.create('verify/{}.txt'.format(name))
+
+        for i in range(2):
+            with arch.open('w+', bumpversion='patch') as f:
+                f.write(u('{} version {}'.format(name, i)))
+
+        archives[name] = arch
+
+    authority = archives['good'].authority
+
+    authority.fs.setcontents(
+        archives['corrupt'].get_version_path(), b'corrupt versioX 1')
+
+    authority.fs.remove(archives['missing'].get_version_path('0.0.1'))
+    authority.fs.setcontents('verify/orphan.txt', b'orphaned')
+
+    return archives
+
+
+def test_verify(api, verify_archives):
+
+    report = api.verify(prefix='verify/')
+
+    assert report['checked'] == 6
+    assert report['errors'] == []
+
+    assert [(p['archive_name'], p['version']) for p in report['missing']] == [
+        ('verify/missing.txt', '0.0.1')]
+
+    assert [(p['archive_name'], p['version']) for p in report['corrupt']] == [
+        ('verify/corrupt.txt', '0.0.2')]
+
+    assert 'checksum' in report['corrupt'][0]['reason']
+
+    assert [p['path'] for p in report['orphaned']] == ['verify/orphan.txt']
+
+    # quick checks use the recorded sizes without reading the data
+    verify_archives['good'].authority.fs.setcontents(
+        verify_archives['good'].get_version_path(), b'truncated')
+
+    report = api.verify(prefix='verify/good', quick=True, orphans=False)
+
+    assert [p['reason'] for p in report['corrupt']] == [
+        'size 9 != 14']
+
+
+def test_verify_cache(api, cache, verify_archives):
+
+    api.attach_cache(cache)
+
+    with pytest.raises(ValueError):
+        api.verify(authority_name='nonexistent')
+
+    verify_archives['good'].cache()
+
+    api.cache.fs.setcontents(
+        verify_archives['good'].get_version_path(), b'corrupted cache')
+
+    report = api.verify(prefix='verify/', cache=True)
+
+    corrupt = sorted(
+        (p['service'], p['archive_name']) for p in report['corrupt'])
+
+    assert corrupt == [
+        ('cache', 'verify/good.txt'),
+        ('filesys', 'verify/corrupt.txt')]
+
+    # uncached versions are not reported missing from the cache
+    assert [p['service'] for p in report['missing']] == ['filesys']
+
+
+def test_verify_checkpoint(api, verify_archives, tempdir):
+
+    checkpoint = os.path.join(tempdir, 'verify.checkpoint')
+    expected = api.verify(prefix='verify/')
+
+    def interrupt(checked, total):
+        raise KeyboardInterrupt
+
+    with pytest.raises(KeyboardInterrupt):
+        api.verify(
+            prefix='verify/',
+            checkpoint=checkpoint,
+            batch_size=1,
+            callback=interrupt)
+
+    assert os.path.isfile(checkpoint)
+
+    report = api.verify(prefix='verify/', checkpoint=checkpoint)
+
+    assert report == expected
+    assert not os.path.exists(checkpoint)
+
+    with pytest.raises(ValueError):
+        with open(checkpoint, 'w+') as f:
+            f.write(u('{"options": {}}'))
+
+        api.verify(prefix='verify/', checkpoint=checkpoint)
+
+
+def test_get_objects(api):
+
+    api.content_addressed = True
+
+    arch = api.create('verify/blobs.txt')
+
+    with arch.open('w+', bumpversion='patch') as f:
+        f.write(u('stored as a blob'))
+
+    history = arch.get_history()
+
+    objects = verify.get_objects(arch, history)
+
+    assert [obj['path'] for obj in objects] == [history[0]['path']]
+    assert objects[0]['checksum'] == history[0]['checksum']
+
+    # shared blobs can be left out, e.g. when deleting an archive
+    assert verify.get_objects(arch, history, blobs=False) == []
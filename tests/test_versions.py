@@ -1,5 +1,7 @@
 
 from datafs._compat import u
+from datafs.core import data_archive
+from datafs.core.versions import BumpableVersion, VersionIndex
 from fs.errors import (ResourceNotFoundError, NoMetaError)
 import pytest
 
@@ -64,6 +66,113 @@ def test_version_tracking(api1, auth1, opener):
     assert 'not found in archive history' in str(excinfo.value)
 
 
+def test_version_index():
+
+    history = [
+        {'version': '0.0.1a1', 'checksum': 'a'},
+        {'version': '0.0.1', 'checksum': 'b'},
+        {'version': '0.2', 'checksum': 'c'},
+        {'version': '0.1.3', 'checksum': 'd'},
+        {'version': '0.0.1', 'checksum': 'b', 'dependencies': {'x': None}}]
+
+    index = VersionIndex(history)
+
+    assert len(index) == 4
+    assert index.versions == sorted(
+        BumpableVersion(r['version']) for r in history[:4])
+
+    assert index.latest == '0.2'
+    assert index.latest_record['checksum'] == 'c'
+
+    # later records of a version replace earlier ones
+    assert index.get_record('0.0.1')['dependencies'] == {'x': None}
+    assert index.get_record(BumpableVersion('0.2.0'))['checksum'] == 'c'
+    assert index.get_name('0.2.0') == '0.2'
+    assert index.get_record('1.0') is None
+    assert index.get_record('not a version') is None
+
+    # returned versions are copies
+    index.latest.bump('major')
+    assert index.latest == '0.2'
+
+    unversioned = VersionIndex(
+        [{'version': 'None', 'checksum': 'a'},
+            {'version': 'None', 'checksum': 'b'}],
+        versioned=False)
+
+    assert unversioned.versions == [None]
+    assert unversioned.latest is None
+    assert unversioned.get_record(None)['checksum'] == 'b'
+
+    assert VersionIndex([]).latest_record is None
+
+
+def test_version_index_cache(api1, auth1, monkeypatch):
+
+    api1.attach_authority('auth', auth1)
+
+    archive = api1.create('cached_index')
+
+    with archive.open('w+', bumpversion='patch') as f:
+        f.write(u('version 0.0.1'))
+
+    with archive.open('w+', bumpversion='minor') as f:
+        f.write(u('version 0.1'))
+
+    get_version_history = api1.manager.get_version_history
+    fetched = []
+    built = []
+
+    def counted_get_version_history(archive_name):
+        fetched.append(archive_name)
+        return get_version_history(archive_name)
+
+    class CountedVersionIndex(VersionIndex):
+        def __init__(self, history, versioned=True):
+            built.append(len(history))
+            super(CountedVersionIndex, self).__init__(history, versioned)
+
+    monkeypatch.setattr(
+        api1.manager, 'get_version_history', counted_get_version_history)
+
+    monkeypatch.setattr(data_archive, 'VersionIndex', CountedVersionIndex)
+
+    assert archive.get_latest_version() == '0.1'
+
+    del fetched[:]
+    del built[:]
+
+    # lookups fetch the history but reuse the index while it is unchanged
+    assert archive.get_versions() == ['0.0.1', '0.1']
+    assert archive.get_version_hash('0.0.1') is not None
+    assert archive.get_dependencies('0.1') is not None
+    assert len(fetched) >= 3
+    assert built == []
+
+    archive.update_metadata({'description': 'unchanged history'})
+
+    with archive.open('w+', bumpversion='major') as f:
+        f.write(u('version 1.0'))
+
+    assert archive.get_latest_version() == '1.0'
+
+    # versions written elsewhere are seen by the next lookup
+    other = api1.get_archive('cached_index')
+
+    with other.open('w+', bumpversion='patch') as f:
+        f.write(u('version 1.0.1'))
+
+    del built[:]
+
+    assert archive.get_latest_version() == '1.0.1'
+    assert built == [4]
+
+    with archive.open('r') as f:
+        assert u(f.read()) == u('version 1.0.1')
+
+    assert built == [4]
+
+
 def test_versioned_fs_functions(api1, auth2, opener):
 
     api1.attach_authority('auth', auth2)